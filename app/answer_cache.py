@@ -0,0 +1,208 @@
+# app/answer_cache.py
+"""
+Semantischer Antwort-Cache vor dem LLM.
+
+Ein Eintrag gilt für denselben "Bucket" – Freigabe der Rolle (Quellenmenge),
+gefundene Chunks und Modus – und eine ähnliche Frage (Cosinus der Frage-Embeddings
+>= RAG_ANSWER_CACHE_SIM). Gespeichert wird die rohe LLM-Antwort (vor Maskierung);
+Maskierung und Audit laufen bei Treffern unverändert.
+
+Einträge verfallen per TTL und LRU und gelten nur für den Indexstand, unter dem sie
+entstanden sind. Backend: RAG_ANSWER_CACHE = off (Standard) | memory | sqlite.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_PATH = Path("data/answer_cache.sqlite")
+
+
+def _backend() -> str:
+    return os.getenv("RAG_ANSWER_CACHE", "off").lower()
+
+
+def _ttl() -> float:
+    return float(os.getenv("RAG_ANSWER_CACHE_TTL_S", "3600"))
+
+
+def _maxsize() -> int:
+    return int(os.getenv("RAG_ANSWER_CACHE_SIZE", "512"))
+
+
+def _threshold() -> float:
+    return float(os.getenv("RAG_ANSWER_CACHE_SIM", "0.95"))
+
+
+def bucket_key(allowed_sources: Sequence[str], chunks: Sequence[Tuple[str, int]], mode: str) -> str:
+    """Exakter Teil des Schlüssels: Rollen-Freigabe, Treffer (in Reihenfolge) und Modus."""
+    raw = json.dumps([sorted(allowed_sources), [list(c) for c in chunks], mode], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _question_key(q_emb: np.ndarray) -> str:
+    return hashlib.sha256(np.asarray(q_emb, dtype="<f4").tobytes()).hexdigest()
+
+
+def _best(q_emb: np.ndarray, candidates: List[Tuple[str, np.ndarray]], threshold: float) -> Optional[str]:
+    """Schlüssel des ähnlichsten Kandidaten (Embeddings L2-normalisiert) oder None."""
+    if not candidates:
+        return None
+    sims = np.stack([emb for _, emb in candidates]) @ np.asarray(q_emb, dtype="float32").ravel()
+    best = int(np.argmax(sims))
+    return candidates[best][0] if sims[best] >= threshold else None
+
+
+class MemoryAnswerCache:
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize, self.ttl, self.threshold = maxsize, ttl, threshold
+        self.generation: Optional[int] = None
+        # (bucket, frage) -> (Embedding, Antwort, Zeitstempel); Reihenfolge = LRU
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, str, float]]" = OrderedDict()
+        self._buckets: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_generation(self, generation: int) -> None:
+        if generation != self.generation:
+            self._entries.clear()
+            self._buckets.clear()
+            self.generation = generation
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+        keys = self._buckets.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._buckets[key[0]]
+
+    def lookup(self, bucket: str, q_emb: np.ndarray, generation: int) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            self._check_generation(generation)
+            for key in list(self._buckets.get(bucket, ())):
+                if now - self._entries[key][2] > self.ttl:
+                    self._drop(key)
+            candidates = [(key[1], self._entries[key][0]) for key in self._buckets.get(bucket, ())]
+            match = _best(q_emb, candidates, self.threshold)
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((bucket, match))
+            self.hits += 1
+            return self._entries[(bucket, match)][1]
+
+    def store(self, bucket: str, q_emb: np.ndarray, generation: int, answer: str) -> None:
+        key = (bucket, _question_key(q_emb))
+        with self._lock:
+            self._check_generation(generation)
+            self._entries[key] = (np.asarray(q_emb, dtype="float32").ravel(), answer, time.time())
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(bucket, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"backend": "memory", "size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    bucket     TEXT NOT NULL,
+    question   TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    emb        BLOB NOT NULL,
+    answer     TEXT NOT NULL,
+    created    REAL NOT NULL,
+    last_used  REAL NOT NULL,
+    PRIMARY KEY (bucket, question)
+)
+"""
+
+
+class SqliteAnswerCache:
+    """Wie MemoryAnswerCache, aber in einer lokalen SQLite-Datei (überlebt Neustarts, von Workern geteilt)."""
+
+    def __init__(self, path: Path, maxsize: int, ttl: float, threshold: float):
+        self.maxsize, self.ttl, self.threshold = maxsize, ttl, threshold
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, bucket: str, q_emb: np.ndarray, generation: int) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT question, emb, answer FROM answers WHERE bucket = ? AND generation = ? AND created >= ?",
+                (bucket, generation, now - self.ttl),
+            ).fetchall()
+            answers = {q: a for q, _, a in rows}
+            match = _best(q_emb, [(q, np.frombuffer(e, dtype="<f4")) for q, e, _ in rows], self.threshold)
+            if match is None:
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE answers SET last_used = ? WHERE bucket = ? AND question = ?",
+                                  (now, bucket, match))
+            self.hits += 1
+            return answers[match]
+
+    def store(self, bucket: str, q_emb: np.ndarray, generation: int, answer: str) -> None:
+        now = time.time()
+        emb = np.asarray(q_emb, dtype="<f4").ravel()
+        with self._lock, self.conn:
+            # andere Indexstände und abgelaufene Einträge entfernen, danach LRU-Grenze
+            self.conn.execute("DELETE FROM answers WHERE generation != ? OR created < ?", (generation, now - self.ttl))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bucket, _question_key(emb), generation, emb.tobytes(), answer, now, now),
+            )
+            self.conn.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {"backend": "sqlite", "size": size, "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Konfigurierter Cache oder None (RAG_ANSWER_CACHE=off)."""
+    global _cache
+    backend = _backend()
+    if backend not in ("memory", "sqlite"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if backend == "sqlite":
+                    path = Path(os.getenv("RAG_ANSWER_CACHE_PATH", str(DEFAULT_PATH)))
+                    _cache = SqliteAnswerCache(path, _maxsize(), _ttl(), _threshold())
+                else:
+                    _cache = MemoryAnswerCache(_maxsize(), _ttl(), _threshold())
+    return _cache
+
+
+def stats() -> Optional[Dict]:
+    cache = get_cache()
+    return cache.stats() if cache is not None else None
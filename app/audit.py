@@ -0,0 +1,394 @@
+# app/audit.py
+"""
+Audit-Log im Hintergrund schreiben (logs/audit.log, eine JSON-Zeile je Eintrag).
+
+- write() legt den Eintrag nur in eine Warteschlange; ein Writer-Thread je Prozess
+  schreibt gesammelt (Group Commit): sobald RAG_AUDIT_FLUSH_N Einträge da sind oder
+  der älteste RAG_AUDIT_FLUSH_MS wartet – ein write() und ggf. ein fsync je Gruppe.
+- RAG_AUDIT_FSYNC: "batch" (fsync je Gruppe, Standard), "always" (write() kehrt erst
+  zurück, wenn der Eintrag auf der Platte ist) oder "off" (Betriebssystem entscheidet).
+- Mehrere Prozesse (uvicorn --workers, Batch-CLI) schreiben in dieselbe Datei: jede
+  Gruppe wird unter einer exklusiven Dateisperre (audit.log.lock) angehängt, Zeilen
+  verschiedener Prozesse vermischen sich daher nie. Ohne fcntl (Windows) entfällt die
+  Sperre; dann darf nur ein Prozess in die Datei schreiben.
+- Rotation unter derselben Sperre nach Größe (RAG_AUDIT_MAX_MB) oder Alter
+  (RAG_AUDIT_ROTATE_S): audit.log -> audit-<Zeitstempel>.log.gz. Andere Prozesse
+  merken am geänderten Inode, dass sie die Datei neu öffnen müssen.
+- Beim Beenden (Lifespan, atexit) wird die Warteschlange vollständig geschrieben.
+- Schlägt ein Schreiben fehl (OSError), bleibt die Gruppe erhalten und wird mit
+  wachsendem Abstand (bis 5 s) erneut geschrieben; die Warteschlange bremst solange
+  die Aufrufer. Bei fsync=always löst write() den Fehler aus, flush() liefert False.
+"""
+import atexit
+import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: keine Dateisperre, nur ein schreibender Prozess
+    fcntl = None
+
+_STOP = object()
+_RETRY_MAX_S = 5.0
+_CLOSE_ATTEMPTS = 3
+
+
+def _flush_n() -> int:
+    return max(1, int(os.getenv("RAG_AUDIT_FLUSH_N", "100")))
+
+
+def _flush_ms() -> float:
+    return float(os.getenv("RAG_AUDIT_FLUSH_MS", "200"))
+
+
+def _fsync_policy() -> str:
+    policy = os.getenv("RAG_AUDIT_FSYNC", "batch").lower()
+    return policy if policy in ("off", "batch", "always") else "batch"
+
+
+def _max_bytes() -> int:
+    """Rotationsgrenze in Bytes (0 = keine Größenrotation)."""
+    return int(float(os.getenv("RAG_AUDIT_MAX_MB", "100")) * 1024 * 1024)
+
+
+def _rotate_s() -> float:
+    """Rotation nach Alter der Datei in Sekunden (0 = aus)."""
+    return float(os.getenv("RAG_AUDIT_ROTATE_S", "0"))
+
+
+def _keep() -> int:
+    """Anzahl aufbewahrter rotierter Dateien (0 = alle)."""
+    return int(os.getenv("RAG_AUDIT_KEEP", "0"))
+
+
+def _queue_max() -> int:
+    return int(os.getenv("RAG_AUDIT_QUEUE_MAX", "10000"))
+
+
+class AuditWriter:
+    """Warteschlange + Writer-Thread für eine Audit-Datei."""
+
+    def __init__(self, path: str, flush_n: Optional[int] = None, flush_ms: Optional[float] = None,
+                 fsync: Optional[str] = None, max_bytes: Optional[int] = None,
+                 rotate_s: Optional[float] = None, keep: Optional[int] = None):
+        self.path = path
+        self.flush_n = flush_n or _flush_n()
+        self.fsync = fsync or _fsync_policy()
+        # bei "always" wartet der Aufrufer: nicht auf weitere Einträge warten, nur mitnehmen, was ansteht
+        self.flush_s = 0.0 if self.fsync == "always" else (_flush_ms() if flush_ms is None else flush_ms) / 1000
+        self.max_bytes = _max_bytes() if max_bytes is None else max_bytes
+        self.rotate_s = _rotate_s() if rotate_s is None else rotate_s
+        self.keep = _keep() if keep is None else keep
+        # voll -> write() blockiert (Gegendruck statt verlorener Einträge)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=_queue_max())
+        self._fd: Optional[int] = None
+        self._created = 0.0  # Zeitpunkt des ersten Eintrags der offenen Datei
+        self._lock_fd: Optional[int] = None
+        self._closed = False
+        self._durable = threading.Condition()
+        self._seq_in = 0  # vergebene Laufnummern (für fsync=always)
+        self._seq_out = 0  # geschriebene Laufnummern
+        self._failed_upto = 0  # höchste Laufnummer der zuletzt fehlgeschlagenen Gruppe
+        self._error: Optional[OSError] = None
+        self._retry: List = []  # fehlgeschlagene Gruppe, wird vor neuen Einträgen geschrieben
+        self._backoff = 0.0
+        self._seq_lock = threading.Lock()
+        self.written = 0
+        self.flushes = 0
+        self.rotations = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- Produzenten ----------
+
+    def write(self, entry: Dict) -> None:
+        """Eintrag einreihen; bei fsync=always erst zurückkehren, wenn er auf der Platte ist."""
+        if self._closed:
+            raise RuntimeError("AuditWriter ist geschlossen.")
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._seq_lock:
+            self._seq_in += 1
+            seq = self._seq_in
+            self._queue.put((seq, line))
+        if self.fsync == "always":
+            if not self._wait(seq):
+                # bleibt eingereiht und wird erneut geschrieben; der Aufrufer erfährt es trotzdem
+                raise OSError(f"Audit-Eintrag nicht geschrieben: {self._error}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wartet, bis alles bisher Eingereihte geschrieben ist; False bei Fehler oder Timeout."""
+        with self._seq_lock:
+            seq = self._seq_in
+        return self._wait(seq, timeout)
+
+    def _wait(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """Bis seq geschrieben oder fehlgeschlagen ist; True nur, wenn geschrieben."""
+        with self._durable:
+            self._durable.wait_for(lambda: self._seq_out >= seq or self._failed_upto >= seq
+                                   or not self._thread.is_alive(), timeout)
+            return self._seq_out >= seq
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Restliche Einträge schreiben, fsync, Thread beenden."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "flushes": self.flushes,
+                "rotations": self.rotations, "errors": self.errors, "fsync": self.fsync}
+
+    # ---------- Writer-Thread ----------
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            group, self._retry = self._retry, []
+            if group:
+                time.sleep(self._backoff)
+            else:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                group = [item]
+            deadline = time.monotonic() + self.flush_s
+            while len(group) < self.flush_n:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                group.append(item)
+            self._commit(group)
+        # alles, was nach dem Stopp-Signal noch eingereiht wurde (plus eine offene Wiederholung)
+        rest, self._retry = self._retry, []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rest.append(item)
+        for attempt in range(_CLOSE_ATTEMPTS):
+            if not rest:
+                break
+            if attempt:
+                time.sleep(self._backoff)
+            self._commit(rest)
+            rest, self._retry = self._retry, []
+        if rest:
+            print(f"[WARN] Audit-Log: {len(rest)} Einträge beim Beenden nicht geschrieben: {self._error}")
+        if self._fd is not None:
+            if self.fsync != "off":
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        with self._durable:
+            self._durable.notify_all()
+
+    def _commit(self, group: List) -> None:
+        data = "".join(line for _, line in group).encode("utf-8")
+        rotated = None
+        try:
+            with self._locked():
+                self._ensure_open()
+                if self._needs_rotation():
+                    rotated = self._rotate()
+                    self._ensure_open()
+                if self._created == 0.0:
+                    self._created = time.time()
+                start = os.fstat(self._fd).st_size
+                try:
+                    view = memoryview(data)
+                    while view:  # os.write darf kürzer schreiben
+                        view = view[os.write(self._fd, view):]
+                    if self.fsync != "off":
+                        os.fsync(self._fd)
+                except OSError:
+                    # keine halbe Gruppe stehen lassen: die Wiederholung schreibt sie vollständig
+                    try:
+                        os.ftruncate(self._fd, start)
+                    except OSError:
+                        pass
+                    raise
+            self.written += len(group)
+            self.flushes += 1
+        except OSError as e:
+            # nichts als geschrieben melden; die Gruppe wird (mit neuen Einträgen) wiederholt
+            self.errors += 1
+            self._backoff = min(_RETRY_MAX_S, self._backoff * 2 or 0.1)
+            print(f"[WARN] Audit-Log konnte nicht geschrieben werden ({len(group)} Einträge, "
+                  f"neuer Versuch in {self._backoff:.1f} s): {e}")
+            self._retry = group
+            with self._durable:
+                self._error = e
+                self._failed_upto = group[-1][0]
+                self._durable.notify_all()
+            return
+        self._backoff = 0.0
+        with self._durable:
+            self._seq_out = group[-1][0]
+            self._durable.notify_all()
+        if rotated:
+            self._compress(rotated)
+
+    def _locked(self):
+        """Exklusive Sperre über alle Prozesse (eigene Lock-Datei, deren Inode sich nie ändert)."""
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        return _FileLock(self._lock_fd)
+
+    def _ensure_open(self) -> None:
+        """Öffnet die Datei (neu), falls ein anderer Prozess inzwischen rotiert hat."""
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+            self._fd = None
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        self._created = self._first_ts() if os.fstat(self._fd).st_size else 0.0
+
+    def _first_ts(self) -> float:
+        """Alter einer vorhandenen Datei: Zeitstempel der ersten Zeile (sonst mtime)."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                ts = json.loads(f.readline())["ts"]
+            return datetime.datetime.fromisoformat(ts).timestamp()
+        except (OSError, ValueError, KeyError, TypeError):
+            return os.fstat(self._fd).st_mtime
+
+    def _needs_rotation(self) -> bool:
+        size = os.fstat(self._fd).st_size
+        if not size:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        return bool(self.rotate_s) and time.time() - self._created >= self.rotate_s
+
+    def _rotate(self) -> str:
+        """Benennt die aktuelle Datei um (unter der Sperre); komprimiert wird danach."""
+        if self.fsync != "off":
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        target = f"{base}-{stamp}{ext}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{base}-{stamp}-{n}{ext}"
+            n += 1
+        os.rename(self.path, target)
+        self.rotations += 1
+        return target
+
+    def _compress(self, path: str) -> None:
+        """gzip der rotierten Datei (außerhalb der Sperre: niemand schreibt mehr hinein)."""
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+            print(f"[INFO] Audit-Log rotiert: {os.path.basename(path)}.gz")
+        except OSError as e:
+            print(f"[WARN] Rotiertes Audit-Log nicht komprimiert ({path}): {e}")
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.keep <= 0:
+            return
+        directory = os.path.dirname(self.path) or "."
+        base = os.path.splitext(os.path.basename(self.path))[0] + "-"
+        rotated = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                         if f.startswith(base) and f.endswith(".gz"))  # Zeitstempel im Namen -> chronologisch
+        for path in rotated[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class _FileLock:
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+# ---------- Modulweite Writer (einer je Datei und Prozess) ----------
+
+_writers: Dict[str, AuditWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def _enabled() -> bool:
+    return os.getenv("RAG_AUDIT_ASYNC", "1").lower() in ("1", "true", "yes")
+
+
+def get_writer(path: str) -> AuditWriter:
+    path = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None or writer._closed:
+            writer = _writers[path] = AuditWriter(path)
+        return writer
+
+
+def write(path: str, entry: Dict) -> None:
+    """Eintrag mit Zeitstempel anhängen (Zeitpunkt des Aufrufs, nicht des Schreibens)."""
+    entry = {"ts": datetime.datetime.now().isoformat(), **entry}
+    if _enabled():
+        get_writer(path).write(entry)
+        return
+    # RAG_AUDIT_ASYNC=0: synchron wie früher, aber ebenfalls unter der Dateisperre
+    lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        with _FileLock(lock_fd), open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    finally:
+        os.close(lock_fd)
+
+
+def flush(timeout: Optional[float] = None) -> None:
+    for writer in list(_writers.values()):
+        writer.flush(timeout)
+
+
+def close() -> None:
+    """Alle Writer leeren und schließen (Lifespan-Ende, atexit)."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def stats() -> Dict:
+    return {os.path.basename(path): w.stats() for path, w in _writers.items()}
+
+
+atexit.register(close)
@@ -0,0 +1,290 @@
+# app/audit_store.py
+"""
+Durchsuchbarer Audit-Speicher (SQLite) neben dem JSON-Lines-Audit-Log.
+
+Das Log (logs/audit.log und rotierte logs/audit-*.log.gz) bleibt die Quelle; die
+Datenbank (RAG_AUDIT_DB, Standard logs/audit.sqlite) wird daraus inkrementell
+befüllt: von audit.log wird nur gelesen, was seit dem letzten Mal dazugekommen ist
+(Offset + Inode), rotierte Dateien einmal. Der Schlüssel eines Eintrags ist ein Hash
+der Zeile – dieselbe Zeile aus audit.log und später aus der rotierten .gz wird daher
+nur einmal übernommen, auch wenn mehrere Worker gleichzeitig synchronisieren.
+
+Indizes für die typischen Compliance-Fragen ("alle Fragen von Rolle X zu
+Auszahlung.md in der letzten Woche"):
+  entries(ts, key), entries(user_role, ts, key)
+  entry_docs(document, ts), entry_docs(document, user_role, ts)   – ein Eintrag je Dokument
+Seiten werden per Keyset (ts, key) geblättert, nicht per OFFSET: jede Seite kostet
+gleich viel, egal wie weit hinten sie liegt.
+
+Nachträglich befüllen (z. B. nach dem Update oder aus archivierten Dateien):
+    python -m app.audit_store                     # logs/ synchronisieren
+    python -m app.audit_store archiv/*.jsonl.gz   # beliebige JSONL-Dateien
+"""
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+LOG_NAME = "audit.log"
+INSERT_BATCH = 5000
+READ_BLOCK = 8 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,  -- fortlaufend: Zeilen werden am Ende angehängt
+    key INTEGER NOT NULL UNIQUE,  -- Hash der Log-Zeile
+    ts TEXT NOT NULL,
+    user_role TEXT,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts, key);
+CREATE INDEX IF NOT EXISTS entries_role_ts ON entries (user_role, ts, key);
+CREATE TABLE IF NOT EXISTS entry_docs (
+    document TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    user_role TEXT,
+    PRIMARY KEY (document, ts, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entry_docs_role ON entry_docs (document, user_role, ts, key);
+CREATE TABLE IF NOT EXISTS ingested (
+    name TEXT PRIMARY KEY,
+    inode INTEGER,
+    head INTEGER,  -- ID der ersten Zeile: erkennt eine neue Datei auch bei wiederverwendetem Inode
+    offset INTEGER NOT NULL  -- -1: Datei vollständig übernommen (rotiert, ändert sich nicht mehr)
+);
+"""
+
+
+def db_path(log_dir: str) -> str:
+    return os.getenv("RAG_AUDIT_DB") or os.path.join(log_dir, "audit.sqlite")
+
+
+def _sync_enabled() -> bool:
+    return os.getenv("RAG_AUDIT_STORE_SYNC", "1").lower() in ("1", "true", "yes")
+
+
+def _line_id(line: bytes) -> int:
+    """Stabile 63-Bit-ID einer Log-Zeile (SQLite-INTEGER ist vorzeichenbehaftet)."""
+    return int.from_bytes(hashlib.blake2b(line.strip(), digest_size=8).digest(), "big") >> 1
+
+
+def _rows(lines: Iterable[bytes]) -> Iterator[Tuple[Tuple, List[Tuple]]]:
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            ts = str(entry["ts"])
+        except (ValueError, KeyError, TypeError):
+            print(f"[WARN] Audit-Zeile übersprungen (kein JSON mit ts): {line[:80]!r}")
+            continue
+        key = _line_id(line)
+        role = entry.get("user_role")
+        docs = {s.get("document") for s in entry.get("sources") or [] if isinstance(s, dict) and s.get("document")}
+        yield (key, ts, role, line.decode("utf-8").strip()), [(d, ts, key, role) for d in docs]
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    ts, _, key = cursor.rpartition("|")
+    return ts, int(key)
+
+
+def check_ts(value: Optional[str]) -> Optional[str]:
+    """ISO-Datum oder -Zeitpunkt prüfen (ValueError sonst); Vergleich erfolgt als Text."""
+    if value:
+        datetime.datetime.fromisoformat(value)
+    return value
+
+
+class AuditStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    # ---------- Befüllen ----------
+
+    def ingest_lines(self, lines: Iterable[bytes]) -> int:
+        """Zeilen übernehmen (Duplikate werden ignoriert); liefert Anzahl neuer Einträge."""
+        added = 0
+        entries: List[Tuple] = []
+        docs: List[Tuple] = []
+
+        def write():
+            nonlocal added
+            with self._lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    before = self.conn.total_changes
+                    self.conn.executemany("INSERT OR IGNORE INTO entries (key, ts, user_role, raw) VALUES (?, ?, ?, ?)", entries)
+                    added += self.conn.total_changes - before
+                    self.conn.executemany("INSERT OR IGNORE INTO entry_docs VALUES (?, ?, ?, ?)", docs)
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            entries.clear()
+            docs.clear()
+
+        for entry, entry_docs in _rows(lines):
+            entries.append(entry)
+            docs.extend(entry_docs)
+            if len(entries) >= INSERT_BATCH:
+                write()
+        if entries:
+            write()
+        return added
+
+    def ingest_file(self, path: str) -> int:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            return self.ingest_lines(f)
+
+    def sync(self, log_dir: str) -> int:
+        """Neue Zeilen aus audit.log und noch nicht übernommene rotierte Dateien einlesen."""
+        done = {name: (inode, head, offset) for name, inode, head, offset in
+                self.conn.execute("SELECT name, inode, head, offset FROM ingested")}
+        added = 0
+        base = os.path.splitext(LOG_NAME)[0]
+        for path in sorted(glob.glob(os.path.join(log_dir, f"{base}-*.log.gz"))):
+            name = os.path.basename(path)
+            if done.get(name, (None, None, 0))[2] == -1:
+                continue
+            added += self.ingest_file(path)
+            self._mark(name, None, None, -1)
+
+        inode, head, offset = done.get(LOG_NAME, (None, None, 0))
+        try:
+            f = open(os.path.join(log_dir, LOG_NAME), "rb")
+        except FileNotFoundError:
+            return added
+        with f:
+            st = os.fstat(f.fileno())
+            first = f.readline()
+            if not first.endswith(b"\n"):
+                return added
+            if (inode, head) != (st.st_ino, _line_id(first)) or offset > st.st_size:
+                offset = 0  # rotiert: neue Datei von vorn (der alte Rest kommt über die .gz)
+            head = _line_id(first)
+            f.seek(offset)
+            rest = b""
+            while offset + len(rest) < st.st_size:
+                data = rest + f.read(min(READ_BLOCK, st.st_size - offset - len(rest)))
+                end = data.rfind(b"\n") + 1  # nur vollständige Zeilen; der Rest kommt beim nächsten Mal
+                if not end:
+                    if len(data) == len(rest):
+                        break
+                    rest = data
+                    continue
+                added += self.ingest_lines(data[:end].splitlines())
+                offset += end
+                rest = data[end:]
+                self._mark(LOG_NAME, st.st_ino, head, offset)
+        return added
+
+    def _mark(self, name: str, inode: Optional[int], head: Optional[int], offset: int) -> None:
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO ingested VALUES (?, ?, ?, ?)", (name, inode, head, offset))
+
+    # ---------- Suche ----------
+
+    def search(self, user_role: Optional[str] = None, document: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None, question: Optional[str] = None,
+               limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """
+        Neueste zuerst. since inklusive, until exklusiv (ISO, z. B. "2026-10-10" oder
+        "2026-10-10T12:00"); question = Teilstring der Frage (ohne Index, filtert nur
+        die über Rolle/Dokument/Zeit gefundenen Kandidaten). next_cursor für die nächste Seite.
+        """
+        if document:
+            # über entry_docs: Dokument (+ Rolle) + Zeitraum kommen direkt aus dem Index
+            sql = "SELECT e.key, e.ts, e.raw FROM entry_docs d JOIN entries e ON e.key = d.key WHERE d.document = ?"
+            args: List = [document]
+            t, i = "d.ts", "d.key"
+            if user_role is not None:
+                sql += " AND d.user_role = ?"
+                args.append(user_role)
+        else:
+            sql = "SELECT e.key, e.ts, e.raw FROM entries e WHERE 1 = 1"
+            args = []
+            t, i = "e.ts", "e.key"
+            if user_role is not None:
+                sql += " AND e.user_role = ?"
+                args.append(user_role)
+        if since:
+            sql += f" AND {t} >= ?"
+            args.append(since)
+        if until:
+            sql += f" AND {t} < ?"
+            args.append(until)
+        if cursor:
+            sql += f" AND ({t}, {i}) < (?, ?)"
+            args.extend(parse_cursor(cursor))
+        if question:
+            escaped = question.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            sql += " AND json_extract(e.raw, '$.question') LIKE ? ESCAPE '\\'"
+            args.append(f"%{escaped}%")
+        sql += f" ORDER BY {t} DESC, {i} DESC LIMIT ?"
+        args.append(limit + 1)
+
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        items = [{"id": str(key), **json.loads(raw)} for key, _, raw in rows[:limit]]
+        next_cursor = f"{rows[limit - 1][1]}|{rows[limit - 1][0]}" if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            n = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": n, "path": self.path}
+
+
+_stores: Dict[str, AuditStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(log_dir: str) -> AuditStore:
+    path = os.path.abspath(db_path(log_dir))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = AuditStore(path)
+        return _stores[path]
+
+
+def search(log_dir: str, **filters) -> Dict:
+    """Vor der Suche neue Log-Zeilen übernehmen (RAG_AUDIT_STORE_SYNC), dann suchen."""
+    store = get_store(log_dir)
+    if _sync_enabled():
+        store.sync(log_dir)
+    return store.search(**filters)
+
+
+def main():
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Audit-Log (JSON Lines) in den durchsuchbaren Speicher übernehmen")
+    ap.add_argument("files", nargs="*", help="JSONL-Dateien (.gz erlaubt); ohne Angabe: --log-dir synchronisieren")
+    ap.add_argument("--log-dir", default="logs")
+    args = ap.parse_args()
+
+    store = get_store(args.log_dir)
+    t0 = time.perf_counter()
+    added = sum(store.ingest_file(f) for f in args.files) if args.files else store.sync(args.log_dir)
+    elapsed = time.perf_counter() - t0
+    print(f"[INFO] {added} neue Audit-Einträge in {elapsed:.1f} s ({added / max(elapsed, 1e-9):.0f}/s), "
+          f"insgesamt {store.stats()['entries']} in {store.path}")
+
+
+if __name__ == "__main__":
+    main()
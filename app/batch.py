@@ -0,0 +1,189 @@
+# app/batch.py
+"""
+Batch-Abfragen für Auswertungen und Back-Office-Jobs (POST /api/query_batch und CLI).
+
+Ablauf für viele Fragen (je Frage eigene Rolle):
+  1. ABAC je Frage
+  2. ein encode-Aufruf für alle Fragen, eine FAISS-Suche je Rolle (retriever.search_many)
+  3. Kontext-Auswahl (app/context.py): Satz-Dubletten, Token-Budget
+  4. fehlende PII-Spans aller Kontexte in einem NER-Batch, Pseudonyme je Frage
+  5. LLM-Aufrufe mit begrenzter Parallelität (RAG_BATCH_CONCURRENCY) über llm.complete,
+     also mit derselben Zulassung und Single-Flight wie /api/query
+  6. Maskierung nach LLM; gleichzeitig fertige Antworten gehen in einen NER-Batch
+Ergebnisse kommen in Fertigstellungsreihenfolge; "index" ist die Position in der Eingabe.
+Der Antwort-Cache wird bewusst nicht benutzt (Auswertungen sollen echte Antworten sehen).
+
+CLI (eine Frage je Zeile als JSON, z. B. {"id": "q1", "question": "...", "user_role": "Azubi"}):
+    python -m app.batch fragen.jsonl --role Sachbearbeiter > ergebnisse.ndjson
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import context, llm, metrics, retriever
+from .access_control import get_allowed_sources
+from .pii_masking import mask_each
+from .pii_pseudo import PseudonymTable, pseudonymize_batch
+
+NO_ACCESS = "Keine freigegebenen Dokumente für diese Rolle."
+NO_HITS = "Keine Infos gefunden."
+
+
+def _concurrency() -> int:
+    return int(os.getenv("RAG_BATCH_CONCURRENCY", "4"))
+
+
+def max_items() -> int:
+    return int(os.getenv("RAG_BATCH_MAX_ITEMS", "1000"))
+
+
+def _sources(hits: List[Dict]) -> List[Dict]:
+    return [{"document": h["source"], "chunk_id": h["chunk_id"], "title": h.get("title") or ""} for h in hits]
+
+
+async def run_batch(items: List[Dict], concurrency: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    items: Dicts mit question, user_role und optional id, mode ("default" | "mask_only").
+    Liefert je Frage ein Ergebnis mit status "ok", "blocked" (keine Freigabe) oder "error".
+    """
+    t0 = time.perf_counter()
+
+    def result(i: int, **fields) -> Dict:
+        item = items[i]
+        return {"index": i, "id": item.get("id"), "question": item["question"], "user_role": item.get("user_role"),
+                **fields, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+    # 1) ABAC
+    with metrics.span("abac"):
+        allowed = [get_allowed_sources(item.get("user_role") or "") for item in items]
+    for i, sources in enumerate(allowed):
+        if not sources:
+            yield result(i, status="blocked", answer=NO_ACCESS, sources=[])
+    todo = [i for i, sources in enumerate(allowed) if sources]
+    if not todo:
+        return
+
+    # 2) Retriever für alle Fragen
+    found = await run_in_threadpool(retriever.search_many, [items[i]["question"] for i in todo],
+                                    [allowed[i] for i in todo], 3)
+    hits = dict(zip(todo, found))
+
+    # 3) Kontext-Auswahl (Dubletten, Token-Budget), Satz-Embeddings für alle Fragen in einem Aufruf
+    with metrics.span("context"):
+        assembled = dict(zip(todo, await run_in_threadpool(context.assemble_many, [hits[i] for i in todo])))
+    ctx_hits = {i: assembled[i][0] for i in todo}
+    tokens = {i: assembled[i][1] for i in todo}
+
+    # 4) Pseudonymisierung vor LLM (außer mask_only)
+    contexts = {i: [h["text"] for h in ctx_hits[i]] for i in todo}
+    tables: Dict[int, Optional[PseudonymTable]] = {i: None for i in todo}
+    pseudo = [i for i in todo if ctx_hits[i] and items[i].get("mode") != "mask_only"]
+    if pseudo:
+        with metrics.span("pseudonymize"):
+            pseudonymized = await run_in_threadpool(pseudonymize_batch, [contexts[i] for i in pseudo],
+                                                    [[h.get("pii") for h in ctx_hits[i]] for i in pseudo])
+        for i, (texts, table) in zip(pseudo, pseudonymized):
+            contexts[i], tables[i] = texts, table
+    for i in todo:
+        if contexts[i]:
+            tokens[i]["prompt_tokens"] = context.prompt_tokens(items[i]["question"], contexts[i])
+
+    # 5) LLM mit begrenzter Parallelität
+    limit = asyncio.Semaphore(max(1, concurrency or _concurrency()))
+
+    async def answer(i: int):
+        if not contexts[i]:
+            return i, NO_HITS, None
+        async with limit:
+            try:
+                with metrics.span("llm"):
+                    return i, await llm.complete(items[i]["question"], contexts[i]), None
+            except Exception as e:  # einzelne Fehler brechen den Batch nicht ab
+                return i, None, e
+
+    pending = {asyncio.create_task(answer(i)) for i in todo}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = [task.result() for task in done]
+            ok = [(i, raw) for i, raw, error in finished if error is None]
+            # 6) Maskierung nach LLM, alles gerade Fertige in einem NER-Batch
+            with metrics.span("mask"):
+                masked = await run_in_threadpool(mask_each, [raw for _, raw in ok], [tables[i] for i, _ in ok])
+            for (i, _), m in zip(ok, masked):
+                yield result(i, status="ok", answer=m.text.strip(), sources=_sources(hits[i]), masks=m.counts,
+                             tokens=tokens[i])
+            for i, _, error in finished:
+                if error is not None:
+                    yield result(i, status="error", error=getattr(error, "detail", None) or str(error),
+                                 status_code=getattr(error, "status_code", 500), sources=_sources(hits[i]))
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def main():
+    import argparse
+    import contextlib
+    import json
+    import sys
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from .main import write_audit_log  # Audit wie bei den HTTP-Endpunkten
+
+    ap = argparse.ArgumentParser(description="Viele Fragen auf einmal beantworten (NDJSON-Ausgabe)")
+    ap.add_argument("input", help="JSONL-Datei mit question (+ optional id, user_role, mode); '-' = stdin")
+    ap.add_argument("--role", default=None, help="Rolle für Zeilen ohne user_role")
+    ap.add_argument("--mode", default="default", choices=["default", "mask_only"])
+    ap.add_argument("--concurrency", type=int, default=None, help="parallele LLM-Aufrufe (Standard: RAG_BATCH_CONCURRENCY)")
+    ap.add_argument("--out", default="-", help="Ausgabedatei (Standard: stdout)")
+    args = ap.parse_args()
+
+    items = []
+    with (sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")) as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("question"):
+                raise SystemExit(f"Zeile {n}: Feld 'question' fehlt.")
+            item.setdefault("user_role", args.role)
+            item.setdefault("mode", args.mode)
+            items.append(item)
+
+    async def run(out) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        try:
+            async for r in run_batch(items, args.concurrency):
+                counts[r["status"]] = counts.get(r["status"], 0) + 1
+                if r["status"] == "ok":
+                    write_audit_log({"user_role": r["user_role"], "question": r["question"],
+                                     "answer_masked": r["answer"], "sources": r["sources"],
+                                     "tokens": r.get("tokens")})
+                out.write(json.dumps(r, ensure_ascii=False) + "\n")
+                out.flush()
+        finally:
+            await llm.aclose()
+        return counts
+
+    t0 = time.perf_counter()
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        # Log-Ausgaben ([INFO] ...) nach stderr, stdout bleibt reines NDJSON
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = asyncio.run(run(out))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f"[INFO] Batch: {len(items)} Fragen in {elapsed:.1f} s ({len(items) / max(elapsed, 1e-9):.1f}/s), "
+          f"{', '.join(f'{k}: {v}' for k, v in sorted(counts.items()))}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
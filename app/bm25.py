@@ -0,0 +1,213 @@
+# app/bm25.py
+"""
+Lexikalischer BM25-Index über die Chunk-Texte (Hybrid-Suche neben FAISS).
+
+Tokenisierung für Deutsch: Kleinschreibung, Umlaute/ß gefaltet, Stoppwörter raus,
+leichtes Stemming (CISTEM-Variante ohne Präfixe), damit z. B. "Auszahlungen" und
+"Auszahlung" oder "Bankarbeitstagen" und "Bankarbeitstag" zusammenfallen.
+
+Dateien (im Indexverzeichnis, read-only gemappt wie der Chunk-Speicher):
+  bm25.terms.npy    Vokabular, sortiert (Term-ID = Position, Suche per searchsorted)
+  bm25.offsets.npy  Beginn der Postings je Term (Länge Vokabular + 1)
+  bm25.docs.npy     Postings: Dokumentposition (int32), je Term aufsteigend
+  bm25.tfs.npy      Termfrequenz je Posting (uint16)
+  bm25.ids.npy      Vektor-ID je Dokumentposition (aufsteigend)
+  bm25.doclen.npy   Dokumentlänge in Tokens
+  bm25.json         Parameter (k1, b), Tokenizer-Version, Größen
+"""
+import json
+import os
+import re
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+META_NAME = "bm25.json"
+ARRAYS = ("terms", "offsets", "docs", "tfs", "ids", "doclen")
+# bei Änderungen an tokenize() erhöhen: gespeicherte Indizes werden dann neu aufgebaut
+TOKENIZER_VERSION = 1
+
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+STOPWORDS = {
+    "aber", "als", "am", "an", "auch", "auf", "aus", "bei", "bin", "bis", "bist", "da", "das", "dass",
+    "dem", "den", "der", "des", "die", "dies", "diese", "dieser", "dieses", "du", "ein", "eine", "einem",
+    "einen", "einer", "eines", "er", "es", "fur", "hat", "hatte", "ich", "ihr", "im", "in", "ist", "ja",
+    "kann", "mit", "nach", "nicht", "noch", "nur", "ob", "oder", "sich", "sie", "sind", "so", "um", "und",
+    "uns", "von", "vor", "war", "was", "wer", "wie", "wir", "wird", "wo", "zu", "zum", "zur",
+}
+
+_FOLD = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+
+
+def _stem(word: str) -> str:
+    """CISTEM (Weissweiler & Fraser 2017), vereinfacht: nur Suffixe, keine Großschreibungs-Regel."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    word = word.replace("sch", "$").replace("ei", "%").replace("ie", "&")
+    word = re.sub(r"(.)\1", r"\1*", word)
+    while len(word) > 3:
+        if len(word) > 5 and word[-2:] in ("em", "er", "nd"):
+            word = word[:-2]
+        elif word[-1] in "esn":
+            word = word[:-1]
+        else:
+            break
+    word = re.sub(r"(.)\*", r"\1\1", word)
+    return word.replace("$", "sch").replace("%", "ei").replace("&", "ie")
+
+
+def tokenize(text: str) -> List[str]:
+    """Text -> Terme (gefaltet, ohne Stoppwörter, gestemmt)."""
+    text = unicodedata.normalize("NFKC", text).lower().translate(_FOLD)
+    return [_stem(t) for t in TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Builder:
+    """
+    Baut den Index streamend (ein Chunk nach dem anderen, Reihenfolge beliebig).
+    Gehalten werden nur Postings als kompakte Arrays, keine Texte.
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._ids = array("q")
+        self._doclen = array("i")
+
+    def add(self, rec: Dict) -> None:
+        title, text = rec.get("title") or "", rec["text"]
+        # der Chunk-Text beginnt meist mit dem Titel; dann nicht doppelt zählen
+        tokens = tokenize(text if text.startswith(title) else f"{title}\n{text}")
+        pos = len(self._ids)
+        self._ids.append(int(rec["id"]))
+        self._doclen.append(len(tokens))
+        counts: Dict[str, int] = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for t, c in counts.items():
+            if t not in self._docs:
+                self._docs[t], self._tfs[t] = array("i"), array("H")
+            self._docs[t].append(pos)
+            self._tfs[t].append(min(c, 0xFFFF))
+
+    def finish(self) -> "BM25Index":
+        """Sortiert Dokumente nach Vektor-ID und legt die Postings zusammenhängend ab."""
+        ids = np.frombuffer(self._ids, dtype="int64") if len(self._ids) else np.zeros(0, dtype="int64")
+        order = np.argsort(ids, kind="stable")
+        new_pos = np.empty(len(ids), dtype="int32")
+        new_pos[order] = np.arange(len(ids), dtype="int32")
+
+        terms = sorted(self._docs)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(self._docs[t]) for t in terms])
+        docs = np.empty(int(offsets[-1]), dtype="int32")
+        tfs = np.empty(int(offsets[-1]), dtype="uint16")
+        for i, t in enumerate(terms):
+            d = new_pos[np.frombuffer(self._docs[t], dtype="int32")]
+            srt = np.argsort(d, kind="stable")
+            docs[offsets[i]:offsets[i + 1]] = d[srt]
+            tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(self._tfs[t], dtype="uint16")[srt]
+        doclen = np.frombuffer(self._doclen, dtype="int32")[order] if len(ids) else np.zeros(0, dtype="int32")
+        return BM25Index(np.asarray(terms, dtype="U") if terms else np.empty(0, dtype="U1"),
+                         offsets, docs, tfs, ids[order], doclen)
+
+
+class BM25Index:
+    """Invertierter Index mit kompakten Postings; Dokumente werden über ihre Vektor-ID adressiert."""
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                 ids: np.ndarray, doclen: np.ndarray, k1: float = K1, b: float = B):
+        self.terms, self.offsets, self.docs, self.tfs = terms, offsets, docs, tfs
+        self.ids, self.doclen = ids, doclen
+        self.k1, self.b = k1, b
+        avgdl = float(np.mean(doclen)) if len(doclen) else 0.0
+        # Längennormalisierung je Dokument einmal vorrechnen (k1 * (1 - b + b * dl / avgdl))
+        self._norm = (k1 * (1 - b + b * np.asarray(doclen, dtype="float32") / max(avgdl, 1.0))).astype("float32")
+        n, df = len(ids), np.diff(offsets)
+        self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype("float32")
+
+    @classmethod
+    def build(cls, records: Iterable[Dict]) -> "BM25Index":
+        """Aus Chunk-Records (id, title, text) in einem Durchgang."""
+        builder = BM25Builder()
+        for rec in records:
+            builder.add(rec)
+        return builder.finish()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _term_ids(self, tokens: List[str]) -> List[int]:
+        out = []
+        for t in set(tokens):
+            i = int(np.searchsorted(self.terms, t))
+            if i < len(self.terms) and self.terms[i] == t:
+                out.append(i)
+        return out
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25-Score je Dokumentposition (0 = kein Term getroffen)."""
+        out = np.zeros(len(self.ids), dtype="float32")
+        for t in self._term_ids(tokenize(query)):
+            lo, hi = int(self.offsets[t]), int(self.offsets[t + 1])
+            docs = self.docs[lo:hi]
+            tf = self.tfs[lo:hi].astype("float32")
+            # je Term kommt jedes Dokument höchstens einmal vor -> Fancy-Index-Addition ist korrekt
+            out[docs] += self._idf[t] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return out
+
+    def positions(self, vector_ids: np.ndarray) -> np.ndarray:
+        """Dokumentpositionen zu Vektor-IDs (IDs müssen im Index sein)."""
+        return np.searchsorted(self.ids, np.asarray(vector_ids, dtype="int64"))
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Top-k nach BM25, optional nur über freigegebene Positionen (mask).
+        Liefert (Vektor-IDs, Scores, Score-Array aller Positionen) – Letzteres,
+        damit die Fusion auch dichte Kandidaten exakt bewerten kann.
+        """
+        all_scores = self.scores(query)
+        cand = np.flatnonzero(all_scores > 0)
+        if mask is not None:
+            cand = cand[mask[cand]]
+        if len(cand) > k:
+            cand = cand[np.argpartition(-all_scores[cand], k - 1)[:k]]
+        cand = cand[np.argsort(-all_scores[cand], kind="stable")]
+        return self.ids[cand], all_scores[cand], all_scores
+
+    def save(self, directory: Path) -> None:
+        """Schreibt alle Dateien über .tmp + os.replace."""
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            with open(directory / f"bm25.{name}.npy.tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+        (directory / (META_NAME + ".tmp")).write_text(json.dumps({
+            "tokenizer": TOKENIZER_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "docs": len(self.ids),
+            "terms": len(self.terms),
+            "postings": len(self.docs),
+        }), encoding="utf-8")
+        for name in ARRAYS:
+            os.replace(directory / f"bm25.{name}.npy.tmp", directory / f"bm25.{name}.npy")
+        os.replace(directory / (META_NAME + ".tmp"), directory / META_NAME)
+
+    @classmethod
+    def open(cls, directory: Path) -> Optional["BM25Index"]:
+        """Gespeicherten Index mappen; None, wenn er fehlt oder mit anderem Tokenizer gebaut wurde."""
+        try:
+            meta = json.loads((directory / META_NAME).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        if meta.get("tokenizer") != TOKENIZER_VERSION:
+            return None
+        arrays = {name: np.load(directory / f"bm25.{name}.npy", mmap_mode="r") for name in ARRAYS}
+        return cls(**arrays, k1=meta["k1"], b=meta["b"])
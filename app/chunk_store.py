@@ -0,0 +1,212 @@
+# app/chunk_store.py
+"""
+Kompakter Chunk-Speicher als Ersatz für mapping.json.
+
+Dateien (im Indexverzeichnis):
+  chunks.npy   Tabelle, eine Zeile je Chunk (ID, Offsets, Quelle, Hash, PII-Verweis), nach ID sortiert
+  chunks.ids.npy  ID-Spalte zusammenhängend (binäre Suche ohne Kopie)
+  chunks.bin   UTF-8-Blob; je Chunk Titel und Text direkt hintereinander
+  chunks.pii.npy  PII-Spans (Start, Ende, Label) aller Chunks, beim Ingest erkannt
+  chunks.json  Quellennamen (interniert, Tabelle speichert nur den Index) + Metadaten
+
+Tabelle und Blob werden read-only gemappt: Texte werden erst beim Zugriff dekodiert,
+und alle Worker-Prozesse teilen sich die Seiten über den Page-Cache des Betriebssystems.
+"""
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+TABLE_NAME = "chunks.npy"
+IDS_NAME = "chunks.ids.npy"
+BLOB_NAME = "chunks.bin"
+PII_NAME = "chunks.pii.npy"
+META_NAME = "chunks.json"
+VERSION = 3  # 3: ohne boost-Spalte; ältere Tabellen bleiben lesbar (Zugriff über Spaltennamen)
+
+ROW_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("text_off", "<i8"),
+    ("text_len", "<i4"),
+    ("title_len", "<i4"),   # Titel liegt direkt vor dem Text im Blob
+    ("source", "<i4"),      # Index in die Quellentabelle
+    ("chunk_id", "<i4"),
+    ("hash", "S32"),        # SHA-256 des Chunk-Texts (roh)
+    ("pii_off", "<i8"),     # erste Zeile in chunks.pii.npy
+    ("pii_len", "<i4"),     # Anzahl Spans; -1 = nicht erkannt (Altbestand)
+])
+
+# Zeichen-Offsets im Chunk-Text; Label als Index in die Labelliste aus chunks.json
+PII_DTYPE = np.dtype([("start", "<i4"), ("end", "<i4"), ("label", "u1")])
+
+
+def exists(directory: Path) -> bool:
+    return (directory / META_NAME).exists()
+
+
+class _RowEncoder:
+    """Gemeinsame Kodierung für Datei- und In-Memory-Variante."""
+
+    def __init__(self, write_blob):
+        self._write_blob = write_blob
+        self._offset = 0
+        self.rows: List[tuple] = []
+        self.sources: Dict[str, int] = {}
+        self.spans: List[tuple] = []
+        self.labels: Dict[str, int] = {}
+
+    def add(self, rec: Dict) -> None:
+        title = (rec.get("title") or "").encode("utf-8")
+        text = rec["text"].encode("utf-8")
+        self._write_blob(title)
+        self._write_blob(text)
+        source = self.sources.setdefault(rec["source"], len(self.sources))
+        pii = rec.get("pii")
+        self.rows.append((
+            rec["id"], self._offset + len(title), len(text), len(title), source,
+            rec.get("chunk_id", 0), bytes.fromhex(rec.get("hash") or "0" * 64),
+            len(self.spans), -1 if pii is None else len(pii),
+        ))
+        for start, end, label in pii or []:
+            self.spans.append((start, end, self.labels.setdefault(label, len(self.labels))))
+        self._offset += len(title) + len(text)
+
+    def table(self) -> np.ndarray:
+        table = np.array(self.rows, dtype=ROW_DTYPE)
+        return table[np.argsort(table["id"], kind="stable")]
+
+    def source_names(self) -> List[str]:
+        return sorted(self.sources, key=self.sources.get)
+
+    def span_table(self) -> np.ndarray:
+        return np.array(self.spans, dtype=PII_DTYPE)
+
+    def label_names(self) -> List[str]:
+        return sorted(self.labels, key=self.labels.get)
+
+
+class ChunkStore:
+    """Lesender Zugriff auf die Chunks über ihre Vektor-ID."""
+
+    def __init__(self, table: np.ndarray, blob, sources: List[str], ids: Optional[np.ndarray] = None,
+                 spans: Optional[np.ndarray] = None, labels: Optional[List[str]] = None):
+        self.table = table
+        self.blob = blob
+        self.sources = sources
+        # Stände vor Version 2 haben keine PII-Spans
+        self.spans = spans if spans is not None and "pii_len" in (table.dtype.names or ()) else None
+        self.labels = labels or []
+        # zusammenhängend, sonst kopiert np.searchsorted die gestridete Spalte bei jedem Aufruf
+        self.ids = ids if ids is not None else np.ascontiguousarray(table["id"])
+
+    @classmethod
+    def open(cls, directory: Path) -> "ChunkStore":
+        meta = json.loads((directory / META_NAME).read_text(encoding="utf-8"))
+        table = np.load(directory / TABLE_NAME, mmap_mode="r")
+        ids = np.load(directory / IDS_NAME, mmap_mode="r")
+        blob: object = b""
+        if (directory / BLOB_NAME).stat().st_size:
+            with open(directory / BLOB_NAME, "rb") as f:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        spans = np.load(directory / PII_NAME, mmap_mode="r") if (directory / PII_NAME).exists() else None
+        return cls(table, blob, meta["sources"], ids, spans, meta.get("pii_labels"))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "ChunkStore":
+        """In-Memory-Variante, z. B. für ein altes mapping.json oder Benchmarks."""
+        blob = bytearray()
+        enc = _RowEncoder(blob.extend)
+        for rec in records:
+            enc.add(rec)
+        return cls(enc.table(), bytes(blob), enc.source_names(), spans=enc.span_table(), labels=enc.label_names())
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def row(self, vector_id: int) -> int:
+        pos = int(np.searchsorted(self.ids, vector_id))
+        if pos >= len(self.ids) or self.ids[pos] != vector_id:
+            raise KeyError(vector_id)
+        return pos
+
+    def source(self, vector_id: int) -> str:
+        return self.sources[int(self.table["source"][self.row(vector_id)])]
+
+    def text_hashes(self, vector_ids: np.ndarray) -> List[str]:
+        """SHA-256 der Chunk-Texte (Schlüssel im Embedding-Cache), ohne die Texte zu lesen."""
+        pos = np.searchsorted(self.ids, vector_ids)
+        if np.any(pos >= len(self.ids)) or np.any(self.ids[np.minimum(pos, len(self.ids) - 1)] != vector_ids):
+            raise KeyError(vector_ids)
+        return [bytes(h).ljust(32, b"\0").hex() for h in self.table["hash"][pos]]
+
+    def _record(self, pos: int) -> Dict:
+        r = self.table[pos]
+        off, n, tn = int(r["text_off"]), int(r["text_len"]), int(r["title_len"])
+        return {
+            "id": int(r["id"]),
+            "source": self.sources[int(r["source"])],
+            "chunk_id": int(r["chunk_id"]),
+            "title": bytes(self.blob[off - tn:off]).decode("utf-8"),
+            "text": bytes(self.blob[off:off + n]).decode("utf-8"),
+            "hash": bytes(r["hash"]).ljust(32, b"\0").hex(),  # numpy kürzt Null-Bytes am Ende
+            "pii": self._spans(r),
+        }
+
+    def _spans(self, r) -> Optional[List[tuple]]:
+        if self.spans is None or int(r["pii_len"]) < 0:
+            return None
+        off, n = int(r["pii_off"]), int(r["pii_len"])
+        return [(int(s["start"]), int(s["end"]), self.labels[int(s["label"])]) for s in self.spans[off:off + n]]
+
+    def at(self, pos: int) -> Dict:
+        """Chunk an Tabellenposition pos (Positionen sind nach Vektor-ID sortiert)."""
+        return self._record(pos)
+
+    def get(self, vector_id: int) -> Dict:
+        """Liest Titel und Text (lazy, nur für tatsächlich benötigte Treffer)."""
+        return self._record(self.row(vector_id))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for pos in range(len(self.table)):
+            yield self._record(pos)
+
+    def source_ids(self) -> Dict[str, np.ndarray]:
+        """Vektor-IDs je Quelldokument (für ACL-Filter)."""
+        col = np.asarray(self.table["source"])
+        return {name: np.asarray(self.ids[col == i], dtype="int64") for i, name in enumerate(self.sources)}
+
+
+class ChunkStoreWriter:
+    """Schreibt den Chunk-Speicher streamend; Dateien werden erst in close() atomar ersetzt."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+        self._blob = open(directory / (BLOB_NAME + ".tmp"), "wb")
+        self._enc = _RowEncoder(self._blob.write)
+
+    def add(self, rec: Dict) -> None:
+        self._enc.add(rec)
+
+    def close(self) -> int:
+        self._blob.close()
+        d = self.directory
+        table = self._enc.table()
+        with open(d / (TABLE_NAME + ".tmp"), "wb") as f:
+            np.save(f, table)
+        with open(d / (IDS_NAME + ".tmp"), "wb") as f:
+            np.save(f, np.ascontiguousarray(table["id"]))
+        with open(d / (PII_NAME + ".tmp"), "wb") as f:
+            np.save(f, self._enc.span_table())
+        (d / (META_NAME + ".tmp")).write_text(json.dumps({
+            "version": VERSION,
+            "count": len(self._enc.rows),
+            "sources": self._enc.source_names(),
+            "pii_labels": self._enc.label_names(),
+        }, ensure_ascii=False), encoding="utf-8")
+        for name in (BLOB_NAME, TABLE_NAME, IDS_NAME, PII_NAME, META_NAME):
+            os.replace(d / (name + ".tmp"), d / name)
+        return len(self._enc.rows)
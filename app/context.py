@@ -0,0 +1,299 @@
+# app/context.py
+"""
+Kontext-Auswahl vor dem LLM: Token zählen, Satz-Dubletten über Treffer hinweg
+entfernen, auf ein Token-Budget kürzen.
+
+- Tokens: tiktoken (Encoding RAG_TOKENIZER, Standard o200k_base wie gpt-4o-mini),
+  falls installiert; sonst eine Schätzung (Wortstücke zu 4 Zeichen + Satzzeichen).
+- Dubletten (RAG_CONTEXT_DEDUP): "embedding" vergleicht Satz-Embeddings desselben
+  Modells wie der Index (Cosinus >= RAG_CONTEXT_DEDUP_SIM); die Vektoren berechnet der
+  Ingest (data/index/sentence_embeddings.sqlite), zur Anfragezeit wird nichts eingebettet.
+  Sätze ohne Vektor vergleicht nur der normalisierte Text. "exact" vergleicht immer nur
+  den normalisierten Text, "off" schaltet ab. Ein Satz entfällt, wenn ein besser
+  bewerteter Treffer ihn schon enthält (z. B. Auszahlung.md vs. Schulung_Auszahlung.md).
+- Budget (RAG_CONTEXT_TOKEN_BUDGET, 0 = unbegrenzt): Sätze in Reihenfolge der Treffer
+  (höchster Score zuerst) und innerhalb eines Treffers in Textreihenfolge, solange sie
+  passen. Gezählt werden nur die Kontexte, nicht Frage und Prompt-Vorlage.
+
+Läuft vor der Pseudonymisierung; die PII-Spans aus dem Ingest werden auf den gekürzten
+Text umgerechnet (Sätze werden nie mitten in einem Span getrennt). Vollständig
+übernommene Treffer bleiben unverändert.
+"""
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import llm, metrics, retriever
+from .embedding_cache import text_hash
+
+Segment = Tuple[int, int]
+
+# Satzende: . ! ? … gefolgt von Leerraum; Absätze, Listenpunkte und Überschriften trennen immer
+_PUNCT_RE = re.compile(r"(?<=[.!?…])\s+")
+_BLOCK_RE = re.compile(r"\n\s*\n\s*|\n[ \t]*(?=[-*+]\s|\d+[.)]\s|#|>)")
+_OPENERS = "„\"»'(*-#[0123456789"
+_ABBREVIATIONS = {
+    "abs", "bzw", "ca", "dr", "evtl", "fr", "ggf", "hr", "inkl", "mio", "mrd", "nr", "prof", "str",
+    "tel", "usw", "vgl", "zzgl", "etc", "bspw", "sog", "mind", "abb", "kap",
+}
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_MARKUP_RE = re.compile(r"^[\s#*>\-+]+|[*_`]+")
+
+CONTEXT_TOKENS = metrics.Counter("rag_context_tokens_total",
+                                 "Kontext-Tokens vor (in) und nach (out) der Kontext-Auswahl")
+CONTEXT_SENTENCES_DROPPED = metrics.Counter("rag_context_sentences_dropped_total",
+                                            "Entfernte Kontext-Sätze je Grund (duplicate, budget)")
+
+
+def _budget() -> int:
+    return int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+
+
+def dedup_mode() -> str:
+    return os.getenv("RAG_CONTEXT_DEDUP", "embedding").lower()
+
+
+def _dedup_sim() -> float:
+    return float(os.getenv("RAG_CONTEXT_DEDUP_SIM", "0.92"))
+
+
+# ---------- Tokenizer ----------
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """tiktoken-Encoding oder None (nicht installiert bzw. BPE-Datei nicht ladbar)."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                name = os.getenv("RAG_TOKENIZER", "o200k_base")
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(name)
+                except ImportError:
+                    print("[INFO] tiktoken nicht installiert – Tokens werden geschätzt.")
+                except Exception as e:  # z. B. BPE-Datei ohne Netz nicht ladbar
+                    print(f"[WARN] Tokenizer {name} nicht ladbar ({e}) – Tokens werden geschätzt.")
+                _encoding_loaded = True
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    enc = _get_encoding()
+    return f"tiktoken:{enc.name}" if enc is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # Schätzung: lange (deutsche) Wörter zerfallen in mehrere Tokens, Satzzeichen je eins
+    return sum(math.ceil(len(w) / 4) if w[0].isalnum() or w[0] == "_" else 1 for w in _WORD_RE.findall(text))
+
+
+def prompt_tokens(question: str, contexts: List[str]) -> int:
+    """Tokens des vollständigen Prompts, wie er an das LLM geht."""
+    return count_tokens(llm.build_prompt(question, contexts))
+
+
+# ---------- Sätze ----------
+
+def _sentence_end(text: str, end: int, nxt: int) -> bool:
+    """Trennt der Leerraum text[end:nxt] nach einem Satzzeichen wirklich zwei Sätze?"""
+    if nxt >= len(text) or not (text[nxt].isupper() or text[nxt] in _OPENERS):
+        return False
+    if text[end - 1] != ".":
+        return True
+    start = end - 1
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    word = text[start:end - 1].strip("(\"„*")
+    # Abkürzungen (z. B., Nr., Dr.), Initialen und Ordinalzahlen ("am 1. Januar")
+    return not (len(word) <= 1 or word.isdigit() or "." in word or word.lower() in _ABBREVIATIONS)
+
+
+def split_sentences(text: str, spans: Optional[Sequence[tuple]] = None, title: str = "") -> List[Segment]:
+    """
+    Sätze als (start, end) in text, ohne umgebenden Leerraum. Die Titelzeile eines
+    Chunks ist ein eigener Satz; Sätze, die ein PII-Span überspannt, werden zusammengelegt.
+    """
+    cuts: List[Segment] = []
+    if title and text.startswith(title + "\n"):
+        cuts.append((len(title), len(title) + 1))
+    cuts += [m.span() for m in _BLOCK_RE.finditer(text)]
+    cuts += [m.span() for m in _PUNCT_RE.finditer(text) if _sentence_end(text, m.start(), m.end())]
+
+    segments: List[Segment] = []
+    pos = 0
+    for cut_start, cut_end in sorted(cuts) + [(len(text), len(text))]:
+        if cut_start < pos:
+            continue
+        start, end = pos, cut_start
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            segments.append((start, end))
+        pos = cut_end
+
+    for span_start, span_end, *_ in spans or ():
+        first = next((i for i, (_, end) in enumerate(segments) if span_start < end), None)
+        if first is None:
+            continue
+        last = first
+        while last + 1 < len(segments) and segments[last + 1][0] < span_end:
+            last += 1
+        if last > first:
+            segments[first:last + 1] = [(segments[first][0], segments[last][1])]
+    return segments
+
+
+def _normalize(sentence: str) -> str:
+    """Vergleichsschlüssel: ohne Markdown-Auszeichnung, Kleinschreibung, Leerraum zusammengefasst."""
+    return " ".join(_MARKUP_RE.sub("", sentence).lower().split())
+
+
+# ---------- Satz-Embeddings ----------
+
+def _sentence_vectors(sentences: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Normalisierte Embeddings je Satz, wie sie der Ingest abgelegt hat. Sätze ohne Vektor
+    (z. B. Index vor dem Satz-Cache gebaut) fehlen im Ergebnis.
+    """
+    if not sentences:
+        return {}
+    hashes = [text_hash(s) for s in sentences]
+    found = retriever.cached_embeddings(hashes, retriever.SENTENCE_CACHE_FILE)
+    out: Dict[str, np.ndarray] = {}
+    for h, s in zip(hashes, sentences):
+        if h not in found:
+            continue
+        vec = np.asarray(found[h], dtype="float32")
+        norm = float(np.linalg.norm(vec))
+        out[s] = vec / norm if norm else vec
+    return out
+
+
+# ---------- Auswahl ----------
+
+def _rebuild(hit: Dict, segments: List[Segment], keep: List[int]) -> Dict:
+    """Treffer mit den behaltenen Sätzen; Trennzeichen zwischen Nachbarsätzen bleiben erhalten."""
+    if len(keep) == len(segments):
+        return hit
+    text, spans = hit["text"], hit.get("pii")
+    parts: List[str] = []
+    new_spans: List[tuple] = []
+    pos, prev = 0, None
+    for i in keep:
+        start, end = segments[i]
+        if parts:
+            sep = text[segments[prev][1]:start] if i == prev + 1 else "\n"
+            parts.append(sep)
+            pos += len(sep)
+        shift = pos - start
+        parts.append(text[start:end])
+        pos += end - start
+        if spans is not None:
+            new_spans += [(s + shift, e + shift, *rest) for s, e, *rest in spans if start <= s and e <= end]
+        prev = i
+    return {**hit, "text": "".join(parts), "pii": new_spans if spans is not None else None}
+
+
+def _select(hits: List[Dict], segments: List[List[Segment]], budget: int, mode: str,
+            vectors: Dict[str, np.ndarray], sim: float) -> Tuple[List[Dict], Dict]:
+    seen: set = set()
+    seen_vecs: List[np.ndarray] = []
+    candidates: List[Tuple[int, int, int]] = []  # (Treffer, Satz, Tokens)
+    duplicates = 0
+    for h, (hit, segs) in enumerate(zip(hits, segments)):
+        hit_keys, hit_vecs = [], []
+        matrix = np.stack(seen_vecs) if seen_vecs else None
+        for s, (start, end) in enumerate(segs):
+            sentence = hit["text"][start:end]
+            key = _normalize(sentence)
+            vec = vectors.get(sentence)
+            if mode != "off" and (key in seen or (matrix is not None and vec is not None
+                                                  and float(np.max(matrix @ vec)) >= sim)):
+                duplicates += 1
+                continue
+            hit_keys.append(key)
+            if vec is not None:
+                hit_vecs.append(vec)
+            candidates.append((h, s, count_tokens(sentence) + 1))  # + Trennzeichen
+        # nur gegen bessere Treffer vergleichen, nicht innerhalb eines Chunks
+        seen.update(hit_keys)
+        seen_vecs += hit_vecs
+
+    keep: List[List[int]] = [[] for _ in hits]
+    used = trimmed = 0
+    for h, s, tokens in candidates:
+        if budget > 0 and used + tokens > budget:
+            trimmed += 1
+            continue
+        keep[h].append(s)
+        used += tokens
+
+    for hit, segs, k in zip(hits, segments, keep):
+        title = hit.get("title") or ""
+        if k == [0] and len(segs) > 1 and title and hit["text"][segs[0][0]:segs[0][1]] == title:
+            k.clear()  # nur die Überschrift übrig: kein eigener Kontext
+    selected = [_rebuild(hit, segs, k) for hit, segs, k in zip(hits, segments, keep) if k]
+    tokens_in = sum(count_tokens(hit["text"]) for hit in hits)
+    tokens_out = sum(count_tokens(hit["text"]) for hit in selected)
+    CONTEXT_TOKENS.inc(tokens_in, stage="in")
+    CONTEXT_TOKENS.inc(tokens_out, stage="out")
+    if duplicates:
+        CONTEXT_SENTENCES_DROPPED.inc(duplicates, reason="duplicate")
+    if trimmed:
+        CONTEXT_SENTENCES_DROPPED.inc(trimmed, reason="budget")
+    return selected, {
+        "tokenizer": tokenizer_name(),
+        "budget": budget,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "sentences": sum(len(segs) for segs in segments),
+        "duplicates": duplicates,
+        "trimmed": trimmed,
+        "contexts": len(selected),
+    }
+
+
+def assemble_many(hit_lists: List[List[Dict]], budget: Optional[int] = None) -> List[Tuple[List[Dict], Dict]]:
+    """
+    Wie assemble() für viele Anfragen; Satz-Embeddings aller Anfragen in einem Aufruf.
+    Liefert je Anfrage (ausgewählte Treffer, Token-Statistik).
+    """
+    budget = _budget() if budget is None else budget
+    mode = dedup_mode()
+    segments = [[split_sentences(h["text"], h.get("pii"), h.get("title") or "") for h in hits]
+                for hits in hit_lists]
+    vectors: Dict[str, np.ndarray] = {}
+    # nur Anfragen mit mehreren Treffern können Dubletten über Treffer hinweg haben
+    sentences = list(dict.fromkeys(h["text"][start:end]
+                                   for hits, segs in zip(hit_lists, segments) if len(hits) > 1
+                                   for h, hit_segs in zip(hits, segs) for start, end in hit_segs))
+    if mode == "embedding" and sentences:
+        try:
+            vectors = _sentence_vectors(sentences)
+        except Exception as e:  # Satz-Cache nicht lesbar: nur Text-Dubletten
+            print(f"[WARN] Satz-Embeddings für die Kontext-Auswahl fehlgeschlagen: {e}")
+    sim = _dedup_sim()
+    return [_select(hits, segs, budget, mode, vectors, sim) for hits, segs in zip(hit_lists, segments)]
+
+
+def assemble(hits: List[Dict], budget: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Kontexte für das LLM aus den Treffern (absteigend nach Score): Satz-Dubletten
+    entfernt und auf budget Tokens gekürzt (None = RAG_CONTEXT_TOKEN_BUDGET).
+    Liefert (Treffer mit gekürztem text/pii, Token-Statistik für Audit-Log und Antwort).
+    """
+    return assemble_many([hits], budget)[0]
@@ -0,0 +1,139 @@
+# app/embedding_cache.py
+"""
+Persistenter Embedding-Cache (SQLite), Schlüssel = (Modellname, SHA-256 des Chunk-Texts).
+Beim (Re-)Ingest werden nur Chunks neu eingebettet, deren Text sich geändert hat.
+Die Kontext-Auswahl (app/context.py) legt hier auch Satz-Embeddings ab.
+
+QueryEmbeddingCache: kleiner LRU-Cache im Speicher für Anfrage-Embeddings.
+"""
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    hash  TEXT NOT NULL,
+    dim   INTEGER NOT NULL,
+    vec   BLOB NOT NULL,
+    PRIMARY KEY (model, hash)
+)
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: Path, check_same_thread: bool = True):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Server-Zugriffe kommen aus dem Threadpool: dort check_same_thread=False + eigene Sperre
+        self.conn = sqlite3.connect(str(path), check_same_thread=check_same_thread, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), 500):  # SQLite-Limit für Parameter
+            part = unique[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                [model, *part],
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype="<f4")
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, np.ndarray]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vec) VALUES (?, ?, ?, ?)",
+                [(model, h, int(v.shape[0]), v.astype("<f4").tobytes()) for h, v in items],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def encode_with_cache(model, model_name: str, texts: List[str], cache: EmbeddingCache,
+                      show_progress_bar: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Liefert Embeddings (float32, nicht normalisiert) für texts in gleicher Reihenfolge.
+    Nur Cache-Misses werden mit dem Modell berechnet. Rückgabe: (Matrix, Anzahl Cache-Treffer).
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype="float32"), 0
+    hashes = [text_hash(t) for t in texts]
+    cached = cache.get_many(model_name, hashes)
+
+    missing = [h for h in dict.fromkeys(hashes) if h not in cached]
+    if missing:
+        text_of = dict(zip(hashes, texts))
+        fresh = model.encode([text_of[h] for h in missing], convert_to_numpy=True,
+                             show_progress_bar=show_progress_bar)
+        fresh = np.asarray(fresh, dtype="float32")
+        cache.put_many(model_name, list(zip(missing, fresh)))
+        cached.update(zip(missing, fresh))
+
+    missing_set = set(missing)
+    hits = sum(1 for h in hashes if h not in missing_set)
+    return np.stack([cached[h] for h in hashes]).astype("float32"), hits
+
+
+def normalize_query(text: str) -> str:
+    """Schlüssel-Normalisierung: Unicode NFC, Leerraum zusammengefasst."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class QueryEmbeddingCache:
+    """Begrenzter, thread-sicherer LRU-Cache: (Modellname, normalisierte Frage) -> Embedding."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, query: str) -> Optional[np.ndarray]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model: str, query: str, vec: np.ndarray) -> None:
+        if self.maxsize <= 0:
+            return
+        vec = np.array(vec, dtype="float32")
+        vec.setflags(write=False)  # geteilt zwischen Anfragen
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
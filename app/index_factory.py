@@ -0,0 +1,319 @@
+# app/index_factory.py
+"""
+Konfigurierbare FAISS-Indextypen für den Retriever.
+
+Index-Typ (beim Ingest, RAG_INDEX_TYPE oder --index-type):
+  flat      exakte Suche (IndexFlatIP), Standard
+  ivf_flat  invertierte Listen, unkomprimierte Vektoren
+  hnsw      Graph-Index (HNSW)
+  ivf_pq    invertierte Listen + Product Quantization
+  fp16      exakte Suche über float16-Vektoren (halber Speicher)
+  sq8       exakte Suche über int8-Codes je Dimension (Scalar Quantization, ein Viertel)
+  binary    Vorzeichen-Bits je Dimension, Hamming-Suche (ein Zweiunddreißigstel)
+
+Bei sq8 und binary holt der Retriever RAG_RESCORE_FACTOR-mal so viele Kandidaten
+(Standard 4 bzw. 32, Hamming-Abstände sind grob) und bewertet sie mit den
+float32-Embeddings aus dem Embedding-Cache neu (siehe retriever._rescore); die
+Vektoren im RAM bleiben dabei komprimiert.
+
+Suchparameter (zur Laufzeit, von retriever.search berücksichtigt):
+  RAG_NPROBE     Anzahl abgefragter IVF-Listen (Standard 16)
+  RAG_EF_SEARCH  Kandidatenliste bei HNSW (Standard 64)
+
+RAG_INDEX_MMAP=1: Index read-only memory-mapped öffnen, damit sich mehrere
+uvicorn-Worker eine physische Kopie der Vektoren teilen. FAISS kann nur die
+invertierten Listen von IVF-Indizes mappen; ein flacher Index wird deshalb beim
+Ingest als IVF mit genau einer Liste gespeichert (weiterhin exakte Suche).
+"""
+import math
+import os
+from typing import Optional, Sequence
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "fp16", "sq8", "binary")
+RESCORED_TYPES = {"sq8": 4, "binary": 32}  # Typ -> Standard-Kandidatenfaktor
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def configured_index_type() -> str:
+    return os.getenv("RAG_INDEX_TYPE", "flat").lower()
+
+
+def mmap_enabled() -> bool:
+    return os.getenv("RAG_INDEX_MMAP", "").lower() in ("1", "true", "yes")
+
+
+def default_nprobe() -> int:
+    return _env_int("RAG_NPROBE", DEFAULT_NPROBE)
+
+
+def default_ef_search() -> int:
+    return _env_int("RAG_EF_SEARCH", DEFAULT_EF_SEARCH)
+
+
+def rescore_factor(index) -> int:
+    """Kandidaten-Faktor für die Neubewertung bei sq8/binary (1 = aus, sonst immer 1)."""
+    kind = describe(index)
+    if kind not in RESCORED_TYPES:
+        return 1
+    return max(1, _env_int("RAG_RESCORE_FACTOR", RESCORED_TYPES[kind]))
+
+
+def _auto_nlist(n: int) -> int:
+    """Faustregel ~4*sqrt(n) Listen, aber mind. 39 Trainingspunkte je Liste."""
+    nlist = _env_int("RAG_IVF_NLIST", 0) or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // 39 or 1))
+
+
+def _pq_m(dim: int) -> int:
+    """Anzahl PQ-Subvektoren; muss die Dimension teilen (384 -> 48 à 8 Dims)."""
+    m = _env_int("RAG_PQ_M", 48)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(dim: int, n_train: int, index_type: Optional[str] = None) -> faiss.Index:
+    """
+    Erzeugt einen leeren (ggf. untrainierten) Index für L2-normalisierte Vektoren
+    mit Inner-Product-Metrik (= Cosine).
+    n_train ist die Anzahl verfügbarer Trainingsvektoren; reicht sie für IVF-PQ
+    nicht aus, wird auf einen flachen Index zurückgefallen.
+    """
+    index_type = (index_type or configured_index_type()).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unbekannter Index-Typ '{index_type}', erlaubt: {', '.join(INDEX_TYPES)}")
+
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat" and mmap_enabled():
+        return _flat_mmap_layout(dim)
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type in ("fp16", "sq8"):
+        # sq8 lernt beim Training Wertebereich je Dimension (Stichprobe wie bei IVF)
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "fp16" else faiss.ScalarQuantizer.QT_8bit
+        return faiss.IndexScalarQuantizer(dim, qtype, metric)
+    if index_type == "binary":
+        return BinaryIndex(dim)
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, _env_int("RAG_HNSW_M", 32), metric)
+        index.hnsw.efConstruction = _env_int("RAG_HNSW_EF_CONSTRUCTION", 200)
+        index.hnsw.efSearch = default_ef_search()
+        return index
+
+    nlist = _auto_nlist(n_train)
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+    else:
+        nbits = _env_int("RAG_PQ_NBITS", 8)
+        if n_train < 39 * (1 << nbits):
+            print(f"[WARN] Zu wenige Vektoren ({n_train}) für IVF-PQ-Training, verwende 'flat'.")
+            return faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), nbits, metric)
+    index.nprobe = min(default_nprobe(), nlist)
+    return index
+
+
+def _flat_mmap_layout(dim: int) -> faiss.Index:
+    """Exakte Suche als IVF mit einer Liste: alle Vektoren liegen in einer mmap-fähigen Liste."""
+    quantizer = faiss.IndexFlatIP(dim)
+    quantizer.add(np.zeros((1, dim), dtype="float32"))
+    index = faiss.IndexIVFFlat(quantizer, dim, 1, faiss.METRIC_INNER_PRODUCT)
+    index.is_trained = True  # ein Zentroid, kein k-means nötig
+    return index
+
+
+class BinaryIndex:
+    """
+    Binärcodes (Vorzeichen je Dimension, d/8 Bytes je Vektor) in faiss.IndexBinaryFlat
+    mit Hamming-Suche. Bietet die Teile der faiss.Index-Schnittstelle, die Ingest und
+    Retriever benutzen (float-Eingaben, IDs, Entfernen, Rekonstruktion).
+
+    Scores sind Cosinus-Schätzungen cos(pi * hamming / d) und damit wie bei den übrigen
+    Indextypen absteigend sortiert. FAISS 1.8 kennt für Binärindizes keine ID-Selektoren:
+    mit Selektor wird mehr geholt und nachgefiltert, bis k erlaubte Treffer da sind.
+    """
+
+    metric_type = faiss.METRIC_INNER_PRODUCT
+    is_trained = True
+
+    def __init__(self, d: int, index=None):
+        self.d = d
+        self.index = index if index is not None else faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(d))
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @staticmethod
+    def encode(x: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(x) > 0, axis=1)
+
+    def train(self, x: np.ndarray) -> None:
+        pass
+
+    def add(self, x: np.ndarray) -> None:
+        self.add_with_ids(x, np.arange(self.ntotal, self.ntotal + len(x), dtype="int64"))
+
+    def add_with_ids(self, x: np.ndarray, ids: np.ndarray) -> None:
+        self.index.add_with_ids(self.encode(x), np.asarray(ids, dtype="int64"))
+
+    def remove_ids(self, ids) -> int:
+        if not isinstance(ids, faiss.IDSelector):
+            ids = faiss.IDSelectorBatch(np.asarray(ids, dtype="int64"))
+        return self.index.remove_ids(ids)
+
+    def reconstruct_batch(self, ids: Sequence[int]) -> np.ndarray:
+        """Näherung aus den Bits: +-1/sqrt(d) je Dimension (normiert)."""
+        codes = np.stack([self.index.reconstruct(int(i)) for i in ids]) if len(ids) else \
+            np.zeros((0, self.d // 8), dtype="uint8")
+        bits = np.unpackbits(codes, axis=1)[:, :self.d].astype("float32")
+        return (bits * 2 - 1) / np.float32(math.sqrt(self.d))
+
+    def search(self, x: np.ndarray, k: int, params=None):
+        codes = self.encode(x)
+        selector = getattr(params, "sel", None) if params is not None else None
+        fetch = k
+        while True:
+            fetch = min(fetch, self.ntotal)
+            H, I = self.index.search(codes, max(fetch, 1))
+            if selector is None:
+                break
+            allowed = np.vectorize(lambda i: i >= 0 and selector.is_member(int(i)), otypes=[bool])(I)
+            if fetch >= self.ntotal or allowed.sum(axis=1).min() >= k:
+                break
+            fetch *= 4
+        D = np.full((len(codes), k), -np.inf, dtype="float32")
+        out = np.full((len(codes), k), -1, dtype="int64")
+        for row in range(len(codes)):
+            keep = I[row] >= 0 if selector is None else allowed[row]
+            ids, ham = I[row][keep][:k], H[row][keep][:k]
+            out[row, :len(ids)] = ids
+            D[row, :len(ids)] = np.cos(np.pi * ham / self.d)
+        return D, out
+
+
+def write_index(index, path: str) -> None:
+    if isinstance(index, BinaryIndex):
+        faiss.write_index_binary(index.index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def _is_binary_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == b"IB"  # FAISS-Kennung der Binärindizes (IBxF, IBM2, ...)
+
+
+def read_index(path: str, mmap: Optional[bool] = None):
+    """
+    Liest den Index; mit RAG_INDEX_MMAP read-only gemappt (nur IVF-Listen).
+    mmap=False erzwingt eine beschreibbare Kopie (inkrementeller Ingest).
+    """
+    if _is_binary_file(path):
+        index = faiss.read_index_binary(path)
+        return BinaryIndex(index.d, index)
+    if not (mmap_enabled() if mmap is None else mmap):
+        return faiss.read_index(path)
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if faiss.try_extract_index_ivf(index) is None:
+        print("[WARN] RAG_INDEX_MMAP: dieser Indextyp kann nicht gemappt werden und liegt je Worker im RAM. "
+              "Für 'flat' mit gesetztem RAG_INDEX_MMAP neu indexieren.")
+    return index
+
+
+def with_ids(index: faiss.Index) -> faiss.Index:
+    """
+    Macht den Index ID-adressierbar (stabile Chunk-IDs statt Positionen).
+    IVF-Indizes und BinaryIndex können das selbst; alle anderen werden in IndexIDMap2 verpackt.
+    """
+    if isinstance(index, BinaryIndex) or faiss.try_extract_index_ivf(index) is not None:
+        return index
+    return faiss.IndexIDMap2(index)
+
+
+def train_and_add(index: faiss.Index, embeddings: np.ndarray, ids: Optional[np.ndarray] = None) -> faiss.Index:
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is None:
+        index.add(embeddings)
+    else:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+    return index
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW kann keine Vektoren entfernen; dann muss neu aufgebaut werden."""
+    return describe(index) != "hnsw"
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    base = faiss.downcast_index(index)
+    if isinstance(base, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        base = faiss.downcast_index(base.index)
+    return base
+
+
+def describe(index: faiss.Index) -> str:
+    """Kurzname des Index-Typs, z. B. für Logs und Benchmarks."""
+    if isinstance(index, BinaryIndex):
+        return "binary"
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        return "fp16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def reconstruct_ids(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """
+    Vektoren zu IDs (z. B. für ACL-Subindizes). Bei IVF werden die Listen direkt
+    durchsucht statt eine Direct-Map anzulegen – die läge je Worker privat im RAM.
+    Bei sq8/binary sind die Vektoren Näherungen (Neubewertung im Retriever).
+    """
+    if isinstance(index, BinaryIndex):
+        return index.reconstruct_batch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return index.reconstruct_batch(np.asarray(ids, dtype="int64"))
+    out = np.empty((len(ids), index.d), dtype="float32")
+    pos = {int(v): i for i, v in enumerate(ids)}
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        n = invlists.list_size(list_no)
+        if n == 0:
+            continue
+        ptr = invlists.get_ids(list_no)
+        list_ids = faiss.rev_swig_ptr(ptr, n).copy()
+        invlists.release_ids(list_no, ptr)
+        for offset in np.nonzero(np.isin(list_ids, ids))[0]:
+            ivf.reconstruct_from_offset(list_no, int(offset), faiss.swig_ptr(out[pos[int(list_ids[offset])]]))
+    return out
+
+
+def search_params(index: faiss.Index, selector=None, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    """Baut die passenden SearchParameters (ID-Selektor + nprobe/efSearch) für den Index."""
+    kind = describe(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or default_nprobe())
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or default_ef_search())
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
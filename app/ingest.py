@@ -0,0 +1,224 @@
+# app/ingest.py
+"""
+Bausteine für den streamenden Ingest (retriever.ingest_docs).
+
+- Dateien werden in einem Prozess-Pool gelesen, gehasht und in Chunks zerlegt
+  (RAG_INGEST_WORKERS, Standard: Anzahl CPUs; 0 = im Hauptprozess).
+- Es sind nur so viele Dateien unterwegs, wie ins Speicherbudget passen; die
+  Ergebnisse kommen in Dateireihenfolge zurück (deterministische Chunk-IDs).
+- Das Speicherbudget (RAG_INGEST_MEMORY_MB) begrenzt Dateien im Flug, den
+  Embedding-Batch und die Trainingsstichprobe für IVF-Indizes. Index, BM25-Postings
+  und eine Tabellenzeile je Chunk wachsen weiterhin mit dem Korpus.
+- IngestStats meldet Fortschritt und Durchsatz (Chunks/s, MB/s).
+
+Dieses Modul importiert bewusst nichts Schweres (kein Modell, kein FAISS), damit
+die Pool-Prozesse schnell starten.
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Ergebnis je Datei: (Dateiname, SHA-256 des Inhalts, Größe in Bytes, [(Titel, Chunk-Text)])
+ChunkedFile = Tuple[str, str, int, List[Tuple[str, str]]]
+
+
+def workers() -> int:
+    value = os.getenv("RAG_INGEST_WORKERS")
+    return int(value) if value else (os.cpu_count() or 1)
+
+
+def memory_budget() -> int:
+    """Speicherbudget des Ingests in Bytes."""
+    return int(float(os.getenv("RAG_INGEST_MEMORY_MB", "512")) * 1024 * 1024)
+
+
+def batch_size() -> int:
+    """Chunks je Embedding-Batch (obere Grenze; das Budget kann kleinere Batches erzwingen)."""
+    return int(os.getenv("RAG_INGEST_BATCH_SIZE", "256"))
+
+
+def read_markdown_chunks(text: str) -> List[Tuple[str, str]]:
+    """
+    Schlaues Chunking:
+      - Erkenne Markdown-Überschriften (#, ##, ###)
+      - Chunk = heading + nachfolgender Absatzblock
+    Fällt zurück auf Doppel-NEWLINE-Split, wenn keine Headings vorhanden.
+    Gibt Liste von (title, body)-Tupeln zurück (title kann leer sein).
+    """
+    lines = text.splitlines()
+    chunks: List[Tuple[str, str]] = []
+    current_title = None
+    buffer: List[str] = []
+
+    def flush_buffer(title, buf):
+        body = "\n".join(buf).strip()
+        if body:
+            chunks.append((title or "", body))
+
+    for ln in lines:
+        if re.match(r"^\s*#{1,6}\s+", ln):  # Überschrift
+            # alten Buffer wegschreiben
+            flush_buffer(current_title, buffer)
+            buffer = []
+            # neue Überschrift aufnehmen
+            current_title = re.sub(r"^\s*#{1,6}\s+", "", ln).strip()
+        else:
+            buffer.append(ln)
+
+    flush_buffer(current_title, buffer)
+
+    # Falls nichts erkannt: simpler Absatzsplit
+    if not chunks:
+        paras = [p.strip() for p in re.split(r"\n\n+", text) if p.strip()]
+        chunks = [("", p) for p in paras]
+
+    # Kombiniere title + body als endgültigen Chunk-Text
+    final_chunks: List[Tuple[str, str]] = []
+    for title, body in chunks:
+        if title:
+            final_chunks.append((title, f"{title}\n{body}".strip()))
+        else:
+            final_chunks.append(("", body))
+    return final_chunks
+
+
+def list_docs(docs_dir: Path) -> List[Tuple[str, int]]:
+    """Alle .md/.txt unter docs_dir (sortiert) mit Dateigröße, ohne sie zu lesen."""
+    with os.scandir(docs_dir) as it:
+        entries = [(e.name, e.stat().st_size) for e in it
+                   if e.is_file() and e.name.lower().endswith((".md", ".txt"))]
+    return sorted(entries)
+
+
+def chunk_file(path: str) -> ChunkedFile:
+    """Liest, hasht und zerlegt eine Datei (läuft im Pool-Prozess)."""
+    raw = Path(path).read_bytes()
+    return os.path.basename(path), hashlib.sha256(raw).hexdigest(), len(raw), read_markdown_chunks(raw.decode("utf-8"))
+
+
+def pool_context():
+    """
+    fork, wo verfügbar: Pool-Prozesse übernehmen die geladenen Module, statt (wie bei
+    spawn/forkserver, Standard unter macOS und ab Python 3.14) Paket und Torch neu zu
+    importieren. Ohne fork (Windows) bleibt der Standard der Plattform.
+    """
+    return multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+
+
+def iter_chunked_files(docs_dir: Path, files: List[Tuple[str, int]], n_workers: int,
+                       max_inflight_bytes: int) -> Iterator[ChunkedFile]:
+    """
+    Liefert chunk_file() für alle Dateien in Eingabereihenfolge. Neue Dateien werden
+    erst eingereicht, wenn die Bytes im Flug (eingereicht, noch nicht abgeholt) unter
+    max_inflight_bytes liegen – langsames Einbetten bremst so auch das Lesen.
+    """
+    paths = [(str(docs_dir / name), size) for name, size in files]
+    if n_workers <= 0:
+        for path, _ in paths:
+            yield chunk_file(path)
+        return
+
+    # Pool vor dem Laden des Embedding-Modells starten (fork ohne aktive Torch-Threads)
+    with pool_context().Pool(n_workers) as pool:
+        pending: deque = deque()
+        inflight = 0
+        next_path = 0
+        while next_path < len(paths) or pending:
+            while next_path < len(paths) and (not pending or inflight + paths[next_path][1] <= max_inflight_bytes):
+                path, size = paths[next_path]
+                pending.append((pool.apply_async(chunk_file, (path,)), size))
+                inflight += size
+                next_path += 1
+            result, size = pending.popleft()
+            inflight -= size
+            yield result.get()
+
+
+def peak_rss_mb() -> float:
+    """Maximaler Speicherverbrauch (RSS) dieses Prozesses in MB; 0.0, wo resource fehlt (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IngestStats:
+    """Fortschritt und Durchsatz; meldet sich höchstens alle `interval` Sekunden."""
+
+    def __init__(self, total_files: int, total_bytes: int, interval: float = 5.0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.embedded = 0  # neu eingebettet oder aus dem Cache in den Index übernommen
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+
+    def file_done(self, size: int, n_chunks: int) -> None:
+        self.files += 1
+        self.bytes += size
+        self.chunks += n_chunks
+
+    def batch_done(self, n_vectors: int) -> None:
+        self.embedded += n_vectors
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            print(f"[INFO] Ingest {self.files}/{self.total_files} Dateien "
+                  f"({self.bytes / max(self.total_bytes, 1):.0%}), {self.chunks} Chunks, "
+                  f"{self.embedded} Vektoren – {self._fmt_rates()}")
+
+    def _fmt_rates(self) -> str:
+        s = self.summary()
+        return f"{s['chunks_per_s']:.0f} Chunks/s, {s['mb_per_s']:.2f} MB/s"
+
+    def summary(self) -> Dict:
+        elapsed = max(time.perf_counter() - self.t0, 1e-9)
+        return {
+            "files": self.files,
+            "chunks": self.chunks,
+            "mb": round(self.bytes / 1e6, 2),
+            "seconds": round(elapsed, 2),
+            "chunks_per_s": round(self.chunks / elapsed, 1),
+            "mb_per_s": round(self.bytes / 1e6 / elapsed, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+    def report(self) -> None:
+        s = self.summary()
+        print(f"[INFO] Ingest fertig: {s['files']} Dateien, {s['chunks']} Chunks, {s['mb']} MB in {s['seconds']} s "
+              f"– {self._fmt_rates()}, Spitze RSS {s['peak_rss_mb']} MB")
+
+
+class Batcher:
+    """Sammelt Chunks bis zur Batchgröße oder bis die Texte das Byte-Limit erreichen."""
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max(1, max_items)
+        self.max_bytes = max_bytes
+        self.items: List = []
+        self.nbytes = 0
+
+    def add(self, item, nbytes: int) -> bool:
+        """Fügt hinzu; True, wenn der Batch jetzt verarbeitet werden soll."""
+        self.items.append(item)
+        self.nbytes += nbytes
+        return len(self.items) >= self.max_items or self.nbytes >= self.max_bytes
+
+    def take(self) -> List:
+        items, self.items, self.nbytes = self.items, [], 0
+        return items
+
+
+def train_sample_size(dim: int, budget: int, needed: Optional[int] = None) -> int:
+    """Max. Vektoren, die für das IVF-Training gepuffert werden (ein Viertel des Budgets)."""
+    cap = max(1, budget // 4 // (dim * 4))
+    return min(cap, needed) if needed else cap
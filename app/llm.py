@@ -0,0 +1,322 @@
+# app/llm.py
+"""
+LLM-Anbindung (OpenAI-kompatibel).
+
+- complete: asynchron, ganze Antwort (für /api/query)
+- stream_llm: asynchron mit Token-Streaming (für /api/query_stream)
+- call_llm: synchron, für Skripte außerhalb des Servers
+
+Ein gemeinsamer HTTP-Client hält die Verbindungen offen. Alle Server-Aufrufe laufen
+durch eine Zulassungssteuerung: höchstens RAG_LLM_MAX_CONCURRENCY gleichzeitig,
+höchstens RAG_LLM_MAX_QUEUE wartend (sonst 429), Wartezeit höchstens
+RAG_LLM_QUEUE_TIMEOUT_S (sonst 503). Gleichzeitige Anfragen mit identischem Prompt
+teilen sich einen Upstream-Aufruf (Single-Flight).
+
+Modell über RAG_LLM_MODEL, Endpunkt über OPENAI_BASE_URL (z. B. lokaler Stub).
+"""
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+
+_client: Optional[OpenAI] = None
+
+
+def _model() -> str:
+    return os.getenv("RAG_LLM_MODEL", "gpt-4o-mini")
+
+
+def _max_concurrency() -> int:
+    return int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "8"))
+
+
+def _max_queue() -> int:
+    return int(os.getenv("RAG_LLM_MAX_QUEUE", "32"))
+
+
+def _queue_timeout() -> float:
+    return float(os.getenv("RAG_LLM_QUEUE_TIMEOUT_S", "10"))
+
+
+def _timeout() -> float:
+    return float(os.getenv("RAG_LLM_TIMEOUT_S", "60"))
+
+
+def build_prompt(question: str, contexts: List[str]) -> str:
+    return f"""Beantworte die Nutzerfrage basierend auf den folgenden Dokument-Auszügen.
+Wenn die Antwort nicht eindeutig ist, sage das klar.
+
+Frage: {question}
+
+Kontext:
+{chr(10).join(contexts)}
+
+Antwort (auf Deutsch):"""
+
+
+class Overloaded(Exception):
+    """LLM-Stufe ausgelastet: 429 (Warteschlange voll) bzw. 503 (Wartezeit überschritten)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class Admission:
+    """Begrenzte Zulassung: Semaphore für laufende Aufrufe + begrenzte Warteschlange mit Timeout."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_s_total = 0.0
+        self.wait_s_max = 0.0
+
+    def full(self) -> bool:
+        # zählt auch Anfragen, die gerade erst in die Warteschlange gehen (noch nicht aktiv)
+        return self.active + self.waiting >= self.max_concurrency + self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.full():
+            self.rejected += 1
+            raise Overloaded(429, "LLM ausgelastet – zu viele wartende Anfragen.")
+        t0 = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise Overloaded(503, "LLM ausgelastet – Wartezeit überschritten.")
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - t0
+        self.admitted += 1
+        self.wait_s_total += waited
+        self.wait_s_max = max(self.wait_s_max, waited)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._sem.release()
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_ms_avg": round(self.wait_s_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "wait_ms_max": round(self.wait_s_max * 1000, 1),
+        }
+
+
+class _Broadcast:
+    """Ein Upstream-Stream, beliebig viele Leser; spätere Leser bekommen das Bisherige nachgeliefert."""
+
+    def __init__(self):
+        self.fragments: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, fragment: str) -> None:
+        async with self._changed:
+            self.fragments.append(fragment)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.done, self.error = True, error
+            self._changed.notify_all()
+
+    async def read(self) -> AsyncIterator[str]:
+        pos = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: pos < len(self.fragments) or self.done)
+                new = self.fragments[pos:]
+                done, error = self.done, self.error
+            for fragment in new:
+                yield fragment
+            pos += len(new)
+            if done and pos >= len(self.fragments):
+                if error is not None:
+                    raise error
+                return
+
+
+class _LoopState:
+    """Asyncio-Objekte gehören zu einer Event-Loop; je Loop ein eigener Satz."""
+
+    def __init__(self):
+        limit = _max_concurrency()
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=_timeout(),
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+            ),
+        )
+        self.admission = Admission(limit, _max_queue(), _queue_timeout())
+        self.completions: Dict[str, asyncio.Task] = {}
+        self.streams: Dict[str, _Broadcast] = {}
+        self.coalesced = 0
+        self.tasks: Set[asyncio.Task] = set()  # Upstream-Tasks: die Loop hält nur schwache Referenzen
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Upstream-Aufruf als eigener Task; bleibt referenziert, bis er fertig ist."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if not task.cancelled():
+            task.exception()  # gilt als abgeholt, auch wenn kein Aufrufer mehr wartet
+
+
+_states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+
+def _state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        state = _states[loop] = _LoopState()
+    return state
+
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=_timeout())
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Gemeinsamer Async-Client mit Connection-Pool (Keep-Alive) für alle Anfragen."""
+    return _state().client
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.sha256(f"{_model()}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def call_llm(question: str, contexts: List[str]) -> str:
+    """Ruft OpenAI GPT auf, um Antwort aus Kontexten zu generieren."""
+    resp = get_client().chat.completions.create(
+        model=_model(),
+        messages=[{"role": "user", "content": build_prompt(question, contexts)}],
+        temperature=0.2,
+    )
+    return resp.choices[0].message.content.strip()
+
+
+async def _complete(state: _LoopState, key: str, prompt: str) -> str:
+    try:
+        async with state.admission.slot():
+            resp = await state.client.chat.completions.create(
+                model=_model(),
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+            )
+        return resp.choices[0].message.content.strip()
+    finally:
+        state.completions.pop(key, None)
+
+
+async def complete(question: str, contexts: List[str]) -> str:
+    """
+    Ganze Antwort; gleichzeitige identische Prompts teilen sich einen Aufruf.
+    Der Upstream-Aufruf läuft als eigener Task: bricht der erste Aufrufer ab
+    (Verbindungsabbruch, Timeout), endet nur sein Warten, nicht das der übrigen.
+    """
+    state = _state()
+    prompt = build_prompt(question, contexts)
+    key = _prompt_key(prompt)
+    task = state.completions.get(key)
+    if task is None:
+        task = state.completions[key] = state.spawn(_complete(state, key, prompt))
+    else:
+        state.coalesced += 1
+    return await asyncio.shield(task)
+
+
+async def _produce(state: _LoopState, key: str, prompt: str, broadcast: _Broadcast) -> None:
+    try:
+        async with state.admission.slot():
+            stream = await state.client.chat.completions.create(
+                model=_model(),
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                stream=True,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    await broadcast.publish(chunk.choices[0].delta.content)
+        await broadcast.finish()
+    except BaseException as e:
+        await broadcast.finish(e)
+    finally:
+        state.streams.pop(key, None)
+
+
+async def stream_llm(question: str, contexts: List[str]) -> AsyncIterator[str]:
+    """
+    Liefert die Antwort als Text-Fragmente, sobald das Modell sie erzeugt.
+    Der Upstream-Stream läuft als eigener Task, damit ein Verbindungsabbruch des
+    ersten Clients die mitlesenden Anfragen nicht abbricht.
+    """
+    state = _state()
+    prompt = build_prompt(question, contexts)
+    key = _prompt_key(prompt)
+    broadcast = state.streams.get(key)
+    if broadcast is None:
+        broadcast = state.streams[key] = _Broadcast()
+        state.spawn(_produce(state, key, prompt, broadcast))
+    else:
+        state.coalesced += 1
+    async for fragment in broadcast.read():
+        yield fragment
+
+
+def overloaded() -> bool:
+    """True, wenn alle Plätze belegt sind und die Warteschlange voll ist (sofort ablehnen)."""
+    state = _states.get(asyncio.get_running_loop())
+    return state is not None and state.admission.full()
+
+
+def stats() -> Dict:
+    """Warteschlange, Wartezeiten und zusammengelegte Aufrufe der LLM-Stufe (Server-Loop)."""
+    states = list(_states.values())
+    if not states:
+        return {"active": 0, "queue_depth": 0, "max_concurrency": _max_concurrency(),
+                "max_queue": _max_queue(), "coalesced": 0}
+    state = states[-1]
+    return {**state.admission.stats(), "coalesced": state.coalesced}
+
+
+async def aclose() -> None:
+    """Beim Herunterfahren: offene Verbindungen schließen."""
+    state = _states.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state.client.close()
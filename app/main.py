@@ -1,23 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict
-import os, re, json, datetime, asyncio
+from typing import List, Dict, Optional, Union
+import os, re, json, asyncio, threading, time
 
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # Lokale Imports
 from .access_control import get_allowed_sources
-from .pii_pseudo import pseudonymize  # Vor LLM
+from .pii_pseudo import PseudonymTable, pseudonymize_many  # Vor LLM
 from .pii_display import replace_pseudonyms_with_masks  # Nach LLM
-from .pii_masking import mask_pii
-from . import retriever
+from .pii_masking import MaskingStream
+from . import answer_cache, audit, audit_store, batch, context, metrics, ner, retriever
+from . import llm
 
 load_dotenv()  # lädt .env
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(APP_ROOT)
@@ -26,7 +27,44 @@ DOCS_DIR = os.path.join(PROJECT_ROOT, "data", "docs")
 LOG_DIR = os.path.join(PROJECT_ROOT, "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
-app = FastAPI(title="RAG Demo – Kredit Auszahlung", version="0.4.0")
+
+_warming_up = threading.Event()  # gesetzt, solange der Warm-up läuft
+
+
+def _warmup_enabled() -> bool:
+    return os.getenv("RAG_WARMUP", "").lower() in ("1", "true", "yes")
+
+
+def warmup() -> None:
+    """Lädt Index, Embedding-Modell und NER vorab und rechnet ein Dummy-Embedding."""
+    t0 = time.perf_counter()
+    try:
+        retriever.current_generation()
+        retriever.get_model().encode(["Warmup"], convert_to_numpy=True)
+        ner.warmup()
+        print(f"[INFO] Warm-up abgeschlossen ({time.perf_counter() - t0:.1f} s).")
+    finally:
+        _warming_up.clear()  # auch bei Fehlern: Server bleibt nutzbar, Laden passiert dann lazy
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Neue Indexstände (nach Re-Ingest) im Hintergrund erkennen und laden
+    retriever.start_index_watcher()
+    warmup_task = None
+    if _warmup_enabled():
+        # im Hintergrund: der Server nimmt Verbindungen an, /api/health meldet erst danach "ok"
+        _warming_up.set()
+        warmup_task = asyncio.create_task(run_in_threadpool(warmup))
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await llm.aclose()
+    ner.shutdown()
+    await run_in_threadpool(audit.close)  # Audit-Warteschlange vollständig schreiben
+
+
+app = FastAPI(title="RAG Demo – Kredit Auszahlung", version="0.4.0", lifespan=lifespan)
 
 # Statische Auslieferung der Testdokumente und Icons
 app.mount("/docs", StaticFiles(directory=DOCS_DIR), name="docs")
@@ -46,6 +84,18 @@ class QueryRequest(BaseModel):
     user_role: str
 
 
+class BatchItem(BaseModel):
+    question: str
+    user_role: str
+    id: Optional[Union[str, int]] = None
+    mode: str = "default"
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+
+
 @app.get("/")
 def serve_index():
     if os.path.exists(FRONTEND_INDEX):
@@ -55,15 +105,106 @@ def serve_index():
 
 @app.get("/api/health")
 def health():
-    return {"status": "ok"}
+    if _warming_up.is_set():
+        return JSONResponse({"status": "starting", "ready": False}, status_code=503)
+    return {"status": "ok", "ready": True, "query_cache": retriever.query_cache_stats(),
+            "answer_cache": answer_cache.stats(), "llm": llm.stats(), "audit": audit.stats()}
+
+
+def _require_admin(x_admin_token: Optional[str]) -> None:
+    token = os.getenv("RAG_ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin-Endpunkte sind deaktiviert (RAG_ADMIN_TOKEN fehlt).")
+    if x_admin_token != token:
+        raise HTTPException(status_code=401, detail="Ungültiges Admin-Token.")
+
+
+def _app_metrics() -> List:
+    """Zustände für /metrics: Caches, Index, LLM-Warteschlange, Audit-Writer."""
+    out: List = []
+    qc = retriever.query_cache_stats()
+    out += [("rag_query_cache_hits_total", "counter", "Treffer im Anfrage-Embedding-Cache", qc["hits"]),
+            ("rag_query_cache_misses_total", "counter", "Fehlzugriffe im Anfrage-Embedding-Cache", qc["misses"]),
+            ("rag_query_cache_hit_ratio", "gauge", "Trefferquote des Anfrage-Embedding-Caches", qc["hit_rate"]),
+            ("rag_query_cache_entries", "gauge", "Einträge im Anfrage-Embedding-Cache", qc["size"])]
+    ac = answer_cache.stats()
+    if ac is not None:
+        total = ac["hits"] + ac["misses"]
+        out += [("rag_answer_cache_hits_total", "counter", "Treffer im Antwort-Cache", ac["hits"]),
+                ("rag_answer_cache_misses_total", "counter", "Fehlzugriffe im Antwort-Cache", ac["misses"]),
+                ("rag_answer_cache_hit_ratio", "gauge", "Trefferquote des Antwort-Caches",
+                 ac["hits"] / total if total else 0.0),
+                ("rag_answer_cache_entries", "gauge", "Einträge im Antwort-Cache", ac["size"])]
+    gen = retriever.current_generation(load=False)
+    if gen is not None:
+        out += [("rag_index_vectors", "gauge", "Vektoren im geladenen Index", gen.index.ntotal),
+                ("rag_index_generation", "gauge", "Geladener Indexstand", gen.generation),
+                ("rag_bm25_terms", "gauge", "Terme im BM25-Index", len(gen.lexical.terms))]
+    ls = llm.stats()
+    out += [("rag_llm_active", "gauge", "Laufende LLM-Aufrufe", ls["active"]),
+            ("rag_llm_queue_depth", "gauge", "Auf einen LLM-Platz wartende Aufrufe", ls["queue_depth"]),
+            ("rag_llm_admitted_total", "counter", "Zugelassene LLM-Aufrufe", ls.get("admitted", 0)),
+            ("rag_llm_rejected_total", "counter", "Abgelehnte LLM-Aufrufe (429)", ls.get("rejected", 0)),
+            ("rag_llm_queue_timeouts_total", "counter", "LLM-Wartezeit überschritten (503)", ls.get("timeouts", 0)),
+            ("rag_llm_coalesced_total", "counter", "Mit einem laufenden identischen Aufruf zusammengelegt",
+             ls["coalesced"])]
+    writers = audit.stats()
+    out += [("rag_audit_queued", "gauge", "Noch nicht geschriebene Audit-Einträge",
+             [({"file": f}, w["queued"]) for f, w in writers.items()] or None),
+            ("rag_audit_written_total", "counter", "Geschriebene Audit-Einträge",
+             [({"file": f}, w["written"]) for f, w in writers.items()] or None)]
+    return out
+
+
+metrics.add_collector(_app_metrics)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus-Textformat: Latenz-Histogramme je Stufe/Endpunkt, In-Flight, Caches, Index."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/api/admin/reload_index")
+def admin_reload_index(x_admin_token: Optional[str] = Header(default=None)):
+    """Lädt den Index neu (ohne Neustart). Erfordert RAG_ADMIN_TOKEN im Header X-Admin-Token."""
+    _require_admin(x_admin_token)
+    reloaded = retriever.reload_index(force=True)
+    gen = retriever.current_generation()
+    return {"reloaded": reloaded, "generation": gen.generation if gen else None}
+
+
+@app.get("/api/audit")
+def audit_search(
+    user_role: Optional[str] = None,
+    document: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    question: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """
+    Audit-Einträge suchen (neueste zuerst), z. B. ?user_role=Azubi&document=Auszahlung.md&since=2026-10-10.
+    Nächste Seite über ?cursor=<next_cursor>. Erfordert RAG_ADMIN_TOKEN im Header X-Admin-Token.
+    """
+    _require_admin(x_admin_token)
+    try:
+        audit_store.check_ts(since)
+        audit_store.check_ts(until)
+        if cursor:
+            audit_store.parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until als ISO-Datum (z. B. 2026-10-10), cursor aus next_cursor.")
+    audit.flush(timeout=2.0)  # eigene, noch nicht geschriebene Einträge mitnehmen
+    return audit_store.search(LOG_DIR, user_role=user_role, document=document, since=since, until=until,
+                              question=question, limit=limit, cursor=cursor)
 
 
 def write_audit_log(entry: Dict) -> None:
-    ts = datetime.datetime.now().isoformat()
-    entry = {"ts": ts, **entry}
-    path = os.path.join(LOG_DIR, "audit.log")
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    # nur einreihen; geschrieben wird gesammelt im Hintergrund (app/audit.py)
+    audit.write(os.path.join(LOG_DIR, "audit.log"), entry)
 
 
 def _sse_event(event: str, payload: dict) -> bytes:
@@ -77,69 +218,187 @@ def strip_markdown(text: str) -> str:
     return text
 
 
-def call_llm(question: str, contexts: List[str]) -> str:
-    """Ruft OpenAI GPT auf, um Antwort aus Kontexten zu generieren."""
-    prompt = f"""Beantworte die Nutzerfrage basierend auf den folgenden Dokument-Auszügen.
-Wenn die Antwort nicht eindeutig ist, sage das klar.
+def _answer_cache_lookup(question: str, allowed: List[str], hits: List[Dict], pseudonymized: bool):
+    """
+    Sucht eine gecachte LLM-Antwort (gleiche Freigabe, gleiche Treffer, ähnliche Frage).
+    Rückgabe: (rohe Antwort oder None, Funktion zum Speichern einer neuen Antwort).
+    """
+    cache = answer_cache.get_cache()
+    gen = retriever.current_generation()
+    if cache is None or gen is None or not hits:
+        return None, lambda answer: None
+    q_emb = retriever.embed_query(question)
+    bucket = answer_cache.bucket_key(allowed, [(h["source"], h["chunk_id"]) for h in hits],
+                                     "pseudonymize" if pseudonymized else "mask_only")
+    return cache.lookup(bucket, q_emb, gen.generation), lambda answer: cache.store(bucket, q_emb, gen.generation, answer)
+
 
-Frage: {question}
+async def _replay(answer: str):
+    yield answer
 
-Kontext:
-{chr(10).join(contexts)}
 
-Antwort (auf Deutsch):"""
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-    )
-    return resp.choices[0].message.content.strip()
+def _timed(step: Dict, t0: float) -> Dict:
+    """Dauer seit t0 als duration_ms in den Pipeline-Schritt schreiben."""
+    step["duration_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return step
+
+
+def _stop_profile(profiler) -> Optional[str]:
+    name = metrics.stop_profile(profiler, os.path.join(LOG_DIR, "profiles"), "query")
+    if name:
+        print(f"[INFO] Profil gespeichert: logs/profiles/{name}")
+    return name
 
 
 @app.post("/api/query")
-def query(req: QueryRequest, mode: str = "default"):
-    allowed = get_allowed_sources(req.user_role)
+async def query(req: QueryRequest, mode: str = "default", profile: bool = False):
+    # ?profile=1 (nur mit RAG_PROFILING): Sampling-Profil dieser Anfrage nach logs/profiles/
+    profiler = metrics.start_profile() if profile else None
+    try:
+        with metrics.request("query") as trace:
+            result = await _query(req, mode)
+            result["timings"] = trace.timings()
+    finally:
+        profile_name = _stop_profile(profiler)
+    if profile_name:
+        result["profile"] = profile_name
+    return result
+
+
+async def _query(req: QueryRequest, mode: str) -> Dict:
     pipeline = []
+    pseudonyms = PseudonymTable()  # nur für diese Anfrage
 
     # 1) ABAC
+    t0 = time.perf_counter()
+    with metrics.span("abac"):
+        allowed = get_allowed_sources(req.user_role)
     if not allowed:
         raise HTTPException(status_code=403, detail="Keine Dokumente für diese Rolle freigegeben.")
-    pipeline.append({"step": "Zugriffsprüfung (ABAC)", "status": "done"})
+    pipeline.append(_timed({"step": "Zugriffsprüfung (ABAC)", "status": "done"}, t0))
 
     # 2) Retriever
-    hits = retriever.search(req.question, allowed_sources=allowed, k=3)
-    pipeline.append({"step": "Retriever + Vektordatenbank", "status": "done"})
-
+    t0 = time.perf_counter()
+    hits = await run_in_threadpool(retriever.search, req.question, allowed_sources=allowed, k=3)
+    pipeline.append(_timed({"step": "Retriever + Vektordatenbank", "status": "done"}, t0))
+
+    # Kontext-Auswahl: Satz-Dubletten entfernen, auf das Token-Budget kürzen
+    t0 = time.perf_counter()
+    ctx_hits, tokens = [], None
+    if hits:
+        with metrics.span("context"):
+            ctx_hits, tokens = await run_in_threadpool(context.assemble, hits)
+    pipeline.append(_timed({"step": "Kontext-Auswahl (Token-Budget)", "status": "done" if hits else "skipped",
+                            "tokens": tokens}, t0))
+
+    t0 = time.perf_counter()
     if mode == "mask_only":
         # Keine Pseudonymisierung vor LLM
-        contexts = [h["text"] for h in hits] if hits else []
-        pipeline.append({"step": "PII-Pseudonymisierung (vor LLM)", "status": "skipped"})
+        contexts = [h["text"] for h in ctx_hits]
+        pipeline.append(_timed({"step": "PII-Pseudonymisierung (vor LLM)", "status": "skipped"}, t0))
     else:
         # Mit Pseudonymisierung
-        contexts = [h["text"] for h in hits] if hits else []
-        pseudo_contexts = []
-        for c in contexts:
-            c_pseudo, _ = pseudonymize(c)
-            pseudo_contexts.append(c_pseudo)
-        contexts = pseudo_contexts
-        pipeline.append({"step": "PII-Pseudonymisierung (vor LLM)", "status": "done"})
-
-    # LLM
-    raw_answer = call_llm(req.question, contexts) if contexts else "Keine Infos gefunden."
-    pipeline.append({"step": "LLM (Generator)", "status": "done"})
+        contexts = [h["text"] for h in ctx_hits]
+        # PII-Spans stammen aus dem Ingest, hier wird nur noch ersetzt
+        with metrics.span("pseudonymize"):
+            pseudo = await run_in_threadpool(pseudonymize_many, contexts, [h.get("pii") for h in ctx_hits], pseudonyms)
+        contexts = [c_pseudo for c_pseudo, _ in pseudo]
+        pipeline.append(_timed({"step": "PII-Pseudonymisierung (vor LLM)", "status": "done"}, t0))
+    if tokens is not None and contexts:
+        tokens["prompt_tokens"] = context.prompt_tokens(req.question, contexts)
+
+    # LLM (bzw. Antwort-Cache; Maskierung läuft in beiden Fällen)
+    t0 = time.perf_counter()
+    cached = None
+    if contexts:
+        with metrics.span("answer_cache"):
+            cached, remember = await run_in_threadpool(
+                _answer_cache_lookup, req.question, allowed, hits, mode != "mask_only")
+        if cached is None:
+            try:
+                with metrics.span("llm"):
+                    raw_answer = await llm.complete(req.question, contexts)
+            except llm.Overloaded as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+            await run_in_threadpool(remember, raw_answer)
+        else:
+            raw_answer = cached
+    else:
+        raw_answer = "Keine Infos gefunden."
+    pipeline.append(_timed({"step": "LLM (Generator)", "status": "done", "cached": cached is not None}, t0))
 
     # Maskierung nach LLM
-    final_answer = replace_pseudonyms_with_masks(raw_answer)
-    pipeline.append({"step": "PII-Maskierung (nach LLM)", "status": "done"})
+    t0 = time.perf_counter()
+    with metrics.span("mask"):
+        final_answer = replace_pseudonyms_with_masks(raw_answer, pseudonyms)
+    pipeline.append(_timed({"step": "PII-Maskierung (nach LLM)", "status": "done"}, t0))
 
     return {"answer": final_answer, "sources": hits, "pipeline": pipeline}
 
 
+@app.post("/api/query_batch")
+async def query_batch(req: BatchRequest):
+    """
+    Viele Fragen auf einmal (Auswertungen, Back-Office). Antwort als NDJSON, eine Zeile
+    je Frage in Fertigstellungsreihenfolge; "index" verweist auf die Position in items.
+    """
+    if len(req.items) > batch.max_items():
+        raise HTTPException(status_code=413, detail=f"Höchstens {batch.max_items()} Fragen je Batch.")
+    items = [item.model_dump() for item in req.items]
+
+    async def lines():
+        with metrics.request("query_batch"):
+            async for result in batch.run_batch(items, req.concurrency):
+                if result["status"] == "ok":
+                    with metrics.span("audit"):
+                        await run_in_threadpool(write_audit_log, {
+                            "user_role": result["user_role"],
+                            "question": result["question"],
+                            "answer_masked": result["answer"],
+                            "sources": result["sources"],
+                            "tokens": result.get("tokens")
+                        })
+                yield (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _step_pacing(pace: Optional[float]) -> float:
+    """
+    Faktor für die Demo-Pausen zwischen den Pipeline-Schritten (1 = Präsentationstempo).
+    API-Clients bekommen standardmäßig keine Pausen; das Frontend fordert sie per ?pace=1 an.
+    """
+    if pace is None:
+        pace = float(os.getenv("RAG_STEP_PACING") or 0)
+    return min(max(pace, 0.0), 5.0)
+
+
 @app.get("/api/query_stream")
-async def query_stream(question: str, user_role: str, mode: str = "default"):
+async def query_stream(question: str, user_role: str, mode: str = "default", pace: Optional[float] = None,
+                       profile: bool = False):
+    factor = _step_pacing(pace)
+
+    async def pause(seconds: float) -> None:
+        if factor > 0:
+            await asyncio.sleep(seconds * factor)
+
     async def event_gen():
+        # ?profile=1 (nur mit RAG_PROFILING): Sampling-Profil dieser Anfrage nach logs/profiles/
+        profiler = metrics.start_profile() if profile else None
+        try:
+            with metrics.request("query_stream") as trace:
+                async for event in steps(trace):
+                    yield event
+        finally:
+            profile_name = _stop_profile(profiler)
+        if profile_name:
+            yield _sse_event("profile", {"file": profile_name})
+
+    async def steps(trace: metrics.Trace):
         # 1) ABAC
-        allowed = get_allowed_sources(user_role)
+        t0 = time.perf_counter()
+        with metrics.span("abac"):
+            allowed = get_allowed_sources(user_role)
         if not allowed:
             step_abac = {
                 "step": "Zugriffsprüfung (ABAC)",
@@ -148,11 +407,12 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
                 "icon": "access.png",
                 "detail": f"Rolle '{user_role}' hat keinen Zugriff."
             }
-            yield _sse_event("step", step_abac)
+            yield _sse_event("step", _timed(step_abac, t0))
             yield _sse_event("final", {
                 "answer": "Keine freigegebenen Dokumente für diese Rolle.",
                 "sources": [],
-                "pipeline": [step_abac]
+                "pipeline": [step_abac],
+                "timings": trace.timings()
             })
             return
 
@@ -163,12 +423,12 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
             "icon": "access.png",
             "detail": f"Rolle '{user_role}' darf auf {', '.join(allowed)} zugreifen."
         }
-        yield _sse_event("step", step_abac)
-        await asyncio.sleep(0.2)
+        yield _sse_event("step", _timed(step_abac, t0))
+        await pause(0.2)
 
-        # 2) Retriever
-        hits = retriever.search(question, allowed_sources=allowed, k=3)
-        contexts = [h["text"] for h in hits] if hits else []
+        # 2) Retriever (CPU-lastig -> Threadpool, Event-Loop bleibt frei)
+        t0 = time.perf_counter()
+        hits = await run_in_threadpool(retriever.search, question, allowed_sources=allowed, k=3)
         step_ret = {
             "step": "Retriever + Vektordatenbank",
             "arch_layer": "Data Platform / MLOps",
@@ -184,15 +444,42 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
                 for h in hits
             ],
         }
-        yield _sse_event("step", step_ret)
-        await asyncio.sleep(0.3)
+        yield _sse_event("step", _timed(step_ret, t0))
+        await pause(0.3)
+
+        # Kontext-Auswahl: Satz-Dubletten über Treffer hinweg entfernen, auf das Token-Budget kürzen
+        t0 = time.perf_counter()
+        ctx_hits, tokens = [], None
+        if hits:
+            with metrics.span("context"):
+                ctx_hits, tokens = await run_in_threadpool(context.assemble, hits)
+            step_ctx = {
+                "step": "Kontext-Auswahl (Token-Budget)",
+                "arch_layer": "Data Platform / MLOps",
+                "status": "done",
+                "icon": "retriever.png",
+                "detail": f"{tokens['tokens_in']} → {tokens['tokens_out']} Tokens "
+                          f"({tokens['duplicates']} doppelte, {tokens['trimmed']} gekürzte Sätze).",
+                "tokens": tokens,
+            }
+            yield _sse_event("step", _timed(step_ctx, t0))
+            await pause(0.2)
+        contexts = [h["text"] for h in ctx_hits]
 
         # 3) Pseudonymisierung (nur im Default-Modus)
+        pseudonyms: Optional[PseudonymTable] = None
         if mode == "pseudonymize":
-            pseudo_contexts = []
-            for c in contexts:
-                c_pseudo, _ = pseudonymize(c)
-                pseudo_contexts.append(c_pseudo)
+            # PII-Spans stammen aus dem Ingest (Ersetzen dauert Mikrosekunden);
+            # nur Altbestände ohne Spans brauchen NER und damit den Threadpool
+            t0 = time.perf_counter()
+            spans = [h.get("pii") for h in ctx_hits]
+            pseudonyms = PseudonymTable()  # nur für diese Anfrage
+            with metrics.span("pseudonymize"):
+                if any(s is None for s in spans):
+                    pseudo_results = await run_in_threadpool(pseudonymize_many, contexts, spans, pseudonyms)
+                else:
+                    pseudo_results = pseudonymize_many(contexts, spans, pseudonyms)
+            pseudo_contexts = [p for p, _ in pseudo_results]
 
             step_pseudo = {
                 "step": "PII-Pseudonymisierung (vor LLM)",
@@ -202,32 +489,80 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
                 "detail": f"{len(pseudo_contexts)} Abschnitte pseudonymisiert.",
                 "extra": "\n\n".join(pseudo_contexts)
             }
-            yield _sse_event("step", step_pseudo)
-            await asyncio.sleep(0.3)
+            yield _sse_event("step", _timed(step_pseudo, t0))
+            await pause(0.3)
 
             llm_contexts = pseudo_contexts
         else:
             # Nur Maskierung: unveränderte Kontexte direkt an LLM
             llm_contexts = contexts
-
-        # 4) LLM
-        raw_answer = call_llm(question, llm_contexts) if llm_contexts else "Keine Infos gefunden."
+        if tokens is not None and llm_contexts:
+            tokens["prompt_tokens"] = context.prompt_tokens(question, llm_contexts)
+
+        # 4) LLM (gestreamt; Token gehen erst nach Maskierung satzweise an den Browser,
+        #    damit keine PII ungefiltert rausgeht – die Maskierung nach LLM passiert dabei mit)
+        t0 = time.perf_counter()
+        masking = MaskingStream(pseudonyms)
+        cached = None
+        if llm_contexts:
+            # Antwort-Cache: Treffer laufen genauso durch Maskierung und Audit
+            with metrics.span("answer_cache"):
+                cached, remember = await run_in_threadpool(
+                    _answer_cache_lookup, question, allowed, hits, pseudonyms is not None)
+            parts: List[str] = []
+            fragments = _replay(cached) if cached is not None else llm.stream_llm(question, llm_contexts)
+            # "llm" = Warten auf das Modell; die Maskierung dazwischen zählt als "mask"
+            t_llm, mask_s = time.perf_counter(), 0.0
+            try:
+                async for fragment in fragments:
+                    if not parts and cached is None:
+                        metrics.observe("llm_first_token", time.perf_counter() - t_llm)
+                    parts.append(fragment)
+                    t_mask = time.perf_counter()
+                    segment = await run_in_threadpool(masking.feed, fragment)
+                    mask_s += time.perf_counter() - t_mask
+                    if segment:
+                        yield _sse_event("token", {"text": strip_markdown(segment)})
+            except llm.Overloaded as e:
+                # Zulassung abgelehnt, bevor ein Token kam: sauber abbrechen statt zu warten
+                step_llm = {
+                    "step": "LLM (Generator)",
+                    "arch_layer": "MLOps / LLMOps",
+                    "status": "blocked",
+                    "icon": "llm.png",
+                    "detail": e.detail
+                }
+                yield _sse_event("step", _timed(step_llm, t0))
+                yield _sse_event("final", {"answer": e.detail, "sources": [], "timings": trace.timings()})
+                return
+            if cached is None:
+                metrics.observe("llm", time.perf_counter() - t_llm - mask_s)
+            t_mask = time.perf_counter()
+            segment = await run_in_threadpool(masking.flush)
+            metrics.observe("mask", mask_s + time.perf_counter() - t_mask)
+            if segment:
+                yield _sse_event("token", {"text": strip_markdown(segment)})
+            if cached is None:
+                await run_in_threadpool(remember, "".join(parts).strip())
+        else:
+            with metrics.span("mask"):
+                masking.feed("Keine Infos gefunden.")
+                masking.flush()
         step_llm = {
             "step": "LLM (Generator)",
             "arch_layer": "MLOps / LLMOps",
             "status": "done" if llm_contexts else "skipped",
             "icon": "llm.png",
-            "detail": "Antwort generiert." if llm_contexts else "Übersprungen."
+            "detail": ("Antwort aus dem Cache (ähnliche Frage)." if cached is not None else "Antwort generiert.")
+                      if llm_contexts else "Übersprungen."
         }
-        yield _sse_event("step", step_llm)
-        await asyncio.sleep(0.3)
+        yield _sse_event("step", _timed(step_llm, t0))
+        await pause(0.3)
 
-        # 5) Maskierung nach LLM
-        masked = mask_pii(raw_answer)
-        masked_clean = strip_markdown(masked)
-
-        # Anzahl Maskierungen zählen
-        num_masks = len(re.findall(r"\[.*?maskiert.*?\]", masked_clean, flags=re.IGNORECASE))
+        # 5) Maskierung nach LLM (bereits beim Streamen erfolgt, inkl. Zählung je Kategorie)
+        t0 = time.perf_counter()
+        masked_clean = strip_markdown(masking.text).strip()
+        num_masks = sum(masking.counts.values())
 
         if num_masks > 0:
             detail_text = f"Antwortausgabe maskiert ({num_masks} Stelle(n) ersetzt)."
@@ -239,12 +574,14 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
             "arch_layer": "Data Protection",
             "status": "done",
             "icon": "dataprotection.png",
-            "detail": detail_text
+            "detail": detail_text,
+            "counts": masking.counts
         }
-        yield _sse_event("step", step_mask)
-        await asyncio.sleep(0.3)
+        yield _sse_event("step", _timed(step_mask, t0))
+        await pause(0.3)
 
         # 6) Audit
+        t0 = time.perf_counter()
         sources = [{
             "document": h["source"],
             "chunk_id": h["chunk_id"],
@@ -254,10 +591,12 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
             "user_role": user_role,
             "question": question,
             "answer_masked": masked_clean,
-            "sources": sources
+            "sources": sources,
+            "tokens": tokens
         }
-        write_audit_log(log_entry)
-        
+        with metrics.span("audit"):
+            await run_in_threadpool(write_audit_log, log_entry)
+
         step_audit = {
             "step": "Quellenangabe + Audit-Log",
             "arch_layer": "Observability & Audit",
@@ -265,17 +604,20 @@ async def query_stream(question: str, user_role: str, mode: str = "default"):
             "icon": "monitoring.png",
             "detail": f"{len(sources)} Quelle(n) geloggt."
         }
-        yield _sse_event("step", step_audit)
+        yield _sse_event("step", _timed(step_audit, t0))
 
         yield _sse_event("log", log_entry)
 
-        await asyncio.sleep(0.2)
+        await pause(0.2)
 
         # Final
         yield _sse_event("final", {
             "answer": masked_clean,
-            "sources": sources
+            "sources": sources,
+            "timings": trace.timings()
         })
 
+    if llm.overloaded():
+        raise HTTPException(status_code=429, detail="LLM ausgelastet – zu viele wartende Anfragen.")
     return StreamingResponse(event_gen(), media_type="text/event-stream")
 
@@ -0,0 +1,249 @@
+# app/metrics.py
+"""
+Laufzeitmessung je Pipeline-Stufe und Prometheus-Metriken (GET /metrics).
+
+- span("encode") misst einen Abschnitt: Histogramm rag_stage_duration_seconds{stage}
+  und zusätzlich in den Trace der laufenden Anfrage (contextvars; gilt auch in
+  run_in_threadpool, dort wird der Kontext kopiert). Mehrfach gemessene Stufen
+  (z. B. Maskierung je Token-Fragment) werden im Trace aufsummiert.
+- request("query_stream") umschließt eine Anfrage: In-Flight-Gauge, Gesamtdauer,
+  Fehlerzähler und der Trace, aus dem die Endpunkte duration_ms/timings füllen.
+- Zustände anderer Module (Caches, Index, LLM-Warteschlange) liefern Collector-
+  Funktionen beim Abruf von /metrics (add_collector), damit dieses Modul nichts
+  Schweres importiert.
+- Optionaler Sampling-Profiler (pyinstrument) je Anfrage, siehe profile().
+
+Ohne prometheus_client: das Textformat (Version 0.0.4) wird hier selbst erzeugt.
+Die Werte gelten je Prozess; bei mehreren uvicorn-Workern liefert jeder seine eigenen.
+"""
+import contextvars
+import datetime
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Sekunden; von Mikrosekunden (Cache-Treffer, ABAC) bis zu langen LLM-Antworten
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, n: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + n
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in sorted(values.items())]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, n: float = 1.0, **labels) -> None:
+        self.inc(-n, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Labels, List[float]] = {}  # je Label: Zähler je Bucket, dann Summe, Anzahl
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        lines = self._header()
+        for key, row in sorted(values.items()):
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', _fmt_value(bound)))} {_fmt_value(cumulative)}")
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {_fmt_value(row[-1])}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {_fmt_value(row[-1])}")
+        return lines
+
+
+_registry: List[_Metric] = []
+_collectors: List[Callable[[], List[Tuple[str, str, str, object]]]] = []
+
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Dauer je Pipeline-Stufe")
+REQUEST_SECONDS = Histogram("rag_request_duration_seconds", "Gesamtdauer je Anfrage und Endpunkt")
+IN_FLIGHT = Gauge("rag_requests_in_flight", "Gerade laufende Anfragen je Endpunkt")
+ERRORS = Counter("rag_request_errors_total", "Anfragen, die mit einer Ausnahme endeten")
+
+
+class Trace:
+    """Gemessene Stufen einer Anfrage (Millisekunden, aufsummiert)."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()  # Stufen können parallel aus Threads kommen (Batch)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def timings(self) -> Dict[str, float]:
+        with self._lock:
+            out = {stage: round(ms, 2) for stage, ms in self.stages.items()}
+        out["total"] = round((time.perf_counter() - self.t0) * 1000, 2)
+        return out
+
+
+_trace: contextvars.ContextVar = contextvars.ContextVar("rag_trace", default=None)
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def observe(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+@contextmanager
+def request(endpoint: str) -> Iterator[Trace]:
+    trace = Trace(endpoint)
+    token = _trace.set(trace)
+    IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        yield trace
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):  # Client hat den Stream verlassen: kein Fehler
+            ERRORS.inc(endpoint=endpoint)
+        raise
+    finally:
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_SECONDS.observe(time.perf_counter() - trace.t0, endpoint=endpoint)
+        try:
+            _trace.reset(token)
+        except ValueError:  # Generator in anderem Kontext beendet
+            pass
+
+
+def add_collector(fn: Callable[[], List[Tuple[str, str, str, object]]]) -> None:
+    """
+    fn liefert beim Abruf [(Name, Typ, Hilfetext, Wert)]; Wert ist eine Zahl oder
+    eine Liste [(Labels-Dict, Zahl)]. None-Werte werden ausgelassen.
+    """
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            samples = fn()
+        except Exception as e:  # ein defekter Collector soll /metrics nicht abschalten
+            print(f"[WARN] Metriken-Collector fehlgeschlagen: {e}")
+            continue
+        for name, kind, help_text, value in samples:
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            rows = value if isinstance(value, list) else [({}, value)]
+            lines += [f"{name}{_fmt_labels(tuple(sorted(lbl.items())))} {_fmt_value(v)}" for lbl, v in rows]
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Sampling-Profiler (optional) ----------
+
+def profiling_enabled() -> bool:
+    return os.getenv("RAG_PROFILING", "").lower() in ("1", "true", "yes")
+
+
+def start_profile():
+    """pyinstrument-Profiler starten (nur mit RAG_PROFILING und installiertem pyinstrument), sonst None."""
+    if not profiling_enabled():
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("[WARN] Profiling angefordert, aber pyinstrument fehlt (pip install pyinstrument).")
+        return None
+    profiler = Profiler(interval=float(os.getenv("RAG_PROFILE_INTERVAL_S", "0.001")), async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def stop_profile(profiler, directory: str, name: str) -> Optional[str]:
+    """Profiler stoppen und als HTML unter directory ablegen; liefert den Dateinamen."""
+    if profiler is None:
+        return None
+    profiler.stop()
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{name}.html"
+    with open(os.path.join(directory, filename), "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    return filename
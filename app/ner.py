@@ -0,0 +1,106 @@
+# app/ner.py
+"""
+Gemeinsame spaCy-NER für Pseudonymisierung (vor LLM) und Maskierung (nach LLM).
+
+- Das Modell wird einmal pro Prozess geladen, nur mit den Komponenten, die NER braucht.
+- Mehrere Texte (z. B. alle Kontexte einer Anfrage) laufen in einem nlp.pipe-Batch.
+- Optional (RAG_NER_PROCESSES > 0) läuft NER in einem Prozess-Pool, damit
+  gleichzeitige Anfragen nicht am GIL hintereinander warten.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import spacy
+
+# Entität: (start_char, end_char, label, text)
+Entity = Tuple[int, int, str, str]
+
+# Komponenten der de_core_news_*-Pipelines, die für NER nicht gebraucht werden
+_EXCLUDE = ["tagger", "morphologizer", "parser", "lemmatizer", "attribute_ruler", "senter"]
+
+_nlp = None
+_loaded = False
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def model_name() -> str:
+    return os.getenv("RAG_SPACY_MODEL", "de_core_news_sm")
+
+
+def _processes() -> int:
+    return int(os.getenv("RAG_NER_PROCESSES", "0") or 0)
+
+
+def _batch_size() -> int:
+    return int(os.getenv("RAG_NER_BATCH_SIZE", "32"))
+
+
+def get_nlp():
+    """Lädt das spaCy-Modell einmalig (None, wenn nicht installiert)."""
+    global _nlp, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                name = model_name()
+                try:
+                    nlp = spacy.load(name, exclude=_EXCLUDE)
+                    # eigener tok2vec nur behalten, wenn die NER-Komponente darauf hört
+                    if "tok2vec" in nlp.pipe_names and "ner" not in nlp.get_pipe("tok2vec").listening_components:
+                        nlp.disable_pipe("tok2vec")
+                    _nlp = nlp
+                except OSError:
+                    print(f"[WARN] spaCy-Modell '{name}' fehlt. Installieren mit: python -m spacy download {name}")
+                _loaded = True
+    return _nlp
+
+
+def _pipe_entities(texts: List[str]) -> List[List[Entity]]:
+    nlp = get_nlp()
+    if nlp is None:
+        return [[] for _ in texts]
+    return [
+        [(ent.start_char, ent.end_char, ent.label_, ent.text) for ent in doc.ents]
+        for doc in nlp.pipe(texts, batch_size=_batch_size())
+    ]
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    n = _processes()
+    if n <= 0:
+        return None
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=n, initializer=get_nlp)
+    return _pool
+
+
+def entities(texts: List[str]) -> List[List[Entity]]:
+    """Erkennt Entitäten für alle Texte in einem Batch; Reihenfolge wie die Eingabe."""
+    if not texts:
+        return []
+    pool = _get_pool()
+    if pool is not None:
+        return pool.submit(_pipe_entities, list(texts)).result()
+    return _pipe_entities(texts)
+
+
+def warmup() -> None:
+    """Lädt das Modell vorab (im Prozess bzw. in allen Pool-Prozessen)."""
+    pool = _get_pool()
+    if pool is None:
+        get_nlp()
+        return
+    for f in [pool.submit(_pipe_entities, ["Warmup"]) for _ in range(_processes())]:
+        f.result()
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -1,13 +1,31 @@
 # app/pii_display.py
+import re
+from typing import Optional
 
-def replace_pseudonyms_with_masks(text: str) -> str:
+from .pii_pseudo import PseudonymTable
+
+# Anzeige je Pseudonym-Label
+DISPLAY = {
+    "PER": "Name maskiert",
+    "LOC": "Ort maskiert",
+    "GPE": "Ort maskiert",
+    "ORG": "Organisation maskiert",
+    "IBAN": "IBAN maskiert",
+    "ADDRESS": "Adresse maskiert",
+}
+
+PSEUDONYM_RE = re.compile(r"\[(" + "|".join(DISPLAY) + r")_(\d+)\]")
+
+
+def replace_pseudonyms_with_masks(text: str, table: Optional[PseudonymTable] = None) -> str:
     """
     Wandelt technische Pseudonyme wie [IBAN_1], [PER_2] in
-    verständliche Masken für die Anzeige um.
+    verständliche Masken für die Anzeige um (ein Durchlauf über den Text).
+    Mit table wird das Label über die Rückrichtung der Anfrage-Tabelle bestimmt.
     """
-    text = text.replace("[PER_", "[Name maskiert ")
-    text = text.replace("[LOC_", "[Ort maskiert ")
-    text = text.replace("[ORG_", "[Organisation maskiert ")
-    text = text.replace("[IBAN_", "[IBAN maskiert ")
-    text = text.replace("[ADDRESS_", "[Adresse maskiert ")
-    return text
+    def _display(m: "re.Match") -> str:
+        known = table.lookup(m.group(0)) if table is not None else None
+        label = known[0] if known else m.group(1)
+        return f"[{DISPLAY[label]} {m.group(2)}]"
+
+    return PSEUDONYM_RE.sub(_display, text)
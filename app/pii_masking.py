@@ -1,6 +1,17 @@
-import os
+# app/pii_masking.py
+"""
+Maskierung nach dem LLM in einem Durchlauf: Regex- (IBAN, Adresse), NER- und
+optional Pseudonym-Spans werden gesammelt, Überlappungen aufgelöst und der Text
+einmal neu zusammengesetzt. Liefert Zählungen je Kategorie.
+
+MaskingStream maskiert eine gestreamte Antwort satzweise, ohne die ganze Antwort zurückzuhalten.
+"""
 import re
-import spacy
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from . import ner
+from .pii_display import DISPLAY, PSEUDONYM_RE
+from .pii_pseudo import ADDRESS_RE, PseudonymTable, resolve_overlaps
 
 # Regex für IBAN (mit/ohne Leerzeichen)
 IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}(?:\s?\d{2,4}){3,7}\b")
@@ -21,16 +32,22 @@ NON_SENSITIVE_LOCATIONS = {
     "Deutschland", "Frankreich", "Österreich", "Schweiz", "München", "Berlin", "Paris"
 }
 
-# spaCy-Modell laden
-try:
-    nlp = spacy.load("de_core_news_sm")
-except OSError:
-    nlp = None
-    print("[WARN] spaCy-Modell 'de_core_news_sm' fehlt. Installieren mit: python -m spacy download de_core_news_sm")
-
 # Nur diese Entitäten maskieren
 MASK_LABELS = {"PER", "LOC", "GPE", "ORG", "ADDRESS"}
 
+# Kategorie (für Zählungen) und Ersetzung je Label
+CATEGORY = {"PER": "PER", "LOC": "LOC", "GPE": "LOC", "ORG": "ORG", "IBAN": "IBAN", "ADDRESS": "ADDRESS"}
+MASK_TEXT = {
+    "PER": "[Name maskiert]",
+    "LOC": "[Ort maskiert]",
+    "ORG": "[Organisation maskiert]",
+    "IBAN": "[IBAN maskiert]",
+    "ADDRESS": "[Adresse maskiert]",
+}
+
+# Satzende (oder Zeilenumbruch): bis hierhin kann eine gestreamte Antwort maskiert werden
+SEGMENT_END_RE = re.compile(r"(?<=[.!?:])\s+|\n")
+
 
 def _looks_like_time_or_quantity(text: str) -> bool:
     """Erkennt Zeitangaben wie '24–48 Stunden' oder '2 Tage'."""
@@ -40,34 +57,120 @@ def _looks_like_time_or_quantity(text: str) -> bool:
     return False
 
 
+def _keep_entity(label: str, ent_text: str) -> bool:
+    if label not in MASK_LABELS:
+        return False
+    if ent_text in FALSE_POSITIVES:
+        return False
+    if _looks_like_time_or_quantity(ent_text):
+        return False
+    if label in {"LOC", "GPE"} and ent_text in NON_SENSITIVE_LOCATIONS:
+        return False
+    return True
+
+
+class MaskResult(NamedTuple):
+    text: str
+    counts: Dict[str, int]  # Kategorie -> Anzahl Ersetzungen
+
+
+def _mask_one(text: str, entities, table: Optional[PseudonymTable]) -> MaskResult:
+    # Priorität: Pseudonym-Platzhalter, dann Regex, dann NER
+    spans = []
+    if table is not None:
+        for m in PSEUDONYM_RE.finditer(text):
+            known = table.lookup(m.group(0))
+            label = known[0] if known else m.group(1)
+            spans.append((m.start(), m.end(), CATEGORY[label], f"[{DISPLAY[label]} {m.group(2)}]"))
+    spans += [(m.start(), m.end(), "IBAN", MASK_TEXT["IBAN"]) for m in IBAN_RE.finditer(text)]
+    spans += [(m.start(), m.end(), "ADDRESS", MASK_TEXT["ADDRESS"]) for m in ADDRESS_RE.finditer(text)]
+    for start, end, label, ent_text in entities:
+        if _keep_entity(label, ent_text):
+            category = CATEGORY[label]
+            spans.append((start, end, category, MASK_TEXT[category]))
+
+    parts: List[str] = []
+    counts: Dict[str, int] = {}
+    pos = 0
+    for start, end, category, repl in resolve_overlaps(spans):
+        parts += [text[pos:start], repl]
+        counts[category] = counts.get(category, 0) + 1
+        pos = end
+    parts.append(text[pos:])
+    return MaskResult("".join(parts), counts)
+
+
+def mask_many(texts: List[str], table: Optional[PseudonymTable] = None) -> List[MaskResult]:
+    """
+    Maskiert mehrere Texte (NER in einem Batch).
+    table: Pseudonym-Tabelle der Anfrage; deren Platzhalter werden in Anzeige-Masken übersetzt.
+    """
+    return [_mask_one(t, ents, table) for t, ents in zip(texts, ner.entities(texts))]
+
+
+def mask_each(texts: List[str], tables: List[Optional[PseudonymTable]]) -> List[MaskResult]:
+    """Wie mask_many, aber jeder Text mit eigener Pseudonym-Tabelle (z. B. Antworten eines Batches)."""
+    return [_mask_one(t, ents, table) for t, ents, table in zip(texts, ner.entities(texts), tables)]
+
+
+def mask_text(text: str, table: Optional[PseudonymTable] = None) -> MaskResult:
+    return mask_many([text], table)[0]
+
+
+def mask_pii_many(texts: List[str]) -> List[str]:
+    return [r.text for r in mask_many(texts)]
+
+
 def mask_pii(text: str) -> str:
-    # IBANs ersetzen
-    masked = IBAN_RE.sub("[IBAN maskiert]", text)
-
-    if nlp:
-        doc = nlp(masked)
-        entities = [(ent.start_char, ent.end_char, ent.label_, ent.text) for ent in doc.ents]
-
-        for start, end, label, ent_text in sorted(entities, key=lambda x: -x[0]):
-            if label not in MASK_LABELS:
-                continue
-            if ent_text in FALSE_POSITIVES:
-                continue
-            if _looks_like_time_or_quantity(ent_text):
-                continue
-            if label in {"LOC", "GPE"} and ent_text in NON_SENSITIVE_LOCATIONS:
-                continue
-
-            # Ersetzungen
-            if label == "PER":
-                repl = "[Name maskiert]"
-            elif label in {"LOC", "GPE"}:
-                repl = "[Ort maskiert]"
-            elif label == "ORG":
-                repl = "[Organisation maskiert]"
-            else:  # ADDRESS
-                repl = "[Adresse maskiert]"
-
-            masked = masked[:start] + repl + masked[end:]
-
-    return masked
+    return mask_text(text).text
+
+
+class MaskingStream:
+    """
+    Inkrementelle Maskierung einer gestreamten Antwort: feed() puffert Fragmente bis
+    zum letzten Satzende und gibt nur den maskierten, abgeschlossenen Teil zurück.
+    """
+
+    def __init__(self, table: Optional[PseudonymTable] = None):
+        self.table = table
+        self.counts: Dict[str, int] = {}
+        self._buffer = ""
+        self._parts: List[str] = []
+
+    def feed(self, fragment: str) -> str:
+        self._buffer += fragment
+        cut = None
+        for m in SEGMENT_END_RE.finditer(self._buffer):
+            cut = m.end()
+        if not cut:
+            return ""
+        segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._emit(segment)
+
+    def flush(self) -> str:
+        segment, self._buffer = self._buffer, ""
+        return self._emit(segment) if segment else ""
+
+    def _emit(self, segment: str) -> str:
+        result = mask_text(segment, self.table)
+        for category, n in result.counts.items():
+            self.counts[category] = self.counts.get(category, 0) + n
+        self._parts.append(result.text)
+        return result.text
+
+    @property
+    def text(self) -> str:
+        """Bisher ausgegebene (maskierte) Antwort."""
+        return "".join(self._parts)
+
+
+def mask_fragments(fragments: Iterable[str], table: Optional[PseudonymTable] = None) -> Iterator[str]:
+    """Maskiert einen Fragment-Iterator satzweise (synchrone Variante von MaskingStream)."""
+    stream = MaskingStream(table)
+    for fragment in fragments:
+        out = stream.feed(fragment)
+        if out:
+            yield out
+    out = stream.flush()
+    if out:
+        yield out
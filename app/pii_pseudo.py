@@ -1,6 +1,18 @@
 # app/pii_pseudo.py
+"""
+Pseudonymisierung vor dem LLM: PII wird durch Platzhalter wie [PER_1], [IBAN_1] ersetzt.
+
+Die Erkennung (Regex + spaCy-NER) liefert Spans auf dem Originaltext. Für Chunks
+passiert das einmal beim Ingest (Spans liegen im Chunk-Speicher); zur Anfragezeit
+werden nur noch die Spans ersetzt. Nummerierung und Zuordnung hält eine
+PseudonymTable je Anfrage (gleicher Wert -> gleicher Platzhalter).
+"""
+import bisect
 import re
-import spacy
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from . import ner
 
 # Regex für IBAN (recht streng)
 IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}(?:\s?\d{2,4}){3,7}\b")
@@ -8,47 +20,121 @@ IBAN_RE = re.compile(r"\b[A-Z]{2}\d{2}(?:\s?\d{2,4}){3,7}\b")
 # Regex für Adressen (sehr vereinfacht, reicht für Demos)
 ADDRESS_RE = re.compile(r"\b([A-ZÄÖÜ][a-zäöüß]+(?:straße|str\.|weg|platz)\s+\d+,\s*\d{5}\s+[A-ZÄÖÜ][a-zäöüß]+)\b")
 
-# spaCy-Model laden
-try:
-    nlp = spacy.load("de_core_news_sm")
-except OSError:
-    nlp = None
-    print("[WARN] spaCy 'de_core_news_sm' nicht installiert. Installieren mit: python -m spacy download de_core_news_sm")
+NER_LABELS = {"PER", "LOC", "GPE", "ORG"}
+
+# (start_char, end_char, label) im Originaltext
+Span = Tuple[int, int, str]
+
+
+def resolve_overlaps(spans: List[tuple]) -> List[tuple]:
+    """
+    Entfernt Überlappungen; spans in Prioritätsreihenfolge (start, end, ...).
+    Ein Span bleibt, wenn er keinen bereits behaltenen überlappt. Ergebnis nach Start sortiert.
+    """
+    kept: List[tuple] = []
+    starts: List[int] = []
+    for span in spans:
+        i = bisect.bisect_left(starts, span[0])
+        if i > 0 and kept[i - 1][1] > span[0]:
+            continue
+        if i < len(kept) and kept[i][0] < span[1]:
+            continue
+        starts.insert(i, span[0])
+        kept.insert(i, span)
+    return kept
+
+
+def detect_spans_many(texts: List[str]) -> List[List[Span]]:
+    """Erkennt PII-Spans: zuerst IBANs und Adressen (Regex), dann NER in einem Batch."""
+    results = []
+    for text, ents in zip(texts, ner.entities(texts)):
+        spans: List[Span] = [(m.start(), m.end(), "IBAN") for m in IBAN_RE.finditer(text)]
+        spans += [(m.start(), m.end(), "ADDRESS") for m in ADDRESS_RE.finditer(text)]
+        spans += [(start, end, label) for start, end, label, _ in ents if label in NER_LABELS]
+        # Überlappungen: Regex-Treffer haben Vorrang, danach der frühere Span
+        results.append(resolve_overlaps(spans))
+    return results
+
+
+class PseudonymTable:
+    """
+    Pseudonyme einer Anfrage: (Label, Wert) -> Platzhalter und zurück.
+    Gleiche Werte bekommen denselben Platzhalter; Zugriffe sind thread-sicher.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._by_value: Dict[Tuple[str, str], str] = {}
+        self._by_placeholder: Dict[str, Tuple[str, str]] = {}
+
+    @staticmethod
+    def _normalize(value: str) -> str:
+        return " ".join(value.split())
+
+    def placeholder(self, label: str, value: str) -> str:
+        key = (label, self._normalize(value))
+        with self._lock:
+            placeholder = self._by_value.get(key)
+            if placeholder is None:
+                self._counters[label] = self._counters.get(label, 0) + 1
+                placeholder = f"[{label}_{self._counters[label]}]"
+                self._by_value[key] = placeholder
+                self._by_placeholder[placeholder] = key
+            return placeholder
+
+    def lookup(self, placeholder: str) -> Optional[Tuple[str, str]]:
+        """Rückrichtung: Platzhalter -> (Label, Originalwert) oder None."""
+        return self._by_placeholder.get(placeholder)
+
+    def __len__(self) -> int:
+        return len(self._by_placeholder)
+
+
+def apply_spans(text: str, spans: List[Span], table: PseudonymTable) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """Ersetzt die Spans (aufsteigend, ohne Überlappung) durch Platzhalter aus der Tabelle."""
+    parts, replacements, pos = [], [], 0
+    for start, end, label in spans:
+        placeholder = table.placeholder(label, text[start:end])
+        parts += [text[pos:start], placeholder]
+        replacements.append((start, end, placeholder))
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts), replacements
+
+
+def pseudonymize_many(texts: List[str], spans: Optional[List[Optional[List[Span]]]] = None,
+                      table: Optional[PseudonymTable] = None) -> List[Tuple[str, list]]:
+    """
+    Pseudonymisiert alle Kontexte einer Anfrage mit gemeinsamer Tabelle.
+    spans: vorberechnete Spans je Text (None = zur Laufzeit erkennen, z. B. Altbestand).
+    table: Pseudonym-Tabelle der Anfrage (für die Rückübersetzung nach dem LLM).
+    """
+    spans = list(spans) if spans is not None else [None] * len(texts)
+    missing = [i for i, s in enumerate(spans) if s is None]
+    for i, detected in zip(missing, detect_spans_many([texts[i] for i in missing])):
+        spans[i] = detected
+
+    table = table if table is not None else PseudonymTable()
+    return [apply_spans(text, text_spans, table) for text, text_spans in zip(texts, spans)]
+
 
-# Zähler für Pseudonyme
-COUNTERS = {"PER": 0, "LOC": 0, "GPE": 0, "ORG": 0, "IBAN": 0, "ADDRESS": 0}
+def pseudonymize_batch(texts: List[List[str]], spans: List[List[Optional[List[Span]]]]) -> List[Tuple[List[str], PseudonymTable]]:
+    """
+    Pseudonymisiert die Kontexte vieler Anfragen: fehlende Spans werden für alle
+    Anfragen in einem NER-Batch erkannt, jede Anfrage bekommt ihre eigene Tabelle.
+    """
+    spans = [list(s) for s in spans]
+    missing = [(i, j) for i, item in enumerate(spans) for j, s in enumerate(item) if s is None]
+    for (i, j), detected in zip(missing, detect_spans_many([texts[i][j] for i, j in missing])):
+        spans[i][j] = detected
+    results = []
+    for item_texts, item_spans in zip(texts, spans):
+        table = PseudonymTable()
+        results.append(([apply_spans(t, s, table)[0] for t, s in zip(item_texts, item_spans)], table))
+    return results
 
-def _make_label(label: str) -> str:
-    COUNTERS[label] += 1
-    return f"[{label}_{COUNTERS[label]}]"
 
 def pseudonymize(text: str):
     """Ersetzt erkannte PII durch Pseudonyme wie [PER_1], [IBAN_1]."""
-    masked = text
-    replacements = []
-
-    # 1) IBANs
-    for m in IBAN_RE.finditer(masked):
-        label = _make_label("IBAN")
-        replacements.append((m.start(), m.end(), label))
-    masked = IBAN_RE.sub(lambda m: _make_label("IBAN"), masked)
-
-    # 2) Adressen
-    for m in ADDRESS_RE.finditer(masked):
-        label = _make_label("ADDRESS")
-        replacements.append((m.start(), m.end(), label))
-    masked = ADDRESS_RE.sub(lambda m: _make_label("ADDRESS"), masked)
-
-    # 3) spaCy NER
-    if nlp:
-        doc = nlp(masked)
-        ents = []
-        for ent in doc.ents:
-            if ent.label_ in {"PER", "LOC", "GPE", "ORG"}:
-                ents.append((ent.start_char, ent.end_char, ent.label_))
-        # von hinten nach vorne ersetzen
-        for start, end, label in sorted(ents, key=lambda x: -x[0]):
-            repl = _make_label(label)
-            masked = masked[:start] + repl + masked[end:]
-
-    return masked, replacements
+    return pseudonymize_many([text])[0]
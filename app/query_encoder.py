@@ -0,0 +1,135 @@
+# app/query_encoder.py
+"""
+CPU-optimierte Kopien des Embedding-Modells für Anfragen (RAG_QUERY_ENCODER).
+
+  int8       dynamische int8-Quantisierung der Linear-Schichten (torch, keine Zusatzpakete)
+  onnx       Export nach ONNX, Inferenz mit onnxruntime (pip install onnxruntime)
+  onnx_int8  wie onnx, Gewichte dynamisch int8-quantisiert (zusätzlich pip install onnx)
+
+Quelle ist immer das lokal geladene SentenceTransformer-Modell, es wird nichts
+heruntergeladen. Der ONNX-Export liegt unter data/index/query_encoder/ und wird beim
+nächsten Start (und von den übrigen Workern) wiederverwendet. Pooling (mean/cls) wie
+im Modell, normalisiert wird im Retriever.
+
+Dokumente bleiben mit dem vollen Modell eingebettet; Anfragen liegen damit nicht mehr
+exakt im selben Raum. Wie stark das den Recall ändert, misst bench.quantization.
+Fehlt ein Paket, wird mit Warnung das volle Modell benutzt.
+"""
+import copy
+import inspect
+import os
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+MODES = ("int8", "onnx", "onnx_int8")
+
+
+def quantize_int8(model):
+    """Kopie des SentenceTransformer mit int8-Linear-Schichten (Aktivierungen dynamisch)."""
+    import torch
+
+    if not isinstance(model, torch.nn.Module):
+        raise TypeError(f"{type(model).__name__} ist kein torch-Modell")
+    quantized = copy.deepcopy(model).to("cpu").eval()
+    return torch.ao.quantization.quantize_dynamic(quantized, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _export_onnx(transformer, path: Path) -> None:
+    """HF-Modell des ersten SentenceTransformer-Moduls nach ONNX (dynamische Batch-/Sequenzlänge)."""
+    import torch
+
+    auto_model = transformer.auto_model
+    device = next(auto_model.parameters()).device
+    sample = transformer.tokenizer(["Wie lange dauert die Auszahlung?"], return_tensors="pt").to(device)
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    # ab torch 2.9 ist der dynamo-Exporter Standard (braucht onnxscript); der klassische reicht hier
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # mehrere Worker exportieren evtl. gleichzeitig
+    with torch.no_grad():
+        torch.onnx.export(auto_model.eval(), tuple(sample[n] for n in names), str(tmp),
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes={n: {0: "batch", 1: "seq"} for n in names + ["last_hidden_state"]},
+                          opset_version=14, **extra)
+    os.replace(tmp, path)
+
+
+class OnnxEncoder:
+    """encode() wie SentenceTransformer (Mean- bzw. CLS-Pooling, nicht normalisiert) über onnxruntime."""
+
+    def __init__(self, path: Path, tokenizer, max_length: int, pooling: str, dim: int):
+        import onnxruntime as ort
+
+        self.path = path
+        self.session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.pooling = pooling
+        self.dim = dim
+
+    @classmethod
+    def export(cls, model, directory: Path, name: str, quantize: bool = False) -> "OnnxEncoder":
+        import onnxruntime  # noqa: F401  (vor dem Export prüfen, ob die Laufzeit da ist)
+        import torch
+
+        if not isinstance(model, torch.nn.Sequential):
+            raise TypeError(f"{type(model).__name__} ist kein SentenceTransformer")
+        transformer, pooling = model[0], model[1]
+        mode = pooling.get_pooling_mode_str()
+        if mode not in ("mean", "cls"):
+            raise ValueError(f"Pooling '{mode}' wird vom ONNX-Encoder nicht unterstützt")
+        path = directory / f"{name.replace('/', '__')}.onnx"
+        if not path.exists():
+            print(f"[INFO] Exportiere Anfrage-Encoder nach {path} ...")
+            _export_onnx(transformer, path)
+        if quantize:
+            q_path = path.with_suffix(".int8.onnx")
+            if not q_path.exists():
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                tmp = q_path.with_name(f"{q_path.name}.{os.getpid()}.tmp")
+                quantize_dynamic(str(path), str(tmp), weight_type=QuantType.QInt8)
+                os.replace(tmp, q_path)
+            path = q_path
+        return cls(path, transformer.tokenizer, transformer.max_seq_length, mode,
+                   model.get_sentence_embedding_dimension())
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: Union[str, List[str]], convert_to_numpy: bool = True, batch_size: int = 32,
+               **_kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = []
+        for lo in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[lo:lo + batch_size], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            hidden = self.session.run(None, {k: v.astype("int64") for k, v in enc.items() if k in self.input_names})[0]
+            if self.pooling == "cls":
+                emb = hidden[:, 0]
+            else:
+                mask = enc["attention_mask"][..., None].astype("float32")
+                emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(emb.astype("float32"))
+        result = np.concatenate(out) if out else np.zeros((0, self.dim), dtype="float32")
+        return result[0] if single else result
+
+
+def load(mode: str, model, directory: Path, name: str):
+    """Optimierten Encoder für mode laden; bei fehlenden Paketen das übergebene Modell."""
+    if mode not in MODES:
+        raise ValueError(f"Unbekannter Anfrage-Encoder '{mode}', erlaubt: default, {', '.join(MODES)}")
+    try:
+        if mode == "int8":
+            encoder = quantize_int8(model)
+        else:
+            encoder = OnnxEncoder.export(model, directory, name, quantize=mode == "onnx_int8")
+    except (ImportError, TypeError, ValueError) as e:
+        print(f"[WARN] RAG_QUERY_ENCODER={mode} nicht verfügbar ({e}) – verwende das volle Modell.")
+        return model
+    print(f"[INFO] Anfrage-Encoder: {mode}")
+    return encoder
@@ -1,31 +1,56 @@
 # app/retriever.py
-import os, json, re
-from typing import List, Dict, Tuple
+import os, json, threading, time
+from typing import List, Dict, Tuple, Optional
 from pathlib import Path
 
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from . import index_factory
+from . import ingest
+from . import metrics
+from .bm25 import BM25Builder, BM25Index
+from .chunk_store import ChunkStore, ChunkStoreWriter
+from . import chunk_store
+from .embedding_cache import EmbeddingCache, QueryEmbeddingCache, encode_with_cache, text_hash
+from . import ner
+from .pii_pseudo import detect_spans_many
+
 DOCS_DIR = Path("data/docs")
 INDEX_DIR = Path("data/index")
 INDEX_FILE = INDEX_DIR / "faiss.index"
-MAPPING_FILE = INDEX_DIR / "mapping.json"
+MAPPING_FILE = INDEX_DIR / "mapping.json"  # Altformat, wird nur noch gelesen
+MANIFEST_FILE = INDEX_DIR / "manifest.json"
+EMBED_CACHE_FILE = INDEX_DIR / "embedding_cache.sqlite"
+SENTENCE_CACHE_FILE = INDEX_DIR / "sentence_embeddings.sqlite"  # Satz-Embeddings für die Kontext-Auswahl
+# Wird vom Ingest zuletzt geschrieben; der Server erkennt daran einen neuen Indexstand
+GENERATION_FILE = INDEX_DIR / "generation.json"
 
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 _model = None
-_index = None
-_mapping = None
+_current: Optional["IndexGeneration"] = None  # aktuell geladener Indexstand
+_reload_lock = threading.Lock()
+_query_cache: Optional[QueryEmbeddingCache] = None
+_query_model = None
+_query_model_lock = threading.Lock()
+_shared_caches: Dict[Path, EmbeddingCache] = {}  # Embedding-Caches für Lesezugriffe zur Anfragezeit
+_shared_cache_lock = threading.Lock()
+
+FUSION_MODES = ("rrf", "weighted", "off")
+
+
+def _fusion() -> str:
+    """Hybrid-Suche: rrf (Reciprocal Rank Fusion), weighted (Score-Mischung) oder off (nur FAISS)."""
+    return os.getenv("RAG_HYBRID_FUSION", "rrf").lower()
+
+
+def _rrf_k() -> float:
+    return float(os.getenv("RAG_RRF_K", "60"))
+
 
-# Schlüsselwörter für Dauer/Prozess nach Bewilligung
-BOOST_KWS = [
-    r"\bbewilligung\b",
-    r"\bauszahlung\b",
-    r"\binnen\b|\binnerhalb\b|\bnach\b",
-    r"\btag\b|\btage\b|\bbankarbeitstag\b|\bbankarbeitstagen\b",
-    r"\büberweisung\b|\bkontoverbindung\b"
-]
-BOOST_RE = re.compile("|".join(BOOST_KWS), flags=re.IGNORECASE)
+def _bm25_weight() -> float:
+    return float(os.getenv("RAG_BM25_WEIGHT", "0.3"))
 
 
 def get_model():
@@ -35,149 +60,698 @@ def get_model():
     return _model
 
 
-def _read_markdown_chunks(text: str) -> List[Tuple[str, str]]:
+def get_query_model():
     """
-    Schlaues Chunking:
-      - Erkenne Markdown-Überschriften (#, ##, ###)
-      - Chunk = heading + nachfolgender Absatzblock
-    Fällt zurück auf Doppel-NEWLINE-Split, wenn keine Headings vorhanden.
-    Gibt Liste von (title, body)-Tupeln zurück (title kann leer sein).
+    Encoder für Anfragen: RAG_QUERY_ENCODER=default nutzt get_model(); int8, onnx und
+    onnx_int8 laden eine für CPU optimierte Kopie (app/query_encoder.py). Dokumente
+    werden immer mit dem vollen Modell eingebettet.
+    """
+    global _query_model
+    mode = os.getenv("RAG_QUERY_ENCODER", "default").lower()
+    if mode == "default":
+        return get_model()
+    if _query_model is None:
+        with _query_model_lock:
+            if _query_model is None:
+                from . import query_encoder
+                _query_model = query_encoder.load(mode, get_model(), INDEX_DIR / "query_encoder", MODEL_NAME)
+    return _query_model
+
+
+def cached_embeddings(hashes: List[str], path: Optional[Path] = None) -> Dict[str, np.ndarray]:
+    """
+    float32-Embeddings (nicht normalisiert) aus einem beim Ingest gefüllten Cache
+    (Standard: Chunk-Embeddings), thread-sicher. Nur lesend; fehlt die Datei, leer.
+    """
+    path = EMBED_CACHE_FILE if path is None else path
+    with _shared_cache_lock:
+        cache = _shared_caches.get(path)
+        if cache is None:
+            if not path.exists():
+                return {}
+            cache = _shared_caches[path] = EmbeddingCache(path, check_same_thread=False)
+        return cache.get_many(MODEL_NAME, hashes)
+
+
+def _load_chunks() -> Optional[ChunkStore]:
+    """Chunk-Speicher des aktuellen Stands; altes mapping.json wird in-memory übernommen."""
+    if chunk_store.exists(INDEX_DIR):
+        return ChunkStore.open(INDEX_DIR)
+    if MAPPING_FILE.exists():
+        mapping = json.loads(MAPPING_FILE.read_text(encoding="utf-8"))
+        # Ältere Indizes ohne ID-Spalte: Vektor-ID = Position im Mapping
+        return ChunkStore.from_records(
+            {**rec, "id": rec.get("id", pos)}
+            for pos, rec in enumerate(mapping)
+        )
+    return None
+
+
+def _load_previous(index_type: str):
+    """
+    Bestehender Index + Chunk-Speicher + Dateihashes, falls zum Modell und Indextyp passend.
+    Der Chunk-Speicher bleibt gemappt; gelesen werden nur die Chunks, die übernommen werden.
+    Viertes Element: True, wenn die PII-Spans mit einem anderen NER-Modell erkannt wurden.
+    """
+    if not (MANIFEST_FILE.exists() and INDEX_FILE.exists() and chunk_store.exists(INDEX_DIR)):
+        return None, None, {}, False
+    manifest = json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+    if manifest.get("model") != MODEL_NAME or manifest.get("index_type") != index_type:
+        print("[INFO] Modell oder Indextyp geändert – vollständiger Neuaufbau.")
+        return None, None, {}, False
+    reset_pii = manifest.get("pii_model") != _pii_model()
+    if reset_pii:
+        print("[INFO] NER-Modell geändert – PII-Spans werden neu erkannt.")
+    index = index_factory.read_index(str(INDEX_FILE), mmap=False)
+    return index, ChunkStore.open(INDEX_DIR), manifest.get("files", {}), reset_pii
+
+
+def _pii_model() -> Optional[str]:
+    """Kennung der PII-Erkennung, mit der die gespeicherten Spans erzeugt wurden."""
+    nlp = ner.get_nlp()
+    return f"{ner.model_name()}@{nlp.meta.get('version', '')}" if nlp is not None else None
+
+
+class _StreamingIndex:
+    """
+    Nimmt normalisierte Vektoren batchweise an. Trainierte Indizes (flat, HNSW, bestehender
+    Index) bekommen sie sofort; untrainierte IVF-Indizes puffern erst eine Stichprobe
+    (ein Viertel des Speicherbudgets), trainieren darauf und nehmen danach direkt auf.
     """
-    lines = text.splitlines()
-    chunks: List[Tuple[str, str]] = []
-    current_title = None
-    buffer: List[str] = []
-
-    def flush_buffer(title, buf):
-        body = "\n".join(buf).strip()
-        if body:
-            chunks.append((title or "", body))
 
-    for ln in lines:
-        if re.match(r"^\s*#{1,6}\s+", ln):  # Überschrift
-            # alten Buffer wegschreiben
-            flush_buffer(current_title, buffer)
-            buffer = []
-            # neue Überschrift aufnehmen
-            current_title = re.sub(r"^\s*#{1,6}\s+", "", ln).strip()
-        else:
-            buffer.append(ln)
+    def __init__(self, index, index_type: str, budget: int, estimate_total):
+        self.index = index
+        self.index_type = index_type
+        self.budget = budget
+        self.estimate_total = estimate_total  # geschätzte Chunk-Gesamtzahl (für nlist)
+        self._buf: List[np.ndarray] = []
+        self._buf_ids: List[np.ndarray] = []
+        self._buffered = 0
+
+    def add(self, x: np.ndarray, ids: np.ndarray) -> None:
+        if self.index is None:
+            self.index = index_factory.with_ids(
+                index_factory.build_index(x.shape[1], max(self.estimate_total(), len(x)), self.index_type))
+        if self.index.is_trained and not self._buf:
+            self.index.add_with_ids(x, ids)
+            return
+        self._buf.append(x)
+        self._buf_ids.append(ids)
+        self._buffered += len(x)
+        if self._buffered >= ingest.train_sample_size(x.shape[1], self.budget):
+            self._train()
+
+    def _train(self) -> None:
+        x, ids = np.concatenate(self._buf), np.concatenate(self._buf_ids)
+        self._buf, self._buf_ids, self._buffered = [], [], 0
+        index_factory.train_and_add(self.index, x, ids)
+
+    def finish(self):
+        if self._buf:
+            self._train()
+        return self.index
+
+
+def _index_from_store(store: ChunkStore, index_type: str, budget: int):
+    """Baut den Index aus allen Chunks des Speichers neu auf (Vektoren aus dem Embedding-Cache)."""
+    vectors = _StreamingIndex(None, index_type, budget, lambda: len(store))
+    cache = EmbeddingCache(EMBED_CACHE_FILE)
+    try:
+        step = ingest.batch_size()
+        for lo in range(0, len(store), step):
+            recs = [store.at(pos) for pos in range(lo, min(lo + step, len(store)))]
+            embeddings, _ = encode_with_cache(get_model(), MODEL_NAME, [rec["text"] for rec in recs], cache)
+            faiss.normalize_L2(embeddings)
+            vectors.add(embeddings, np.asarray([rec["id"] for rec in recs], dtype="int64"))
+    finally:
+        cache.close()
+        if sentence_cache is not None:
+            sentence_cache.close()
+    return vectors.finish()
+
+
+def ingest_docs(index_type: Optional[str] = None, incremental: bool = False) -> Dict:
+    """
+    Lädt alle .md/.txt, erzeugt Embeddings und speichert FAISS-Index + Chunk-Speicher + BM25.
+    index_type: flat | ivf_flat | hnsw | ivf_pq (Standard: RAG_INDEX_TYPE bzw. flat).
+    incremental: nur neue/geänderte Chunks einbetten und hinzufügen, gelöschte entfernen.
+    Embeddings kommen in beiden Modi aus dem persistenten Cache, soweit vorhanden.
+
+    Streamend: Dateien werden parallel zerlegt, Chunks in Batches erkannt (PII) und
+    eingebettet und sofort an Index, Chunk-Speicher und BM25 angehängt; Texte liegen
+    nie für den ganzen Korpus im Speicher (Budget und Pool siehe app/ingest.py).
+    Rückgabe: Durchsatz-Kennzahlen (IngestStats.summary).
+    """
+    from . import context  # context importiert retriever
 
-    flush_buffer(current_title, buffer)
+    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    index_type = (index_type or index_factory.configured_index_type()).lower()
 
-    # Falls nichts erkannt: simpler Absatzsplit
-    if not chunks:
-        paras = [p.strip() for p in re.split(r"\n\n+", text) if p.strip()]
-        chunks = [("", p) for p in paras]
+    files = ingest.list_docs(DOCS_DIR)
+    if not files:
+        raise RuntimeError(f"Keine Dokumente unter {DOCS_DIR} gefunden.")
 
-    # Kombiniere title + body als endgültigen Chunk-Text
-    final_chunks: List[Tuple[str, str]] = []
-    for title, body in chunks:
-        if title:
-            final_chunks.append((title, f"{title}\n{body}".strip()))
+    index, old_store, old_files, reset_pii = _load_previous(index_type) if incremental else (None, None, {}, False)
+    rebuild = index is None  # Neuaufbau: alle Vektoren, soweit möglich aus dem Embedding-Cache
+    old_rows: Dict[str, np.ndarray] = {}
+    next_id = 0
+    if old_store is not None and len(old_store):
+        col = np.asarray(old_store.table["source"])
+        old_rows = {name: np.flatnonzero(col == i) for i, name in enumerate(old_store.sources)}
+        next_id = int(np.max(old_store.ids)) + 1
+
+    budget = ingest.memory_budget()
+    stats = ingest.IngestStats(len(files), sum(size for _, size in files))
+    batcher = ingest.Batcher(ingest.batch_size(), budget // 8)
+    vectors = _StreamingIndex(index, index_type, budget,
+                              lambda: int(stats.chunks / max(stats.bytes, 1) * stats.total_bytes))
+    writer = ChunkStoreWriter(INDEX_DIR)
+    lexical = BM25Builder()
+    cache = EmbeddingCache(EMBED_CACHE_FILE)
+    # Satz-Embeddings für die Kontext-Auswahl: hier berechnet, zur Anfragezeit nur gelesen
+    sentence_cache = EmbeddingCache(SENTENCE_CACHE_FILE) if context.dedup_mode() == "embedding" else None
+    kept_ids: List[int] = []
+    file_hashes: Dict[str, str] = {}
+    counts = {"new": 0, "embedded": 0, "cache_hits": 0, "pii": 0}
+
+    def process(batch: List[Tuple[Dict, bool]]) -> None:
+        # PII einmal je Chunk erkennen (neue Chunks und Altbestand ohne Spans)
+        needs_pii = [rec for rec, _ in batch if rec.get("pii") is None]
+        for rec, spans in zip(needs_pii, detect_spans_many([rec["text"] for rec in needs_pii])):
+            rec["pii"] = spans
+        to_embed = [rec for rec, embed in batch if embed]
+        if to_embed:
+            embeddings, hits = encode_with_cache(get_model(), MODEL_NAME, [rec["text"] for rec in to_embed], cache)
+            # Cosine-Similarity via L2-Norm-Normalize + inner product
+            faiss.normalize_L2(embeddings)
+            vectors.add(embeddings, np.asarray([rec["id"] for rec in to_embed], dtype="int64"))
+            counts["cache_hits"] += hits
+        if sentence_cache is not None:
+            sentences = [rec["text"][start:end] for rec, _ in batch
+                         for start, end in context.split_sentences(rec["text"], rec["pii"], rec.get("title") or "")]
+            encode_with_cache(get_model(), MODEL_NAME, list(dict.fromkeys(sentences)), sentence_cache)
+        for rec, _ in batch:
+            writer.add(rec)
+            lexical.add(rec)
+            kept_ids.append(rec["id"])
+        counts["embedded"] += len(to_embed)
+        counts["pii"] += len(needs_pii)
+        stats.batch_done(len(to_embed))
+
+    def emit(rec: Dict, embed: bool) -> None:
+        if batcher.add((rec, embed), len(rec["text"])):
+            process(batcher.take())
+
+    try:
+        for fname, file_hash, size, md_chunks in ingest.iter_chunked_files(
+                DOCS_DIR, files, ingest.workers(), budget // 4):
+            stats.file_done(size, len(md_chunks))
+            file_hashes[fname] = file_hash
+            rows = old_rows.get(fname, ())
+            if len(rows) and old_files.get(fname) == file_hash:
+                for pos in rows:  # Datei unverändert
+                    rec = old_store.at(int(pos))
+                    if reset_pii:
+                        rec["pii"] = None
+                    emit(rec, rebuild)
+                continue
+
+            # Unveränderte Chunks einer geänderten Datei behalten ihre ID (und ihren Vektor)
+            reusable = {}
+            for pos in rows:
+                rec = old_store.at(int(pos))
+                reusable[rec["hash"]] = rec
+            for i, (title, chunk_text) in enumerate(md_chunks):
+                chunk_hash = text_hash(chunk_text)
+                prev = reusable.pop(chunk_hash, None)
+                rec = {
+                    "id": prev["id"] if prev else next_id,
+                    "source": fname,
+                    "chunk_id": i,
+                    "title": title,
+                    "text": chunk_text,
+                    "hash": chunk_hash,
+                    # gleicher Text -> gleiche Spans
+                    "pii": prev.get("pii") if prev and not reset_pii else None,
+                }
+                if prev is None:
+                    next_id += 1
+                    counts["new"] += 1
+                emit(rec, rebuild or prev is None)
+        if batcher.items:
+            process(batcher.take())
+    finally:
+        cache.close()
+        if sentence_cache is not None:
+            sentence_cache.close()
+
+    removed_ids = np.setdiff1d(old_store.ids, np.asarray(kept_ids, dtype="int64")) if old_store is not None else []
+    index = vectors.finish()
+    if index is None:
+        raise RuntimeError("Keine Chunks mit Text gefunden.")
+    if len(removed_ids):
+        if index_factory.supports_remove(index):
+            index.remove_ids(np.asarray(removed_ids, dtype="int64"))
         else:
-            final_chunks.append(("", body))
-    return final_chunks
+            print("[INFO] Indextyp unterstützt kein Entfernen – Neuaufbau aus dem Embedding-Cache.")
+            index = None
 
+    generation = _begin_generation()
+    n_chunks = writer.close()
+    if index is None:
+        index = _index_from_store(ChunkStore.open(INDEX_DIR), index_type, budget)
+    tmp_index = INDEX_FILE.with_name(INDEX_FILE.name + ".tmp")
+    index_factory.write_index(index, str(tmp_index))
+    os.replace(tmp_index, INDEX_FILE)
+    bm25 = lexical.finish()
+    bm25.save(INDEX_DIR)
+    if MAPPING_FILE.exists():
+        MAPPING_FILE.unlink()  # Altformat, ersetzt durch chunks.*
+    _atomic_write(MANIFEST_FILE, json.dumps({
+        "model": MODEL_NAME,
+        "index_type": index_type,
+        "pii_model": _pii_model(),
+        "files": file_hashes,
+    }, ensure_ascii=False, indent=2).encode("utf-8"))
+    _commit_generation(generation)
+    print(f"[INFO] Index ({index_factory.describe(index)}) gespeichert: {INDEX_FILE}, Chunks: {INDEX_DIR / chunk_store.META_NAME}")
+    print(f"[INFO] {n_chunks} Chunks, {counts['new']} neu/geändert, {len(removed_ids)} entfernt; "
+          f"Embeddings: {counts['cache_hits']} aus Cache, {counts['embedded'] - counts['cache_hits']} neu berechnet; "
+          f"PII-Erkennung für {counts['pii']} Chunks; BM25: {len(bm25.terms)} Terme.")
+    stats.report()
+    return stats.summary()
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Schreibt über eine temporäre Datei + os.replace, Leser sehen nie halbe Dateien."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def read_generation() -> Optional[Dict]:
+    """Generationsmarker: {"generation": n, "complete": bool, "ts": ...} oder None (Altbestand)."""
+    try:
+        return json.loads(GENERATION_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _begin_generation() -> int:
+    """Markiert einen laufenden Schreibvorgang, damit der Server keinen Mischstand lädt."""
+    prev = read_generation() or {}
+    generation = int(prev.get("generation", 0)) + 1
+    _atomic_write(GENERATION_FILE, json.dumps({"generation": generation, "complete": False}).encode("utf-8"))
+    return generation
+
+
+def _commit_generation(generation: int) -> None:
+    _atomic_write(GENERATION_FILE, json.dumps({
+        "generation": generation,
+        "complete": True,
+        "ts": time.time(),
+    }).encode("utf-8"))
+
+
+class IndexGeneration:
+    """
+    Ein geladener Stand aus Index + Chunk-Speicher + abgeleiteten Strukturen.
+    Wird nur als Ganzes ausgetauscht; eine laufende Suche hält ihre Referenz
+    und rechnet bis zum Ende auf demselben Stand.
+    """
 
-def ingest_docs() -> None:
-    """Lädt alle .md/.txt, erzeugt Embeddings und speichert FAISS-Index + Mapping."""
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    def __init__(self, index, chunks: ChunkStore, generation: int = 0, lexical: Optional[BM25Index] = None):
+        self.index = index
+        self.chunks = chunks
+        self.generation = generation
+        # BM25 über dieselben Chunks; fehlt er (Stand vor der Hybrid-Suche), wird er hier gebaut
+        self.lexical = lexical if lexical is not None else BM25Index.build(chunks)
+        # Vektor-IDs je Quelle (für ACL-Filter direkt im Index) + Cache der Sichten je Rollen-Freigabe
+        self.source_ids = chunks.source_ids()
+        self.acl_views: Dict[frozenset, AclView] = {}
+        self.lexical_masks: Dict[frozenset, Optional[np.ndarray]] = {}
+
+    def acl(self, allowed_sources: List[str]) -> "AclView":
+        key = frozenset(allowed_sources or [])
+        view = self.acl_views.get(key)
+        if view is None:
+            view = acl_view(self.index, self.source_ids, allowed_sources)
+            self.acl_views[key] = view
+        return view
+
+    def lexical_mask(self, allowed_sources: List[str]) -> Optional[np.ndarray]:
+        """Freigegebene BM25-Dokumentpositionen als Bitmaske (None = alles freigegeben)."""
+        key = frozenset(allowed_sources or [])
+        if key not in self.lexical_masks:
+            parts = [self.source_ids[s] for s in key if s in self.source_ids]
+            mask = None
+            if key and len(parts) < len(self.source_ids):
+                mask = np.zeros(len(self.lexical), dtype=bool)
+                if parts:
+                    mask[self.lexical.positions(np.concatenate(parts))] = True
+            self.lexical_masks[key] = mask
+        return self.lexical_masks[key]
+
+    def record(self, vector_id: int) -> Dict:
+        return self.chunks.get(int(vector_id))
+
+
+def _load_generation() -> Optional[IndexGeneration]:
+    """
+    Lädt Index + Chunk-Speicher konsistent. Während eines Ingests (oder wenn sich die
+    Generation beim Lesen geändert hat) wird None geliefert.
+    """
+    before = read_generation()
+    if before is not None and not before.get("complete"):
+        return None
+    if not INDEX_FILE.exists():
+        return None
+    index = index_factory.read_index(str(INDEX_FILE))
+    chunks = _load_chunks()
+    lexical = BM25Index.open(INDEX_DIR)
+    manifest = json.loads(MANIFEST_FILE.read_text(encoding="utf-8")) if MANIFEST_FILE.exists() else {}
+    if read_generation() != before or chunks is None or index.ntotal != len(chunks):
+        return None
+    if lexical is None or len(lexical) != len(chunks):
+        print("[INFO] BM25-Index fehlt oder passt nicht – wird im Speicher aufgebaut.")
+        lexical = None
+    # Spans eines anderen NER-Stands (z. B. Ingest ohne spaCy = nur Regex) nicht übernehmen,
+    # sonst gingen Namen unpseudonymisiert ans LLM; ohne Spans erkennt der Server je Anfrage
+    if chunks.spans is not None and manifest.get("pii_model") != _pii_model():
+        print(f"[WARN] PII-Spans im Index stammen von '{manifest.get('pii_model') or 'nur Regex'}', "
+              f"zur Laufzeit '{_pii_model() or 'nur Regex'}' – Spans werden verworfen, "
+              f"PII-Erkennung läuft je Anfrage (Neuaufbau mit python -m app.retriever).")
+        chunks.spans = None
+    return IndexGeneration(index, chunks, int((before or {}).get("generation", 0)), lexical)
+
+
+def current_generation(load: bool = True) -> Optional[IndexGeneration]:
+    """
+    Aktueller Indexstand; solange keiner geladen ist, wird bei jedem Aufruf einmal versucht
+    zu laden (außer load=False, z. B. für /metrics). Kein Warten: während eines Ingests
+    bleibt es bei None, den Stand holt dann der Index-Watcher beim nächsten Prüfen.
+    """
+    if _current is None and load:
+        reload_index()
+    return _current
 
-    docs: List[str] = []
-    mapping: List[Dict] = []
 
-    for fname in os.listdir(DOCS_DIR):
-        if not fname.lower().endswith((".md", ".txt")):
-            continue
-        path = DOCS_DIR / fname
-        text = path.read_text(encoding="utf-8")
-        # besseres Chunking:
-        md_chunks = _read_markdown_chunks(text)
-
-        # optional: kleine Slide-Window-Redundanz (überlappend) – hier nicht nötig
-        for i, (title, chunk_text) in enumerate(md_chunks):
-            docs.append(chunk_text)
-            mapping.append({
-                "source": fname,
-                "chunk_id": i,
-                "title": title,
-                "text": chunk_text
-            })
-
-    if not docs:
-        raise RuntimeError(f"Keine Dokumente unter {DOCS_DIR} gefunden.")
+def reload_index(force: bool = False) -> bool:
+    """
+    Lädt einen neuen Indexstand (z. B. im Hintergrund-Thread) und tauscht ihn
+    atomar aus. Liefert True, wenn getauscht wurde; ohne Index oder während eines
+    Ingests sofort False (ohne Wiederholung, die Sperre wird nie schlafend gehalten).
+    """
+    global _current
+    if not INDEX_FILE.exists():
+        return False
+    marker = read_generation()
+    if marker is not None and not marker.get("complete"):
+        return False
+    with _reload_lock:
+        marker = read_generation()
+        if (not force and _current is not None and marker is not None
+                and marker.get("generation") == _current.generation):
+            return False
+        gen = _load_generation()
+        if gen is None:
+            return False
+        _current = gen  # einzelne Zuweisung = atomarer Austausch
+    print(f"[INFO] Indexstand {gen.generation} geladen ({gen.index.ntotal} Vektoren).")
+    return True
+
+
+def start_index_watcher(interval: Optional[float] = None) -> Optional[threading.Thread]:
+    """
+    Prüft periodisch den Generationsmarker und lädt neue Stände im Hintergrund.
+    Intervall über RAG_INDEX_POLL_S (Sekunden, 0 = aus).
+    """
+    if interval is None:
+        interval = float(os.getenv("RAG_INDEX_POLL_S", "5"))
+    if interval <= 0:
+        return None
+
+    def _watch():
+        while True:
+            time.sleep(interval)
+            marker = read_generation()
+            if not marker or not marker.get("complete"):
+                continue
+            if _current is None or marker.get("generation") != _current.generation:
+                try:
+                    reload_index()
+                except Exception as exc:  # alter Stand bleibt aktiv
+                    print(f"[WARN] Neuladen des Index fehlgeschlagen: {exc}")
+
+    thread = threading.Thread(target=_watch, name="index-watcher", daemon=True)
+    thread.start()
+    return thread
 
-    model = get_model()
-    embeddings = model.encode(docs, convert_to_numpy=True, show_progress_bar=True)
-    # Cosine-Similarity via L2-Norm-Normalize + inner product
-    faiss.normalize_L2(embeddings)
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+def load_index():
+    gen = current_generation()
+    if gen is None:
+        return None, None
+    return gen.index, gen.chunks
 
-    faiss.write_index(index, str(INDEX_FILE))
-    MAPPING_FILE.write_text(json.dumps(mapping, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"[INFO] Index gespeichert: {INDEX_FILE}, Mapping: {MAPPING_FILE}")
 
+class AclView:
+    """
+    Freigegebener Ausschnitt des Index für eine Menge von Quellen.
+    Kleine Freigaben bekommen einen eigenen exakten Subindex (ANN-Indizes finden
+    bei sehr selektiven Filtern sonst oft zu wenige Treffer), größere werden per
+    ID-Selektor direkt im Hauptindex gefiltert.
+    """
 
-def load_index():
-    global _index, _mapping
-    if _index is None and INDEX_FILE.exists():
-        _index = faiss.read_index(str(INDEX_FILE))
-        _mapping = json.loads(MAPPING_FILE.read_text(encoding="utf-8"))
-    return _index, _mapping
+    def __init__(self, n_allowed: int, selector=None, sub_index=None, sub_ids=None):
+        self.n_allowed = n_allowed
+        self.selector = selector
+        self.sub_index = sub_index
+        self.sub_ids = sub_ids
+
+    def search(self, index, q_emb: np.ndarray, k: int,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        if self.sub_index is not None:
+            D, I = self.sub_index.search(q_emb, k)
+            return D, np.where(I >= 0, self.sub_ids[np.maximum(I, 0)], -1)
+        return dense_search(index, q_emb, k, self.selector, nprobe=nprobe, ef_search=ef_search)
+
+
+def acl_view(index, source_ids: Dict[str, np.ndarray], allowed_sources: List[str],
+             subindex_max: Optional[int] = None) -> AclView:
+    """Baut die AclView für die freigegebenen Quellen (leere Liste = keine Einschränkung)."""
+    total = sum(len(v) for v in source_ids.values())
+    if not allowed_sources:
+        return AclView(total)
+    parts = [source_ids[s] for s in allowed_sources if s in source_ids]
+    if not parts:
+        return AclView(0)
+    if len(parts) == len(source_ids):
+        # Rolle sieht alles -> Filter spart nichts, kostet nur Lookups
+        return AclView(total)
+    ids = np.concatenate(parts)
+    if subindex_max is None:
+        subindex_max = int(os.getenv("RAG_ACL_SUBINDEX_MAX", "4096"))
+    if len(ids) <= subindex_max:
+        sub = faiss.IndexFlatIP(index.d)
+        sub.add(index_factory.reconstruct_ids(index, ids))
+        return AclView(len(ids), sub_index=sub, sub_ids=ids)
+    return AclView(len(ids), selector=faiss.IDSelectorBatch(ids))
+
+
+def dense_search(index, q_emb: np.ndarray, k: int, selector=None,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """FAISS-Suche; mit Selektor werden nur die freigegebenen Vektoren bewertet."""
+    params = index_factory.search_params(index, selector, nprobe=nprobe, ef_search=ef_search)
+    return index.search(q_emb, k, params=params)
+
+
+def _get_query_cache() -> QueryEmbeddingCache:
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryEmbeddingCache(int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024")))
+    return _query_cache
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """
+    Normalisierte Anfrage-Embeddings (n x d); wiederholte Fragen kommen aus dem LRU-Cache,
+    alle übrigen werden in einem encode-Aufruf berechnet.
+    """
+    cache = _get_query_cache()
+    vecs: List[Optional[np.ndarray]] = [cache.get(MODEL_NAME, q) for q in queries]
+    missing = list(dict.fromkeys(q for q, v in zip(queries, vecs) if v is None))
+    if missing:
+        with metrics.span("encode"):
+            q_emb = np.asarray(get_query_model().encode(missing, convert_to_numpy=True), dtype="float32")
+            faiss.normalize_L2(q_emb)
+        fresh = dict(zip(missing, q_emb))
+        for q, vec in fresh.items():
+            cache.put(MODEL_NAME, q, vec)
+        vecs = [v if v is not None else fresh[q] for q, v in zip(queries, vecs)]
+    return np.stack(vecs).astype("float32")
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Normalisiertes Anfrage-Embedding (1 x d); wiederholte Fragen kommen aus dem LRU-Cache."""
+    return embed_queries([query])
 
 
-def _keyword_boost(text: str) -> float:
-    """Einfacher Keyword-Boost. Liefert Bonus zwischen 0.0 und 0.2 je nach Trefferanzahl."""
-    if not text:
-        return 0.0
-    hits = len(BOOST_RE.findall(text))
-    # saturiere den Boost; z.B. max 0.2
-    return min(0.04 * hits, 0.2)
+def query_cache_stats() -> Dict:
+    return _get_query_cache().stats()
 
 
-def search(query: str, allowed_sources: List[str], k: int = 3) -> List[Dict]:
+def search(query: str, allowed_sources: List[str], k: int = 3,
+           nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Dict]:
     """
-    Semantische Suche (FAISS) + Keyword-Boost.
-    Wir holen erst mehr Kandidaten (K'=8) und reranken lokal.
+    Hybrid-Suche: FAISS (semantisch) und BM25 (lexikalisch) nebeneinander, fusioniert
+    per RRF bzw. gewichteter Summe (RAG_HYBRID_FUSION). Die Rollen-Freigabe filtert
+    beide Seiten direkt (ID-Selektor bzw. Bitmaske), d. h. es werden nur erlaubte
+    Chunks bewertet. Je Seite K' Kandidaten; auch Chunks, die nur lexikalisch
+    passen, können so in die Top-k kommen.
+    nprobe/ef_search überschreiben die Suchparameter von IVF- bzw. HNSW-Indizes.
     """
-    index, mapping = load_index()
-    if index is None:
-        return []
-
-    model = get_model()
-    q_emb = model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
+    return search_many([query], [allowed_sources], k, nprobe=nprobe, ef_search=ef_search)[0]
 
-    K_PRIME = max(k * 2 + 2, 8)  # hole mehr Kandidaten
-    D, I = index.search(q_emb, K_PRIME)
 
-    cands: List[Dict] = []
-    for idx, score in zip(I[0], D[0]):
-        if idx == -1:
+def search_many(queries: List[str], allowed_sources: List[List[str]], k: int = 3,
+                nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[List[Dict]]:
+    """
+    Wie search() für viele Fragen (je Frage eigene Freigabe): ein encode-Aufruf für
+    alle Fragen, eine FAISS-Suche je Freigabe (Rolle) für alle ihre Fragen.
+    """
+    results: List[List[Dict]] = [[] for _ in queries]
+    gen = current_generation()
+    if gen is None or not queries:
+        return results
+
+    groups: Dict[frozenset, List[int]] = {}
+    for i, allowed in enumerate(allowed_sources):
+        groups.setdefault(frozenset(allowed or []), []).append(i)
+    views = {key: gen.acl(allowed_sources[rows[0]]) for key, rows in groups.items()}
+    todo = [i for key, rows in groups.items() if views[key].n_allowed > 0 for i in rows]
+    if not todo:
+        return results
+
+    q_embs = np.zeros((len(queries), gen.index.d), dtype="float32")
+    q_embs[todo] = embed_queries([queries[i] for i in todo])
+    for key, rows in groups.items():
+        acl = views[key]
+        if acl.n_allowed == 0:
             continue
-        hit = mapping[idx]
-        if allowed_sources and hit["source"] not in allowed_sources:
+        K_PRIME = min(max(k * 2 + 2, 8), acl.n_allowed)  # hole mehr Kandidaten
+        # komprimierte Vektoren (sq8/binary): mehr Kandidaten holen, mit float32 neu bewerten
+        factor = index_factory.rescore_factor(gen.index)
+        fetch = min(K_PRIME * factor, acl.n_allowed)
+        with metrics.span("index_search"):
+            D, I = acl.search(gen.index, q_embs[rows], fetch, nprobe=nprobe, ef_search=ef_search)
+        if factor > 1:
+            with metrics.span("rescore"):
+                D, I = _rescore(gen, q_embs[rows], D, I, K_PRIME)
+        with metrics.span("bm25_fusion"):
+            for row, i in enumerate(rows):
+                results[i] = _fuse(gen, queries[i], allowed_sources[i], D[row], I[row], K_PRIME, k)
+    return results
+
+
+def _rescore(gen: IndexGeneration, q_embs: np.ndarray, D: np.ndarray, I: np.ndarray,
+             k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Kandidaten mit den float32-Embeddings aus dem Embedding-Cache exakt bewerten und
+    die besten k behalten. Fehlt ein Vektor im Cache, bleibt der Index-Score.
+    """
+    ids = np.unique(I[I >= 0])
+    hashes = gen.chunks.text_hashes(ids)
+    found = cached_embeddings(hashes)
+    vecs = np.zeros((len(ids), q_embs.shape[1]), dtype="float32")
+    have = np.zeros(len(ids), dtype=bool)
+    for j, h in enumerate(hashes):
+        if h in found:
+            vecs[j], have[j] = found[h], True
+    vecs[have] /= np.linalg.norm(vecs[have], axis=1, keepdims=True)
+    valid = I >= 0
+    pos = np.where(valid, np.searchsorted(ids, I), 0)
+    scores = np.empty(I.shape, dtype="float32")
+    for row in range(len(I)):
+        scores[row] = vecs[pos[row]] @ q_embs[row]
+    scores = np.where(have[pos], scores, D)
+    scores[~valid] = -np.inf
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    D_out = np.take_along_axis(scores, order, axis=1)
+    I_out = np.where(np.isfinite(D_out), np.take_along_axis(I, order, axis=1), -1)
+    return D_out, I_out
+
+
+def _fuse(gen: IndexGeneration, query: str, allowed_sources: List[str], D: np.ndarray, I: np.ndarray,
+          K_PRIME: int, k: int) -> List[Dict]:
+    """Dichte Kandidaten einer Frage mit BM25 fusionieren und die Top-k als Treffer aufbereiten."""
+    cosine: Dict[int, float] = {}
+    for idx, score in zip(I, D):
+        if idx == -1:
             continue
-        text = hit["text"]
-        bonus = _keyword_boost(text)
-        hybrid = float(score) + bonus
-        cands.append({
+        if allowed_sources and gen.chunks.source(int(idx)) not in allowed_sources:
+            continue  # Absicherung, sollte durch den Selektor nie greifen
+        cosine[int(idx)] = float(score)
+    dense_rank = list(cosine)  # FAISS liefert absteigend sortiert
+
+    fusion = _fusion()
+    bm25: Dict[int, float] = {}
+    lexical_rank: List[int] = []
+    if fusion != "off":
+        lex_ids, lex_scores, all_scores = gen.lexical.search(query, K_PRIME, gen.lexical_mask(allowed_sources))
+        lexical_rank = [int(i) for i in lex_ids]
+        bm25 = dict(zip(lexical_rank, map(float, lex_scores)))
+        # BM25 auch für rein dichte Kandidaten exakt (liegt ohnehin schon vor)
+        dense_only = [i for i in dense_rank if i not in bm25]
+        if dense_only:
+            for i, score in zip(dense_only, all_scores[gen.lexical.positions(dense_only)]):
+                bm25[i] = float(score)
+
+    fused: Dict[int, float] = {}
+    if fusion == "rrf":
+        rrf_k = _rrf_k()
+        for ranking in (dense_rank, lexical_rank):
+            for rank, idx in enumerate(ranking, start=1):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank)
+    elif fusion == "weighted":
+        w = _bm25_weight()
+        bm25_max = max(bm25.values(), default=0.0) or 1.0
+        # Rein lexikalische Kandidaten lagen unter der dichten Top-K'-Grenze: deren
+        # niedrigster Cosinus ist eine obere Schranke, statt Vektoren nachzuladen.
+        floor = min(cosine.values(), default=0.0)
+        for idx in dict.fromkeys(dense_rank + lexical_rank):
+            fused[idx] = (1 - w) * cosine.get(idx, floor) + w * bm25.get(idx, 0.0) / bm25_max
+    else:
+        fused = dict(cosine)
+
+    cands = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+    hits: List[Dict] = []
+    for idx, hybrid in cands[:k]:
+        hit = gen.record(idx)
+        hits.append({
             "source": hit["source"],
             "chunk_id": hit["chunk_id"],
             "title": hit.get("title"),
-            "text": text,
-            "score_cosine": float(score),
+            "text": hit["text"],
+            "pii": hit.get("pii"),  # beim Ingest erkannte PII-Spans (None = Altbestand)
+            "score_cosine": cosine.get(idx),  # None: nur lexikalisch gefunden
+            "score_bm25": bm25.get(idx),
             "score_hybrid": hybrid
         })
-
-    # Rerank nach hybrid score
-    cands.sort(key=lambda x: x["score_hybrid"], reverse=True)
-    return cands[:k]
+    return hits
 
 
 if __name__ == "__main__":
-    ingest_docs()
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Dokumente indexieren")
+    parser.add_argument("--index-type", choices=index_factory.INDEX_TYPES, default=None,
+                        help="FAISS-Indextyp (Standard: RAG_INDEX_TYPE bzw. flat)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="nur geänderte Dokumente/Chunks neu einbetten")
+    args = parser.parse_args()
+    ingest_docs(index_type=args.index_type, incremental=args.incremental)
@@ -0,0 +1,98 @@
+# bench/acl_search.py
+"""
+Benchmark: ACL-Filter im Index (ID-Selektor / Subindex) vs. Nachfilterung der Top-K'.
+
+Misst je Rolle und Korpusgröße Recall@k gegenüber einer exakten Suche über
+die freigegebenen Vektoren sowie die Latenz pro Anfrage.
+
+    python -m bench.acl_search --sizes 1000 10000 100000 --k 3 [--index-type hnsw]
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app import index_factory, retriever
+from app.chunk_store import ChunkStore
+from bench.synthetic import make_mapping, make_queries, make_roles, make_vectors
+
+ROLE_SHARES = {"Sachbearbeiter": 1.0, "Teamleitung": 0.3, "Azubi": 0.05, "Praktikant": 0.01}
+
+
+def _ground_truth(x: np.ndarray, q: np.ndarray, allowed_ids: np.ndarray, k: int) -> List[set]:
+    scores = q @ x[allowed_ids].T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [set(allowed_ids[row].tolist()) for row in top]
+
+
+def _post_filter(index, mapping, q, allowed: set, k: int) -> List[int]:
+    k_prime = max(k * 2 + 2, 8)
+    _, I = index.search(q, k_prime)
+    return [int(i) for i in I[0] if i != -1 and mapping[i]["source"] in allowed][:k]
+
+
+def _with_acl(index, q, acl: retriever.AclView, k: int) -> List[int]:
+    k_prime = min(max(k * 2 + 2, 8), acl.n_allowed)
+    _, I = acl.search(index, q, k_prime)
+    return [int(i) for i in I[0] if i != -1][:k]
+
+
+def run(size: int, k: int, n_queries: int, dim: int, index_type: str = "flat") -> List[Dict]:
+    x = make_vectors(size, dim=dim)
+    mapping = make_mapping(size)
+    queries = make_queries(n_queries, dim=dim)
+    index = index_factory.build_index(dim, size, index_type)
+    index_factory.train_and_add(index, x)
+    source_ids = ChunkStore.from_records(mapping).source_ids()
+
+    rows = []
+    for role, sources in make_roles(mapping, ROLE_SHARES).items():
+        views = {
+            "selector": retriever.acl_view(index, source_ids, sources, subindex_max=0),
+            "subindex": retriever.acl_view(index, source_ids, sources, subindex_max=size),
+        }
+        n_allowed = views["selector"].n_allowed
+        allowed_ids = np.concatenate([source_ids[s] for s in sources])
+        gt = _ground_truth(x, queries, allowed_ids, k)
+        allowed = set(sources)
+        denom = min(k, n_allowed)
+
+        for method in ("post_filter", "selector", "subindex"):
+            recall, n_short, t0 = 0.0, 0, time.perf_counter()
+            for qi in range(n_queries):
+                q = queries[qi:qi + 1]
+                if method == "post_filter":
+                    got = _post_filter(index, mapping, q, allowed, k)
+                else:
+                    got = _with_acl(index, q, views[method], k)
+                recall += len(set(got) & gt[qi]) / denom
+                n_short += len(got) < denom
+            elapsed = time.perf_counter() - t0
+            rows.append({
+                "size": size, "role": role, "allowed": n_allowed, "method": method,
+                "recall_at_k": recall / n_queries,
+                "short_results": n_short / n_queries,
+                "latency_ms": 1000 * elapsed / n_queries,
+            })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--k", type=int, default=3)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--index-type", choices=index_factory.INDEX_TYPES, default="flat")
+    args = ap.parse_args()
+
+    print(f"{'size':>8} {'role':<15} {'allowed':>8} {'method':<12} {'recall@k':>9} {'<k hits':>8} {'ms/query':>9}")
+    for size in args.sizes:
+        for r in run(size, args.k, args.queries, args.dim, args.index_type):
+            print(f"{r['size']:>8} {r['role']:<15} {r['allowed']:>8} {r['method']:<12} "
+                  f"{r['recall_at_k']:>9.3f} {r['short_results']:>8.1%} {r['latency_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
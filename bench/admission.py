@@ -0,0 +1,132 @@
+# bench/admission.py
+"""
+Prüft Zulassungssteuerung und Single-Flight der LLM-Stufe (app.llm) gegen den
+OpenAI-Stub im selben Prozess (bench.fake_openai):
+
+- volle Warteschlange: der nächste Aufruf wird sofort mit 429 abgelehnt
+- Wartezeit überschritten (RAG_LLM_QUEUE_TIMEOUT_S): 503
+- identische gleichzeitige Prompts (complete und stream_llm): genau ein Upstream-Aufruf
+- bricht der erste Aufrufer ab, bekommen die übrigen trotzdem die Antwort
+
+Jedes Szenario läuft in einer eigenen Event-Loop, damit die Grenzen aus den
+RAG_LLM_*-Variablen neu gelesen werden. Exit-Code 1, wenn eine Prüfung fehlschlägt.
+
+    python -m bench.admission --first-token-ms 300 --token-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Dict, List, Tuple
+
+from bench.fake_openai import create_app
+from bench.load import _free_port, _serve
+
+CONTEXTS = ["Nach der Bewilligung erfolgt die Auszahlung in der Regel innerhalb von 2–3 Bankarbeitstagen."]
+
+
+def _limits(concurrency: int, queue: int, timeout_s: float) -> None:
+    os.environ["RAG_LLM_MAX_CONCURRENCY"] = str(concurrency)
+    os.environ["RAG_LLM_MAX_QUEUE"] = str(queue)
+    os.environ["RAG_LLM_QUEUE_TIMEOUT_S"] = str(timeout_s)
+
+
+async def _outcomes(coros) -> List[str]:
+    """Je Aufruf "ok" oder der HTTP-Status der Ablehnung."""
+    from app import llm
+
+    out = []
+    for result in await asyncio.gather(*coros, return_exceptions=True):
+        if isinstance(result, llm.Overloaded):
+            out.append(str(result.status_code))
+        elif isinstance(result, BaseException):
+            out.append(type(result).__name__)
+        else:
+            out.append("ok")
+    return out
+
+
+async def _queue_full() -> List[str]:
+    from app import llm
+
+    # 1 läuft, 1 wartet, der dritte findet die Warteschlange voll vor
+    return await _outcomes([llm.complete(f"Frage {i}", CONTEXTS) for i in range(3)])
+
+
+async def _queue_timeout() -> List[str]:
+    from app import llm
+
+    # der zweite wartet länger als RAG_LLM_QUEUE_TIMEOUT_S auf den einzigen Platz
+    return await _outcomes([llm.complete(f"Frage {i}", CONTEXTS) for i in range(2)])
+
+
+async def _single_flight(n: int) -> Tuple[List[str], int]:
+    from app import llm
+
+    async def read_stream() -> str:
+        return "".join([fragment async for fragment in llm.stream_llm("Gleiche Frage (Stream)", CONTEXTS)])
+
+    outcomes = await _outcomes([llm.complete("Gleiche Frage", CONTEXTS) for _ in range(n)]
+                               + [read_stream() for _ in range(n)])
+    return outcomes, llm._state().coalesced
+
+
+async def _leader_cancelled() -> List[str]:
+    from app import llm
+
+    leader = asyncio.ensure_future(llm.complete("Abgebrochene Frage", CONTEXTS))
+    follower = asyncio.ensure_future(llm.complete("Abgebrochene Frage", CONTEXTS))
+    await asyncio.sleep(0.05)
+    leader.cancel()
+    return await _outcomes([follower])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--first-token-ms", type=float, default=300.0)
+    ap.add_argument("--token-ms", type=float, default=5.0)
+    ap.add_argument("--parallel", type=int, default=10, help="gleichzeitige identische Prompts je Variante")
+    args = ap.parse_args()
+
+    stub_port = _free_port()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    stub = create_app(args.first_token_ms, args.token_ms)
+    _serve(stub, stub_port)
+    upstream_s = (args.first_token_ms + args.token_ms * 40) / 1000
+
+    checks: List[Tuple[str, bool, Dict]] = []
+
+    _limits(1, 1, upstream_s * 10)
+    outcomes = asyncio.run(_queue_full())
+    checks.append(("429 bei voller Warteschlange", sorted(outcomes) == ["429", "ok", "ok"],
+                   {"outcomes": outcomes}))
+
+    _limits(1, 4, upstream_s / 10)
+    outcomes = asyncio.run(_queue_timeout())
+    checks.append(("503 nach Wartezeit", outcomes == ["ok", "503"], {"outcomes": outcomes}))
+
+    _limits(8, 32, upstream_s * 10)
+    calls = stub.state.calls
+    outcomes, coalesced = asyncio.run(_single_flight(args.parallel))
+    upstream = stub.state.calls - calls
+    checks.append(("Single-Flight: ein Upstream-Aufruf je Prompt",
+                   outcomes == ["ok"] * (2 * args.parallel) and upstream == 2
+                   and coalesced == 2 * (args.parallel - 1),
+                   {"upstream_calls": upstream, "coalesced": coalesced}))
+
+    calls = stub.state.calls
+    outcomes = asyncio.run(_leader_cancelled())
+    upstream = stub.state.calls - calls
+    checks.append(("Abbruch des ersten Aufrufers", outcomes == ["ok"] and upstream == 1,
+                   {"outcomes": outcomes, "upstream_calls": upstream}))
+
+    print(f"LLM-Stub: erstes Token {args.first_token_ms:.0f} ms, je Token {args.token_ms:.0f} ms")
+    for name, ok, detail in checks:
+        print(f"[{'OK' if ok else 'FEHLER'}] {name}: {detail}")
+    if not all(ok for _, ok, _ in checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
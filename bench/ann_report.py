@@ -0,0 +1,100 @@
+# bench/ann_report.py
+"""
+Recall-vs-Latenz-Report der Indextypen gegenüber dem exakten flachen Index.
+
+Für jeden Indextyp werden die Suchparameter (nprobe bzw. efSearch) durchgefahren
+und Recall@k, Latenz pro Anfrage, Build-Zeit und Indexgröße ausgegeben. fp16, sq8
+und binary haben keine Suchparameter und erscheinen ohne Neubewertung (die misst
+bench.quantization).
+
+    python -m bench.ann_report --size 50000 --k 10
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from app import index_factory
+from bench.synthetic import make_queries, make_vectors
+
+SWEEPS = {
+    "flat": [None],
+    "ivf_flat": [1, 4, 16, 64],
+    "ivf_pq": [1, 4, 16, 64],
+    "hnsw": [16, 32, 64, 128],
+    "fp16": [None],
+    "sq8": [None],
+    "binary": [None],
+}
+
+
+def _recall(I: np.ndarray, gt: np.ndarray, k: int) -> float:
+    return float(np.mean([len(set(a[:k]) & set(b[:k])) / k for a, b in zip(I, gt)]))
+
+
+def _size_mb(index) -> float:
+    """Größe wie auf der Platte (binary wird nicht über faiss.serialize_index geschrieben)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.index")
+        index_factory.write_index(index, path)
+        return os.path.getsize(path) / 1e6
+
+
+def run(size: int, k: int, n_queries: int, dim: int, types: List[str]) -> List[Dict]:
+    x = make_vectors(size, dim=dim)
+    q = make_queries(n_queries, dim=dim)
+    flat = faiss.IndexFlatIP(dim)
+    flat.add(x)
+    _, gt = flat.search(q, k)
+
+    rows = []
+    for index_type in types:
+        t0 = time.perf_counter()
+        index = index_factory.build_index(dim, size, index_type)
+        index_factory.train_and_add(index, x)
+        build_s = time.perf_counter() - t0
+        size_mb = _size_mb(index)
+        kind = index_factory.describe(index)
+
+        for value in SWEEPS[kind]:
+            kwargs = {"nprobe": value} if kind.startswith("ivf") else {"ef_search": value}
+            params = index_factory.search_params(index, **kwargs)
+            I = np.empty((n_queries, k), dtype="int64")
+            t0 = time.perf_counter()
+            for i in range(n_queries):  # Einzelanfragen wie im Server
+                _, I[i:i + 1] = index.search(q[i:i + 1], k, params=params)
+            latency_ms = 1000 * (time.perf_counter() - t0) / n_queries
+            rows.append({
+                "index_type": kind,
+                "param": "-" if value is None else f"{next(iter(kwargs))}={value}",
+                "recall_at_k": _recall(I, gt, k),
+                "latency_ms": latency_ms,
+                "build_s": build_s,
+                "size_mb": size_mb,
+            })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=50000)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--types", nargs="+", choices=index_factory.INDEX_TYPES, default=list(index_factory.INDEX_TYPES))
+    args = ap.parse_args()
+
+    faiss.omp_set_num_threads(int(os.getenv("OMP_NUM_THREADS", "1")))
+    print(f"Korpus: {args.size} Vektoren, dim={args.dim}, k={args.k}")
+    print(f"{'index':<9} {'param':<14} {'recall@k':>9} {'ms/query':>9} {'build s':>8} {'MB':>8}")
+    for r in run(args.size, args.k, args.queries, args.dim, args.types):
+        print(f"{r['index_type']:<9} {r['param']:<14} {r['recall_at_k']:>9.3f} {r['latency_ms']:>9.3f} "
+              f"{r['build_s']:>8.2f} {r['size_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# bench/audit_store.py
+"""
+Benchmark: Audit-Suche im SQLite-Speicher gegenüber dem Durchsuchen von audit.log.
+
+Erzeugt ein synthetisches Audit-Log (Einträge über 90 Tage, mehrere Rollen und
+Dokumente), misst das Befüllen (Einträge/s, Größe) und die Latenz typischer
+Compliance-Abfragen – erste Seite und eine tiefe Seite per Cursor – gegen einen
+linearen Durchlauf über die JSON-Lines-Datei (wie grep + jq).
+
+    python -m bench.audit_store --entries 1000000
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from app.audit_store import AuditStore
+
+ROLES = ["Sachbearbeiter", "Azubi", "Teamleiter", "Revision", "Gast"]
+DOCS = ["Auszahlung.md", "Schulung_Auszahlung.md"] + [f"Dokument_{i:02d}.md" for i in range(30)]
+START = datetime.datetime(2026, 7, 1)
+
+
+def _write_log(path: str, n: int) -> None:
+    rng = np.random.default_rng(0)
+    seconds = np.sort(rng.integers(0, 90 * 86400 * 1000, size=n)) / 1000
+    roles = rng.integers(0, len(ROLES), size=n)
+    docs = rng.integers(0, len(DOCS), size=(n, 2))
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            entry = {
+                "ts": (START + datetime.timedelta(seconds=float(seconds[i]))).isoformat(),
+                "user_role": ROLES[roles[i]],
+                "question": f"Frage {i}: Wie lange dauert die Auszahlung im Fall {i % 977}?",
+                "answer_masked": "Die Auszahlung erfolgt in der Regel innerhalb von 2–3 Bankarbeitstagen.",
+                "sources": [{"document": DOCS[d], "chunk_id": int(d) % 7, "title": "Fristen"} for d in docs[i]],
+            }
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _scan(path: str, match: Callable[[Dict], bool], limit: int) -> List[Dict]:
+    """Referenz: ganze Datei lesen und filtern (neueste zuerst wie die API)."""
+    hits = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if match(entry):
+                hits.append(entry)
+    return hits[::-1][:limit]
+
+
+def _ms(fn: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(float(np.median(times)) * 1000, 2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--entries", type=int, default=1000000)
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--pages", type=int, default=20, help="Seiten, die für die 'tiefe Seite' geblättert werden")
+    ap.add_argument("--no-scan", action="store_true", help="linearen Durchlauf auslassen")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="rag-audit-store-")
+    try:
+        log = os.path.join(tmp, "audit.log")
+        t0 = time.perf_counter()
+        _write_log(log, args.entries)
+        print(f"{args.entries} Einträge erzeugt ({os.path.getsize(log) / 1e6:.0f} MB) in {time.perf_counter() - t0:.1f} s")
+
+        store = AuditStore(os.path.join(tmp, "audit.sqlite"))
+        t0 = time.perf_counter()
+        added = store.sync(tmp)
+        ingest_s = time.perf_counter() - t0
+        db_mb = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp) if f.startswith("audit.sqlite")) / 1e6
+        t0 = time.perf_counter()
+        store.sync(tmp)
+        resync_ms = (time.perf_counter() - t0) * 1000
+        print(f"Befüllen: {added} Einträge in {ingest_s:.1f} s ({added / ingest_s:.0f}/s), DB {db_mb:.0f} MB; "
+              f"erneuter Sync ohne neue Zeilen {resync_ms:.1f} ms")
+
+        week = (START + datetime.timedelta(days=83)).date().isoformat()
+        queries = [
+            ("Rolle + Dokument + letzte Woche", {"user_role": "Azubi", "document": "Auszahlung.md", "since": week},
+             lambda e: e["user_role"] == "Azubi" and e["ts"] >= week
+             and any(s["document"] == "Auszahlung.md" for s in e["sources"])),
+            ("Rolle", {"user_role": "Revision"}, lambda e: e["user_role"] == "Revision"),
+            ("Dokument", {"document": "Dokument_07.md"},
+             lambda e: any(s["document"] == "Dokument_07.md" for s in e["sources"])),
+            ("Zeitraum (1 Tag)", {"since": "2026-08-15", "until": "2026-08-16"},
+             lambda e: "2026-08-15" <= e["ts"] < "2026-08-16"),
+        ]
+        print(f"\n{'Abfrage':>32} {'Seite 1':>9} {'Seite ' + str(args.pages):>9} {'Scan':>9}  (ms, {args.limit} je Seite)")
+        for name, filters, match in queries:
+            first = store.search(limit=args.limit, **filters)
+            cursor = first["next_cursor"]
+            for _ in range(args.pages - 2):
+                cursor = cursor and store.search(limit=args.limit, cursor=cursor, **filters)["next_cursor"]
+            page1 = _ms(lambda: store.search(limit=args.limit, **filters), 5)
+            deep = _ms(lambda: store.search(limit=args.limit, cursor=cursor, **filters), 5) if cursor else float("nan")
+            scan = float("nan")
+            if not args.no_scan:
+                scan = _ms(lambda: _scan(log, match, args.limit), 1)
+                ids = [e["question"] for e in first["items"]]
+                assert ids == [e["question"] for e in _scan(log, match, args.limit)], name
+            print(f"{name:>32} {page1:>9} {deep:>9} {scan:>9}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
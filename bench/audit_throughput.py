@@ -0,0 +1,155 @@
+# bench/audit_throughput.py
+"""
+Benchmark: Durchsatz mit und ohne Audit-Log.
+
+1. Writer allein: Einträge/s mit mehreren Threads – altes Verfahren (Datei je Eintrag
+   öffnen, anhängen, schließen) gegen AuditWriter mit RAG_AUDIT_FSYNC off/batch/always.
+2. Ende-zu-Ende: Anfragen/s auf /api/query_stream (pace=0, sofortiges LLM,
+   synthetischer Korpus wie in bench.stream_latency) mit gleichzeitig laufenden
+   Anfragen – Audit aus, alt, synchron mit Sperre (RAG_AUDIT_ASYNC=0) und asynchron.
+
+    python -m bench.audit_throughput --entries 20000 --requests 400 --concurrency 16
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Dict
+
+import httpx
+
+from app import audit, llm
+from app import main as server
+from bench.stream_latency import _install_corpus, _instant_llm
+
+ENTRY = {"user_role": "Sachbearbeiter", "question": "Wie lange dauert die Auszahlung?",
+         "answer_masked": "Die Auszahlung erfolgt in der Regel innerhalb von 2–3 Bankarbeitstagen. " * 3,
+         "sources": [{"document": "Auszahlung.md", "chunk_id": 3, "title": "Fristen"}]}
+
+
+def _legacy_write(path: str, entry: Dict) -> None:
+    """Verhalten vor dem AuditWriter."""
+    entry = {"ts": datetime.datetime.now().isoformat(), **entry}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _count_lines(directory: str) -> int:
+    with open(os.path.join(directory, "audit.log"), encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def _bench_writer(name: str, n: int, threads: int, make: Callable) -> Dict:
+    directory = tempfile.mkdtemp(prefix="rag-audit-")
+    path = os.path.join(directory, "audit.log")
+    write, done = make(path)
+    per_thread = n // threads
+
+    def run():
+        for _ in range(per_thread):
+            write(ENTRY)
+
+    t0 = time.perf_counter()
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    t_return = time.perf_counter() - t0
+    done()  # bis alles auf der Platte ist
+    t_total = time.perf_counter() - t0
+    lines = _count_lines(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    return {"name": name, "per_s": round(per_thread * threads / t_total), "return_s": round(t_return, 3),
+            "total_s": round(t_total, 3), "lines": lines}
+
+
+def _writer_suite(n: int, threads: int) -> None:
+    def legacy(path):
+        return (lambda e: _legacy_write(path, e)), (lambda: None)
+
+    def async_writer(fsync):
+        def make(path):
+            w = audit.AuditWriter(path, fsync=fsync, max_bytes=0)
+            return (lambda e: w.write({"ts": datetime.datetime.now().isoformat(), **e})), w.close
+        return make
+
+    print(f"\nWriter allein: {n} Einträge aus {threads} Threads")
+    print(f"{'Verfahren':>22} {'Einträge/s':>11} {'Rückkehr s':>11} {'gesamt s':>9} {'Zeilen':>7}")
+    for name, make in (("alt (open/append)", legacy), ("async fsync=off", async_writer("off")),
+                       ("async fsync=batch", async_writer("batch")),
+                       ("async fsync=always", async_writer("always"))):
+        r = _bench_writer(name, n, threads, make)
+        print(f"{r['name']:>22} {r['per_s']:>11} {r['return_s']:>11} {r['total_s']:>9} {r['lines']:>7}")
+
+
+async def _requests_per_s(n: int, concurrency: int) -> float:
+    params = {"question": "Wie lange dauert die Auszahlung?", "user_role": "Sachbearbeiter",
+              "mode": "pseudonymize", "pace": 0}
+    limit = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with limit:
+                r = await client.get("/api/query_stream", params=params)
+                assert "event: final" in r.text
+
+        await asyncio.gather(*(one() for _ in range(min(concurrency, n))))  # Aufwärmen
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        return n / (time.perf_counter() - t0)
+
+
+def _e2e_suite(chunks: int, n: int, concurrency: int) -> None:
+    _install_corpus(chunks)
+    llm.stream_llm = _instant_llm
+    original = server.write_audit_log
+    modes = (
+        ("aus", lambda entry: None, {}),
+        ("alt (open/append)", lambda entry: _legacy_write(os.path.join(server.LOG_DIR, "audit.log"), entry), {}),
+        ("synchron + Sperre", original, {"RAG_AUDIT_ASYNC": "0"}),
+        ("async fsync=off", original, {"RAG_AUDIT_FSYNC": "off"}),
+        ("async fsync=batch", original, {"RAG_AUDIT_FSYNC": "batch"}),
+        ("async fsync=always", original, {"RAG_AUDIT_FSYNC": "always"}),
+    )
+    print(f"\nEnde-zu-Ende: {n} Anfragen, {concurrency} gleichzeitig, {chunks} Chunks")
+    print(f"{'Audit':>22} {'Anfragen/s':>11} {'vs. aus':>8}")
+    base = None
+    try:
+        for name, writer, env in modes:
+            server.LOG_DIR = tempfile.mkdtemp(prefix="rag-bench-")
+            os.environ.update(env)
+            server.write_audit_log = writer
+            try:
+                rps = asyncio.run(_requests_per_s(n, concurrency))
+            finally:
+                audit.close()
+                for key in env:
+                    os.environ.pop(key, None)
+                shutil.rmtree(server.LOG_DIR, ignore_errors=True)
+            base = base or rps
+            print(f"{name:>22} {rps:>11.1f} {rps / base:>8.0%}")
+    finally:
+        server.write_audit_log = original
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--entries", type=int, default=20000, help="Einträge für den Writer-Test")
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--chunks", type=int, default=10000)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    _writer_suite(args.entries, args.threads)
+    _e2e_suite(args.chunks, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench/chunk_store.py
+"""
+Benchmark: mapping.json (voll geparst) vs. gemappter Chunk-Speicher.
+
+Misst je Format Ladezeit, RSS-Zuwachs und anonymen (nicht teilbaren) Speicher
+sowie die Zugriffslatenz auf einen Chunk-Text, jeweils in einem frischen Prozess.
+Gemappte Dateiseiten zählen zum RSS, liegen aber nur einmal im Page-Cache.
+
+    python -m bench.chunk_store --chunks 200000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.chunk_store import ChunkStore, ChunkStoreWriter
+from bench.synthetic import make_markdown
+
+FORMATS = ("mapping.json", "chunk_store")
+
+
+def memory_kb() -> dict:
+    """RSS sowie privater/geteilter Anteil (Linux, /proc/self/smaps_rollup)."""
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"):
+                    out[key] = int(rest.split()[0])
+    except FileNotFoundError:
+        import resource
+        out["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return out
+
+
+def _write(directory: Path, n: int) -> None:
+    records = []
+    writer = ChunkStoreWriter(directory)
+    for i in range(n):
+        rec = {"id": i, "source": f"Dokument_{i // 20:05d}.md", "chunk_id": i % 20,
+               "title": "Auszahlungsdauer", "text": make_markdown(i, n_sections=2)}
+        records.append(rec)
+        writer.add(rec)
+    writer.close()
+    (directory / "mapping.json").write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _measure(fmt: str, directory: str, n: int, queue) -> None:
+    directory = Path(directory)
+    before = memory_kb()
+    t0 = time.perf_counter()
+    if fmt == "mapping.json":
+        mapping = json.loads((directory / "mapping.json").read_text(encoding="utf-8"))
+        get = lambda i: mapping[i]["text"]
+    else:
+        store = ChunkStore.open(directory)
+        get = lambda i: store.get(i)["text"]
+    load_s = time.perf_counter() - t0
+
+    ids = np.random.default_rng(0).integers(0, n, 10000)
+    t0 = time.perf_counter()
+    for i in ids:
+        get(int(i))
+    lookup_us = 1e6 * (time.perf_counter() - t0) / len(ids)
+    after = memory_kb()
+    queue.put({
+        "format": fmt,
+        "load_s": load_s,
+        "lookup_us": lookup_us,
+        "rss_mb": (after.get("Rss", 0) - before.get("Rss", 0)) / 1024,
+        "anon_mb": (after.get("Private_Dirty", 0) - before.get("Private_Dirty", 0)) / 1024,
+    })
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=200000)
+    args = ap.parse_args()
+
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write(Path(tmp), args.chunks)
+        os.sync()  # frisch geschriebene Seiten gelten sonst als "dirty" und verfälschen die Messung
+        sizes = {p.name: p.stat().st_size / 1e6 for p in Path(tmp).iterdir()}
+        print("Dateigrößen (MB): " + ", ".join(f"{k}={v:.1f}" for k, v in sorted(sizes.items())))
+        print(f"{'format':<14} {'load s':>8} {'lookup µs':>10} {'RSS MB':>8} {'anonym MB':>10}")
+        for fmt in FORMATS:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(fmt, tmp, args.chunks, queue))
+            proc.start()
+            r = queue.get()
+            proc.join()
+            print(f"{r['format']:<14} {r['load_s']:>8.3f} {r['lookup_us']:>10.1f} {r['rss_mb']:>8.1f} {r['anon_mb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
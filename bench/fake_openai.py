@@ -0,0 +1,78 @@
+# bench/fake_openai.py
+"""
+Lokaler Stub, der die OpenAI-Chat-Completions-API spricht (mit und ohne Streaming).
+Für Tests und Lastmessungen ohne echten API-Key und ohne Kosten.
+
+    python -m bench.fake_openai --port 8001 --first-token-ms 300 --token-ms 20
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub ./run.sh
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = ("Nach der Bewilligung erfolgt die Auszahlung in der Regel innerhalb von 2–3 Bankarbeitstagen. "
+          "Bei externen Kontoverbindungen kann es zu zusätzlichen 24–48 Stunden Laufzeit kommen.")
+
+
+def create_app(first_token_ms: float = 300.0, token_ms: float = 20.0, answer: str = ANSWER) -> FastAPI:
+    """Stub-App; Latenz = first_token_ms + Anzahl Token * token_ms."""
+    app = FastAPI(title="Fake OpenAI")
+    app.state.calls = 0
+
+    def _tokens():
+        words = answer.split(" ")
+        return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", "stub")
+        tokens = _tokens()
+
+        if not body.get("stream"):
+            await asyncio.sleep((first_token_ms + token_ms * len(tokens)) / 1000)
+            return JSONResponse({
+                "id": cid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+
+        async def events():
+            await asyncio.sleep(first_token_ms / 1000)
+            for i, tok in enumerate(tokens):
+                delta = {"role": "assistant", "content": tok} if i == 0 else {"content": tok}
+                chunk = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(token_ms / 1000)
+            done = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--first-token-ms", type=float, default=300.0)
+    ap.add_argument("--token-ms", type=float, default=20.0)
+    args = ap.parse_args()
+    uvicorn.run(create_app(args.first_token_ms, args.token_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
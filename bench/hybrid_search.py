@@ -0,0 +1,107 @@
+# bench/hybrid_search.py
+"""
+Benchmark: BM25-Hybrid-Suche gegenüber reiner FAISS-Suche.
+
+Misst je Korpusgröße Aufbau-, Speicher- und Ladezeit des BM25-Index, die
+zusätzliche Latenz pro Anfrage (retriever.search mit RAG_HYBRID_FUSION=off vs.
+rrf/weighted) und Treffer@k für Anfragen nach exakten Begriffen (IBAN aus einem
+Chunk) – die findet eine rein semantische Suche praktisch nie.
+
+    python -m bench.hybrid_search --sizes 1000 10000 100000 --queries 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app import index_factory, retriever
+from app.bm25 import BM25Index
+from app.chunk_store import ChunkStore
+from bench.synthetic import HashEncoder, make_markdown
+
+SOURCES = [f"Dokument_{s:03d}.md" for s in range(20)]
+
+
+def _records(n: int) -> List[Dict]:
+    records = []
+    for i in range(n):
+        lines = make_markdown(i, n_sections=1).split("\n")
+        records.append({"id": i, "source": SOURCES[i % len(SOURCES)], "chunk_id": i // len(SOURCES),
+                        "title": lines[2].lstrip("# "), "text": f"{lines[2].lstrip('# ')}\n{lines[3]}"})
+    return records
+
+
+def _install(records: List[Dict], lexical: BM25Index) -> None:
+    encoder = HashEncoder()
+    x = encoder.encode([r["text"] for r in records])
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    index = index_factory.with_ids(index_factory.build_index(x.shape[1], len(records), "flat"))
+    index_factory.train_and_add(index, x, np.arange(len(records)))
+    retriever._model = encoder
+    retriever._current = retriever.IndexGeneration(index, ChunkStore.from_records(records), 0, lexical)
+
+
+def _run(queries: List[str], targets: List[int], fusion: str, k: int) -> Dict:
+    os.environ["RAG_HYBRID_FUSION"] = fusion
+    times, found = [], 0
+    for q, target in zip(queries, targets):
+        t0 = time.perf_counter()
+        hits = retriever.search(q, allowed_sources=SOURCES[: len(SOURCES) // 2], k=k)
+        times.append(time.perf_counter() - t0)
+        found += any(h["source"] == SOURCES[target % len(SOURCES)] and h["chunk_id"] == target // len(SOURCES)
+                     for h in hits)
+    ms = lambda p: round(float(np.percentile(times, p)) * 1000, 3)
+    return {"fusion": fusion, "p50_ms": ms(50), "p95_ms": ms(95), "hit_rate": round(found / len(queries), 3)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=3)
+    args = ap.parse_args()
+
+    for n in args.sizes:
+        records = _records(n)
+        t0 = time.perf_counter()
+        lexical = BM25Index.build(records)
+        build_s = time.perf_counter() - t0
+
+        tmp = Path(tempfile.mkdtemp(prefix="rag-bm25-"))
+        try:
+            t0 = time.perf_counter()
+            lexical.save(tmp)
+            save_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            lexical = BM25Index.open(tmp)
+            open_s = time.perf_counter() - t0
+            size_mb = sum(f.stat().st_size for f in tmp.iterdir()) / 1e6
+
+            _install(records, lexical)
+            rng = np.random.default_rng(0)
+            # nur Chunks aus freigegebenen Quellen (erste Hälfte) als Ziel
+            targets = [int(t) for t in rng.integers(0, n, size=args.queries * 2)
+                       if t % len(SOURCES) < len(SOURCES) // 2][: args.queries]
+            queries = [f"Welcher Vorgang hat das Konto {records[t]['text'].split('Konto ')[1][:27]}?" for t in targets]
+
+            print(f"\n{n} Chunks: BM25 {len(lexical.terms)} Terme, {len(lexical.docs)} Postings, {size_mb:.1f} MB; "
+                  f"Aufbau {build_s:.2f} s, Speichern {save_s * 1000:.0f} ms, Laden {open_s * 1000:.1f} ms")
+            print(f"{'Fusion':>9} {'p50':>9} {'p95':>9} {'Treffer@' + str(args.k):>11}")
+            base = None
+            for fusion in ("off", "rrf", "weighted"):
+                r = _run(queries, targets, fusion, args.k)
+                base = base or r
+                extra = "" if fusion == "off" else f"  (+{r['p50_ms'] - base['p50_ms']:.3f} ms p50)"
+                print(f"{r['fusion']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['hit_rate']:>11}{extra}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.environ.pop("RAG_HYBRID_FUSION", None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/ingest_throughput.py
+"""
+Benchmark: Durchsatz und Speicher des streamenden Ingests.
+
+Erzeugt einen synthetischen Korpus aus Markdown-Dateien (Standard 100.000) in einem
+temporären Verzeichnis und indexiert ihn mit retriever.ingest_docs. Das
+Embedding-Modell wird durch HashEncoder ersetzt, gemessen wird also die Pipeline
+(Lesen, Chunking, PII, Batching, Index, Chunk-Speicher, BM25). Ausgabe je
+Konfiguration: Chunks/s, MB/s und Speicherzuwachs (Spitze RSS über dem Stand vor dem Ingest).
+
+    python -m bench.ingest_throughput --files 100000 --workers 0 4 --memory-mb 128 512
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from app import ingest, ner, retriever
+from bench.synthetic import HashEncoder, make_markdown
+
+
+def _write_corpus(directory: Path, n: int) -> None:
+    directory.mkdir(parents=True)
+    for i in range(n):
+        (directory / f"Vorgang_{i:06d}.md").write_text(make_markdown(i), encoding="utf-8")
+
+
+def _use_dirs(base: Path) -> None:
+    retriever.DOCS_DIR = base / "docs"
+    retriever.INDEX_DIR = base / "index"
+    for name in ("INDEX_FILE", "MAPPING_FILE", "MANIFEST_FILE", "EMBED_CACHE_FILE", "SENTENCE_CACHE_FILE", "GENERATION_FILE"):
+        setattr(retriever, name, retriever.INDEX_DIR / getattr(retriever, name).name)
+
+
+def _run(base: Path, workers: int, memory_mb: int, index_type: str) -> dict:
+    """Ein Ingest in einem frischen Prozess, damit die RSS-Spitze je Konfiguration gilt."""
+    os.environ["RAG_INGEST_WORKERS"] = str(workers)
+    os.environ["RAG_INGEST_MEMORY_MB"] = str(memory_mb)
+    shutil.rmtree(base / "index", ignore_errors=True)
+    before = ingest.peak_rss_mb()
+    summary = retriever.ingest_docs(index_type)
+    summary["rss_growth_mb"] = round(summary["peak_rss_mb"] - before, 1)
+    return summary
+
+
+def _child(base: str, workers: int, memory_mb: int, index_type: str, no_ner: bool, queue) -> None:
+    _use_dirs(Path(base))
+    retriever._model = HashEncoder()
+    if no_ner:
+        ner._nlp, ner._loaded = None, True  # nur Regex-PII, spaCy wäre bei 100k Dateien der Engpass
+    queue.put(_run(Path(base), workers, memory_mb, index_type))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--files", type=int, default=100000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    ap.add_argument("--memory-mb", type=int, nargs="+", default=[512])
+    ap.add_argument("--index-type", default="flat")
+    ap.add_argument("--ner", action="store_true", help="spaCy-NER mitmessen (sonst nur Regex-PII)")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="rag-ingest-"))
+    try:
+        _write_corpus(base / "docs", args.files)
+        print(f"{args.files} Dateien unter {base / 'docs'}")
+        print(f"{'Worker':>7} {'Budget':>8} {'Chunks':>8} {'Sek.':>8} {'Chunks/s':>10} {'MB/s':>7} {'RSS+ MB':>8}")
+        # eigener Prozess je Konfiguration (RSS-Spitze); fork wie der Ingest-Pool, damit nicht
+        # der Interpreterstart der Pool-Prozesse gemessen wird
+        ctx = ingest.pool_context()
+        for workers in args.workers:
+            for memory_mb in args.memory_mb:
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_child, args=(str(base), workers, memory_mb, args.index_type,
+                                                        not args.ner, queue))
+                proc.start()
+                r = queue.get()
+                proc.join()
+                print(f"{workers:>7} {memory_mb:>6}MB {r['chunks']:>8} {r['seconds']:>8} "
+                      f"{r['chunks_per_s']:>10} {r['mb_per_s']:>7} {r['rss_growth_mb']:>8}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
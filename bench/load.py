@@ -0,0 +1,161 @@
+# bench/load.py
+"""
+Lastgenerator: /api/query und /api/query_stream bei fester Parallelität gegen einen
+OpenAI-Stub im selben Prozess (bench.fake_openai, Latenz einstellbar).
+
+Server und Stub laufen mit uvicorn in Hintergrund-Threads auf freien Ports; die
+Last kommt über echtes HTTP (httpx), damit beim Streaming die Zeit bis zum ersten
+Token (TTFT) messbar ist. Korpus synthetisch wie in bench.stream_latency, Embedding
+per HashEncoder. Jede Anfrage hat eine eigene Frage (kein Single-Flight-Effekt).
+
+Je Endpunkt und Parallelität: Anfragen/s, p50/p95/p99 (bis zum letzten Byte), TTFT
+beim Streaming, Fehler (z. B. 429/503 der LLM-Warteschlange), RSS des Prozesses.
+
+    python -m bench.load --concurrency 1 8 32 --requests 200 --first-token-ms 300 --token-ms 20 \\
+        --out bench/results/load.json
+    python -m bench.load --concurrency 1 8 32 --requests 200 --compare bench/results/load.json
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from bench import results as res
+from bench.fake_openai import create_app
+
+QUESTIONS = ["Wie lange dauert die Auszahlung?", "Welche Unterlagen müssen vorliegen?",
+             "Wer erhält eine Bestätigung?", "An wen wende ich mich bei Rückfragen?"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+    """uvicorn in einem Daemon-Thread starten und warten, bis er Verbindungen annimmt."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           limit_concurrency=None))
+    threading.Thread(target=server.run, name=f"uvicorn-{port}", daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server auf Port {port} startet nicht.")
+        time.sleep(0.05)
+    return server
+
+
+async def _one(client: httpx.AsyncClient, endpoint: str, i: int) -> Dict:
+    question = f"{QUESTIONS[i % len(QUESTIONS)]} (Vorgang {i})"
+    t0 = time.perf_counter()
+    ttft: Optional[float] = None
+    if endpoint == "query":
+        r = await client.post("/api/query", json={"question": question, "user_role": "Sachbearbeiter"})
+        ok = r.status_code == 200
+        status = r.status_code
+    else:
+        params = {"question": question, "user_role": "Sachbearbeiter", "mode": "pseudonymize", "pace": 0}
+        async with client.stream("GET", "/api/query_stream", params=params) as r:
+            status = r.status_code
+            body = []
+            async for chunk in r.aiter_text():
+                if ttft is None and "event: token" in chunk:
+                    ttft = time.perf_counter() - t0
+                body.append(chunk)
+        ok = status == 200 and "event: final" in "".join(body)
+    return {"ok": ok, "status": status, "latency": time.perf_counter() - t0, "ttft": ttft}
+
+
+async def _run(base_url: str, endpoint: str, concurrency: int, n: int, offset: int) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(n):
+            queue.put_nowait(offset + i)
+        samples: List[Dict] = []
+
+        async def worker():
+            while not queue.empty():
+                samples.append(await _one(client, endpoint, queue.get_nowait()))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    ok = [s for s in samples if s["ok"]]
+    row = {"name": endpoint, "concurrency": concurrency, "ops": n, "rps": round(len(ok) / elapsed, 2),
+           **res.latency_stats([s["latency"] for s in ok]), "errors": n - len(ok), "rss_mb": res.rss_mb()}
+    ttft = [s["ttft"] for s in ok if s["ttft"] is not None]
+    if ttft:
+        stats = res.latency_stats(ttft)
+        row.update({"ttft_p50_ms": stats["p50_ms"], "ttft_p95_ms": stats["p95_ms"]})
+    statuses = sorted({s["status"] for s in samples if not s["ok"]})
+    if statuses:
+        row["error_status"] = ",".join(map(str, statuses))
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--endpoints", nargs="+", default=["query", "query_stream"], choices=["query", "query_stream"])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--requests", type=int, default=200, help="Anfragen je Endpunkt und Parallelität")
+    ap.add_argument("--chunks", type=int, default=10000)
+    ap.add_argument("--first-token-ms", type=float, default=300.0)
+    ap.add_argument("--token-ms", type=float, default=20.0)
+    ap.add_argument("--out", help="Ergebnisse als JSON speichern")
+    ap.add_argument("--compare", help="früheres Ergebnis-JSON zum Vergleich")
+    ap.add_argument("--threshold", type=float, default=0.1, help="Schwelle für Verschlechterungen (0.1 = 10 %%)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    # vor dem Import des Servers: Stub als LLM, kein Index-Watcher (würde den Korpus austauschen)
+    stub_port = _free_port()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["RAG_INDEX_POLL_S"] = "0"
+    os.environ.pop("RAG_WARMUP", None)
+    from app import main as server
+    from bench.stream_latency import _install_corpus
+
+    _install_corpus(args.chunks)
+    server.LOG_DIR = tempfile.mkdtemp(prefix="rag-load-")  # Audit-Log nicht ins Projekt schreiben
+    _serve(create_app(args.first_token_ms, args.token_ms), stub_port)
+    port = _free_port()
+    _serve(server.app, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    asyncio.run(_run(base_url, "query_stream", 2, 4, 10 ** 6))  # Aufwärmen (spaCy, FAISS, Verbindungen)
+    print(f"LLM-Stub: erstes Token {args.first_token_ms:.0f} ms, je Token {args.token_ms:.0f} ms; {args.chunks} Chunks")
+    print(f"{'Endpunkt':>13} {'parallel':>8} {'Anfr./s':>8} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'TTFT p50':>9} {'Fehler':>7} {'RSS MB':>7}")
+    rows: List[Dict] = []
+    offset = 0
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            row = asyncio.run(_run(base_url, endpoint, concurrency, args.requests, offset))
+            offset += args.requests
+            rows.append(row)
+            print(f"{endpoint:>13} {concurrency:>8} {row['rps']:>8} {row.get('p50_ms', '-'):>9} "
+                  f"{row.get('p95_ms', '-'):>9} {row.get('p99_ms', '-'):>9} {row.get('ttft_p50_ms', '-'):>9} "
+                  f"{row['errors']:>7} {row['rss_mb']:>7}")
+
+    if args.out:
+        res.save(args.out, "load", rows, vars(args))
+    if args.compare:
+        regressions = res.compare(args.compare, rows, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
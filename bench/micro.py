@@ -0,0 +1,142 @@
+# bench/micro.py
+"""
+Micro-Benchmarks der Pipeline-Bausteine auf synthetischen deutschen Kreditdokumenten
+(bench.synthetic.make_markdown: Namen, IBANs, Adressen, Banken), je Korpusgröße:
+
+  read_markdown_chunks            Chunking eines Dokuments
+  ingest_docs                     kompletter Ingest (HashEncoder statt Modell)
+  search                          retriever.search (Hybrid, Rolle mit allen Quellen)
+  context_assemble                Kontext-Auswahl (Dubletten + Token-Budget) für die Treffer
+  pseudonymize                    PII-Erkennung + Pseudonyme für einen Chunk
+  mask_pii                        Maskierung einer Antwort nach dem LLM
+  replace_pseudonyms_with_masks   Pseudonyme -> Anzeige-Masken
+
+Ausgabe: Durchsatz (per_s), p50/p95/p99, RSS; mit --out als JSON, mit --compare
+gegen einen früheren Lauf (Exit-Code 1 bei Verschlechterung, wenn --fail-on-regression).
+spaCy wird mitgemessen, wenn das Modell installiert ist (--no-ner: nur Regex-PII).
+
+    python -m bench.micro --sizes 1000 10000 --out bench/results/micro.json
+    python -m bench.micro --sizes 1000 10000 --compare bench/results/micro.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app import context, ingest, ner, retriever
+from app.pii_display import replace_pseudonyms_with_masks
+from app.pii_masking import mask_pii
+from app.pii_pseudo import PseudonymTable, pseudonymize_many
+from bench import results as res
+from bench.ingest_throughput import _use_dirs
+from bench.synthetic import HashEncoder, make_markdown
+
+QUESTIONS = ["Wie lange dauert die Auszahlung?", "Welche Unterlagen müssen vorliegen?",
+             "Wer erhält eine Bestätigung?", "An wen wende ich mich bei Rückfragen?",
+             "Auf welches Konto wird ausgezahlt?"]
+
+
+def _measure(name: str, size: int, fn: Callable[[int], None], n: int, warmup: int = 3) -> Dict:
+    for i in range(min(warmup, n)):
+        fn(i)
+    samples = []
+    t_all = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_all
+    return {"name": name, "size": size, "ops": n, "per_s": round(n / elapsed, 1),
+            **res.latency_stats(samples), "rss_mb": res.rss_mb()}
+
+
+def _print(row: Dict) -> None:
+    print(f"{row['name']:>30} {row['size']:>8} {row['per_s']:>12} {row.get('p50_ms', ''):>9} "
+          f"{row.get('p95_ms', ''):>9} {row.get('p99_ms', ''):>9} {row['rss_mb']:>8}")
+
+
+def _run_size(base: Path, size: int, ops: int) -> List[Dict]:
+    """size = Anzahl Chunks (4 Abschnitte je Dokument)."""
+    n_docs = max(1, size // 4)
+    docs = base / "docs"
+    shutil.rmtree(base, ignore_errors=True)
+    docs.mkdir(parents=True)
+    texts = [make_markdown(i) for i in range(n_docs)]
+    for i, text in enumerate(texts):
+        (docs / f"Vorgang_{i:06d}.md").write_text(text, encoding="utf-8")
+    _use_dirs(base)
+    rows: List[Dict] = []
+
+    rows.append(_measure("read_markdown_chunks", size, lambda i: ingest.read_markdown_chunks(texts[i % n_docs]),
+                         max(ops, 1000)))
+
+    # Ingest: ein Lauf je Größe (Durchsatz = Chunks/s)
+    t0 = time.perf_counter()
+    summary = retriever.ingest_docs("flat")
+    elapsed = time.perf_counter() - t0
+    rows.append({"name": "ingest_docs", "size": size, "ops": 1, "per_s": round(summary["chunks"] / elapsed, 1),
+                 "total_ms": round(elapsed * 1000, 1), "rss_mb": res.rss_mb()})
+
+    retriever._current = None  # frisch gebauten Stand laden
+    gen = retriever.current_generation()
+    allowed = list(gen.chunks.sources)
+    queries = [f"{QUESTIONS[i % len(QUESTIONS)]} Vorgang {i}" for i in range(ops)]
+    rows.append(_measure("search", size, lambda i: retriever.search(queries[i % ops], allowed, k=3), ops))
+
+    hit_lists = [retriever.search(q, allowed, k=3) for q in queries[:50]]
+    rows.append(_measure("context_assemble", size, lambda i: context.assemble(hit_lists[i % len(hit_lists)]), ops))
+
+    chunks = [gen.chunks.at(i)["text"] for i in range(min(len(gen.chunks), 500))]
+    answers = [f"Die Auszahlung an den Kunden erfolgt laut Abschnitt: {c}" for c in chunks]
+    pseudo = []
+    for c in chunks[:50]:
+        table = PseudonymTable()
+        pseudo.append((pseudonymize_many([c], None, table)[0][0], table))
+    rows.append(_measure("pseudonymize", size, lambda i: pseudonymize_many([chunks[i % len(chunks)]]), ops))
+    rows.append(_measure("mask_pii", size, lambda i: mask_pii(answers[i % len(answers)]), ops))
+    rows.append(_measure("replace_pseudonyms_with_masks", size,
+                         lambda i: replace_pseudonyms_with_masks(*pseudo[i % len(pseudo)]), max(ops, 1000)))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Korpusgrößen in Chunks")
+    ap.add_argument("--ops", type=int, default=200, help="Aufrufe je Micro-Benchmark")
+    ap.add_argument("--no-ner", action="store_true", help="spaCy auslassen (nur Regex-PII)")
+    ap.add_argument("--out", help="Ergebnisse als JSON speichern")
+    ap.add_argument("--compare", help="früheres Ergebnis-JSON zum Vergleich")
+    ap.add_argument("--threshold", type=float, default=0.1, help="Schwelle für Verschlechterungen (0.1 = 10 %%)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    os.environ.setdefault("RAG_INGEST_WORKERS", "0")  # im Prozess: vergleichbar auch auf kleinen Maschinen
+    retriever._model = HashEncoder()
+    if args.no_ner:
+        ner._nlp, ner._loaded = None, True
+
+    base = Path(tempfile.mkdtemp(prefix="rag-micro-"))
+    rows: List[Dict] = []
+    print(f"{'Benchmark':>30} {'Chunks':>8} {'Aufrufe/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    try:
+        for size in args.sizes:
+            for row in _run_size(base, size, args.ops):
+                _print(row)
+                rows.append(row)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    if args.out:
+        res.save(args.out, "micro", rows, vars(args))
+    if args.compare:
+        regressions = res.compare(args.compare, rows, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
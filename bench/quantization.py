@@ -0,0 +1,245 @@
+# bench/quantization.py
+"""
+Quantisierte Vektoren und optimierte Anfrage-Encoder im Vergleich zum Ist-Stand
+(flat/float32 bzw. volles Modell).
+
+Teil 1 – Index (RAG_INDEX_TYPE): flat, fp16, sq8, binary auf synthetischen, geclusterten
+Vektoren; sq8/binary einmal ohne (RAG_RESCORE_FACTOR=1) und einmal mit Neubewertung über
+die float32-Vektoren im Embedding-Cache. Gemessen über retriever.search_many (nur dicht,
+RAG_HYBRID_FUSION=off): Indexgröße, Bytes je Vektor, p50/p95 je Anfrage, Recall@k
+gegen exakte Suche (flat).
+
+Teil 2 – Anfrage-Encoder (RAG_QUERY_ENCODER): default, int8, onnx, onnx_int8. Gemessen:
+Modellgröße, Encode-Latenz einer einzelnen Frage, Kosinus zum vollen Modell und Recall@k
+der Anfragen gegen einen mit dem vollen Modell eingebetteten Korpus. Ist das Modell nicht
+lokal im Cache, wird eine MiniLM-L6-Architektur mit Zufallsgewichten verwendet (Latenz
+und Größe stimmen, der Recall ist dann nur ein Anhaltspunkt). onnx* braucht
+onnxruntime (+ onnx für onnx_int8), sonst wird die Zeile übersprungen.
+
+    python -m bench.quantization --chunks 100000 --out bench/results/quantization.json
+    python -m bench.quantization --chunks 100000 --compare bench/results/quantization.json
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from app import index_factory, retriever
+from app.chunk_store import ChunkStore
+from app.embedding_cache import EmbeddingCache, text_hash
+from bench import results as res
+from bench.ingest_throughput import _use_dirs
+from bench.synthetic import make_markdown, make_vectors
+
+QUESTIONS = ["Wie lange dauert die Auszahlung?", "Welche Unterlagen müssen vorliegen?",
+             "Wer erhält eine Bestätigung?", "An wen wende ich mich bei Rückfragen?",
+             "Auf welches Konto wird ausgezahlt?"]
+
+
+class _LookupEncoder:
+    """Liefert für die Benchmark-Fragen die vorab erzeugten Anfragevektoren."""
+
+    def __init__(self, vectors: Dict[str, np.ndarray]):
+        self.vectors = vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return len(next(iter(self.vectors.values())))
+
+    def encode(self, texts, convert_to_numpy: bool = True, **_kwargs) -> np.ndarray:
+        return np.stack([self.vectors[t] for t in texts])
+
+
+def _recall(found: List[list], truth: List[list]) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return round(hits / max(1, sum(len(t) for t in truth)), 4)
+
+
+def _index_rows(base: Path, n: int, n_queries: int, k: int, rescore_factor: int) -> List[Dict]:
+    _use_dirs(base)
+    x = make_vectors(n)
+    records = [{"id": i, "source": f"Vorgang_{i % 100:03d}.md", "chunk_id": i // 100,
+                "title": "Abschnitt", "text": f"Chunk {i}"} for i in range(n)]
+    for r in records:
+        r["hash"] = text_hash(r["text"])
+    chunks = ChunkStore.from_records(records)
+    cache = EmbeddingCache(retriever.EMBED_CACHE_FILE)
+    # im Cache liegen die Embeddings wie beim Ingest: float32, nicht normalisiert
+    scale = np.random.default_rng(2).uniform(0.5, 2.0, size=(n, 1)).astype("float32")
+    cache.put_many(retriever.MODEL_NAME, [(r["hash"], v) for r, v in zip(records, x * scale)])
+    cache.close()
+
+    # Anfragen nahe an Korpusvektoren (Kosinus ~0.7 zum nächsten Chunk), wie bei echten Fragen
+    rng = np.random.default_rng(1)
+    q = x[rng.integers(0, n, size=n_queries)] + 0.05 * rng.standard_normal((n_queries, x.shape[1])).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    texts = [f"Frage {i}" for i in range(n_queries)]
+    retriever._model = _LookupEncoder(dict(zip(texts, q)))
+    allowed = [sorted({r["source"] for r in records})] * n_queries
+
+    def run(index) -> Dict:  # Treffer über den (eindeutigen) Chunk-Text
+        retriever._current = retriever.IndexGeneration(index, chunks, generation=0)
+        found = [[h["text"] for h in hits] for hits in retriever.search_many(texts, allowed, k=k)]
+        samples = []
+        for i in range(n_queries):
+            t0 = time.perf_counter()
+            retriever.search_many([texts[i]], allowed[:1], k=k)
+            samples.append(time.perf_counter() - t0)
+        return {"found": found, **res.latency_stats(samples)}
+
+    rows: List[Dict] = []
+    truth = None
+    for index_type in ("flat", "fp16", "sq8", "binary"):
+        index = index_factory.with_ids(index_factory.build_index(x.shape[1], n, index_type))
+        index_factory.train_and_add(index, x, np.arange(n))
+        path = base / f"{index_type}.index"
+        index_factory.write_index(index, str(path))
+        size = path.stat().st_size
+        quantized = index_type in index_factory.RESCORED_TYPES
+        for factor in (rescore_factor, 1) if quantized else (1,):
+            if factor:
+                os.environ["RAG_RESCORE_FACTOR"] = str(factor)
+            else:
+                os.environ.pop("RAG_RESCORE_FACTOR", None)  # Standard je Typ
+            measured = run(index)
+            if truth is None:
+                truth = measured["found"]
+            rows.append({"name": "index", "index_type": index_type, "size": n,
+                         "rescore_factor": index_factory.rescore_factor(index),
+                         "index_mb": round(size / 2 ** 20, 2), "vector_bytes": round(size / n, 1),
+                         "p50_ms": measured["p50_ms"], "p95_ms": measured["p95_ms"],
+                         "k": k, "recall": _recall(measured["found"], truth)})
+    return rows
+
+
+def _load_model(base: Path):
+    """Lokales Modell, sonst MiniLM-L6-Architektur mit Zufallsgewichten."""
+    from sentence_transformers import SentenceTransformer, models
+
+    try:
+        return SentenceTransformer(retriever.MODEL_NAME, local_files_only=True), retriever.MODEL_NAME
+    except Exception as e:  # nicht im Cache, kein Netz
+        print(f"[WARN] {retriever.MODEL_NAME} nicht lokal verfügbar ({type(e).__name__}) – "
+              f"Zufallsgewichte mit MiniLM-L6-Architektur.")
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    torch.manual_seed(0)
+    words = {w.strip(".,:;()").lower() for i in range(200) for w in make_markdown(i).split()}
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(w for w in words if w)
+    directory = base / "minilm-random"
+    directory.mkdir(parents=True)
+    (directory / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    BertTokenizerFast(vocab_file=str(directory / "vocab.txt")).save_pretrained(str(directory))
+    config = BertConfig(vocab_size=len(vocab), hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                        intermediate_size=1536, max_position_embeddings=512)
+    BertModel(config).save_pretrained(str(directory))
+    transformer = models.Transformer(str(directory), max_seq_length=256)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), pooling_mode="mean")
+    return SentenceTransformer(modules=[transformer, pooling], device="cpu"), "minilm-random"
+
+
+def _model_mb(encoder) -> float:
+    path = getattr(encoder, "path", None)
+    if path is not None:
+        return round(Path(path).stat().st_size / 2 ** 20, 1)
+    import torch
+    buf = io.BytesIO()
+    torch.save(encoder.state_dict(), buf)
+    return round(buf.tell() / 2 ** 20, 1)
+
+
+def _normalized(encoder, texts: List[str]) -> np.ndarray:
+    x = np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype="float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def _encoder_rows(base: Path, n_corpus: int, n_queries: int, k: int) -> List[Dict]:
+    from app import query_encoder
+
+    model, name = _load_model(base)
+    model.eval()
+    corpus = [line for i in range(n_corpus) for line in make_markdown(i, n_sections=1).split("\n")[3:4]]
+    queries = [f"{QUESTIONS[i % len(QUESTIONS)]} Vorgang {i}" for i in range(n_queries)]
+    corpus_emb = _normalized(model, corpus)
+    reference = _normalized(model, queries)
+    truth = [list(r) for r in np.argsort(-(reference @ corpus_emb.T), axis=1)[:, :k]]
+
+    rows: List[Dict] = []
+    for mode in ("default",) + query_encoder.MODES:
+        encoder = model if mode == "default" else query_encoder.load(mode, model, base / "query_encoder", name)
+        if mode != "default" and encoder is model:
+            continue  # Paket fehlt, Warnung kam von query_encoder.load
+        for q in queries[:3]:  # Aufwärmen (ONNX-Session, Quantisierungs-Kernel)
+            encoder.encode([q], convert_to_numpy=True)
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            encoder.encode([q], convert_to_numpy=True)
+            samples.append(time.perf_counter() - t0)
+        emb = _normalized(encoder, queries)
+        found = [list(r) for r in np.argsort(-(emb @ corpus_emb.T), axis=1)[:, :k]]
+        stats = res.latency_stats(samples)
+        rows.append({"name": "query_encoder", "mode": mode, "model": name, "model_mb": _model_mb(encoder),
+                     "p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"],
+                     "default_cosine": round(float((emb * reference).sum(axis=1).mean()), 4),
+                     "k": k, "recall": _recall(found, truth)})
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=100000, help="Vektoren im Index (Teil 1)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--corpus", type=int, default=2000, help="Chunks für den Encoder-Recall (Teil 2)")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--rescore-factor", type=int, default=0,
+                    help="RAG_RESCORE_FACTOR für sq8/binary (0 = Standard je Typ: 4 bzw. 32)")
+    ap.add_argument("--skip-index", action="store_true")
+    ap.add_argument("--skip-encoder", action="store_true")
+    ap.add_argument("--out", help="Ergebnisse als JSON speichern")
+    ap.add_argument("--compare", help="früheres Ergebnis-JSON zum Vergleich")
+    ap.add_argument("--threshold", type=float, default=0.1, help="Schwelle für Verschlechterungen (0.1 = 10 %%)")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    os.environ["RAG_HYBRID_FUSION"] = "off"  # nur die dichte Suche bewerten
+    os.environ["RAG_QUERY_ENCODER"] = "default"
+    base = Path(tempfile.mkdtemp(prefix="rag-quant-"))
+    rows: List[Dict] = []
+    recall = f"Recall@{args.k}"
+    try:
+        if not args.skip_index:
+            print(f"{'Index':>8} {'Faktor':>7} {'MB':>8} {'B/Vektor':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                  f"{recall:>12}   ({args.chunks} Vektoren)")
+            for row in _index_rows(base, args.chunks, args.queries, args.k, args.rescore_factor):
+                rows.append(row)
+                print(f"{row['index_type']:>8} {row['rescore_factor']:>7} {row['index_mb']:>8} "
+                      f"{row['vector_bytes']:>9} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['recall']:>12}")
+        if not args.skip_encoder:
+            print(f"\n{'Encoder':>10} {'MB':>7} {'p50 ms':>8} {'p95 ms':>8} {'Kosinus':>8} {recall:>12}")
+            for row in _encoder_rows(base, args.corpus, args.queries, args.k):
+                rows.append(row)
+                print(f"{row['mode']:>10} {row['model_mb']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                      f"{row['default_cosine']:>8} {row['recall']:>12}")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    if args.out:
+        res.save(args.out, "quantization", rows, vars(args))
+    if args.compare:
+        regressions = res.compare(args.compare, rows, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench/results.py
+"""
+Gemeinsame Auswertung für bench.micro und bench.load: Perzentile, RSS, Umgebung,
+Ergebnisse als JSON speichern und mit einem früheren Lauf vergleichen.
+
+JSON-Aufbau: {"suite": ..., "meta": {Zeit, Git-Commit, Python, CPUs, RAG_*-Variablen},
+"results": [{"name": ..., <Parameter>, <Kennzahlen>}]}. Zwei Läufe werden über
+name + Parameter zugeordnet; verglichen werden Durchsatz und Recall (höher = besser)
+sowie Latenzen/Speicher (niedriger = besser); max/mean/p99 schwanken bei wenigen
+Aufrufen zu stark und werden nur gespeichert, nicht bewertet.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Kennzahlen, bei denen ein höherer Wert besser ist; alle übrigen *_ms/*_mb/*_bytes: niedriger ist besser
+HIGHER_IS_BETTER = ("per_s", "rps", "chunks_per_s", "recall", "cosine")
+METRIC_SUFFIXES = ("_ms", "_mb", "_bytes", "per_s", "rps", "recall", "cosine")
+NOT_COMPARED = ("max_ms", "mean_ms", "p99_ms")
+
+
+def latency_stats(samples_s: Sequence[float]) -> Dict[str, float]:
+    """Perzentile in Millisekunden aus Einzelmessungen in Sekunden."""
+    if not len(samples_s):
+        return {}
+    ms = np.asarray(samples_s, dtype="float64") * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3), "mean_ms": round(float(ms.mean()), 3),
+            "max_ms": round(float(ms.max()), 3)}
+
+
+def rss_mb() -> float:
+    """Aktueller Speicherverbrauch (RSS) dieses Prozesses in MB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("RAG_")},
+    }
+
+
+def save(path: str, suite: str, results: List[Dict], params: Optional[Dict] = None) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"suite": suite, "meta": {**environment(), "params": params or {}}, "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\nErgebnisse gespeichert: {path}")
+
+
+def _key(row: Dict) -> tuple:
+    return tuple(sorted((k, v) for k, v in row.items() if not k.endswith(METRIC_SUFFIXES)
+                        and isinstance(v, (str, int, float, bool)) and k not in ("ops", "errors")))
+
+
+def compare(baseline_path: str, results: List[Dict], threshold: float = 0.1) -> int:
+    """
+    Vergleicht mit einem gespeicherten Lauf und druckt Abweichungen je Kennzahl.
+    Liefert die Anzahl der Verschlechterungen über threshold (0.1 = 10 %).
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {_key(row): row for row in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nVergleich mit {baseline_path} (Schwelle {threshold:.0%}):")
+    for row in results:
+        old = baseline.get(_key(row))
+        if old is None:
+            continue
+        label = " ".join(f"{k}={v}" for k, v in _key(row))
+        for metric, new_value in row.items():
+            if (not metric.endswith(METRIC_SUFFIXES) or metric.endswith(NOT_COMPARED)
+                    or not isinstance(old.get(metric), (int, float))):
+                continue
+            old_value = old[metric]
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if worse > threshold:
+                regressions += 1
+                flag = "  <-- schlechter"
+            elif worse < -threshold:
+                flag = "  (besser)"
+            if flag:
+                print(f"  {label}: {metric} {old_value} -> {new_value} ({change:+.0%}){flag}")
+    print(f"  {regressions} Verschlechterung(en)")
+    return regressions
@@ -0,0 +1,82 @@
+# bench/stream_latency.py
+"""
+Benchmark: End-to-End-Latenz von /api/query_stream ohne LLM.
+
+Der Index ist synthetisch, das Embedding-Modell wird durch HashEncoder und der
+LLM-Aufruf durch eine sofortige Antwort ersetzt. Gemessen wird damit die
+Untergrenze der Pipeline (ABAC, Retriever, Pseudonymisierung, Maskierung,
+Audit) – einmal ohne und einmal mit Demo-Pausen (pace=1).
+
+    python -m bench.stream_latency --chunks 10000 --requests 20
+"""
+import argparse
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import index_factory, llm, retriever
+from app import main as server
+from app.chunk_store import ChunkStore
+from bench.synthetic import HashEncoder, make_markdown
+
+SOURCES = ["Auszahlung.md", "Schulung_Auszahlung.md"]
+ANSWER = "Die Auszahlung erfolgt in der Regel innerhalb von 2–3 Bankarbeitstagen. Ansprechpartner ist Anna Schneider."
+
+
+def _install_corpus(n: int) -> None:
+    records = []
+    for i in range(n):
+        section = make_markdown(i, n_sections=1).split("\n")
+        records.append({"id": i, "source": SOURCES[i % len(SOURCES)], "chunk_id": i // len(SOURCES),
+                        "title": section[2].lstrip("# "), "text": section[3]})
+    encoder = HashEncoder()
+    x = encoder.encode([r["text"] for r in records])
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    index = index_factory.with_ids(index_factory.build_index(x.shape[1], n, "flat"))
+    index_factory.train_and_add(index, x, np.arange(n))
+    retriever._model = encoder
+    retriever._current = retriever.IndexGeneration(index, ChunkStore.from_records(records), generation=0)
+
+
+async def _instant_llm(question: str, contexts: List[str]):
+    for word in ANSWER.split(" "):
+        yield word + " "
+
+
+def _measure(client: TestClient, n: int, pace: float) -> Dict:
+    totals = []
+    params = {"question": "Wie lange dauert die Auszahlung?", "user_role": "Sachbearbeiter",
+              "mode": "pseudonymize", "pace": pace}
+    for _ in range(n):
+        t0 = time.perf_counter()
+        r = client.get("/api/query_stream", params=params)
+        assert "event: final" in r.text
+        totals.append(time.perf_counter() - t0)
+    ms = lambda p: round(float(np.percentile(totals, p)) * 1000, 1)
+    return {"pace": pace, "p50_ms": ms(50), "p95_ms": ms(95), "max_ms": ms(100)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunks", type=int, default=10000)
+    ap.add_argument("--requests", type=int, default=20)
+    ap.add_argument("--paced-requests", type=int, default=3, help="Anfragen mit pace=1 (dauern je ~1,6 s)")
+    args = ap.parse_args()
+
+    _install_corpus(args.chunks)
+    llm.stream_llm = _instant_llm
+    server.LOG_DIR = tempfile.mkdtemp(prefix="rag-bench-")  # Audit-Log nicht ins Projekt schreiben
+    client = TestClient(server.app)  # ohne Lifespan: kein Index-Watcher, der den Korpus austauscht
+
+    _measure(client, 2, 0)  # Aufwärmen (spaCy, FAISS)
+    print(f"{'pace':>5} {'p50':>9} {'p95':>9} {'max':>9}  (ms, bis zum final-Event)")
+    for pace, n in ((0, args.requests), (1, args.paced_requests)):
+        r = _measure(client, n, pace)
+        print(f"{r['pace']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['max_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench/synthetic.py
+"""Synthetische Korpora für Benchmarks (ohne Embedding-Modell lauffähig)."""
+import hashlib
+from typing import Dict, List
+
+import numpy as np
+
+
+def make_vectors(n: int, dim: int = 384, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Erzeugt L2-normalisierte, geclusterte Vektoren (ähnlich wie echte Satz-Embeddings)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x.astype("float32")
+
+
+def make_queries(n: int, dim: int = 384, seed: int = 1) -> np.ndarray:
+    return make_vectors(n, dim=dim, seed=seed)
+
+
+def make_mapping(n: int, n_sources: int = 100, seed: int = 0) -> List[Dict]:
+    """Mapping-Einträge wie in ingest_docs; Chunks liegen je Quelle zusammenhängend."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.multinomial(n, np.ones(n_sources) / n_sources)
+    mapping: List[Dict] = []
+    for s, size in enumerate(sizes):
+        for i in range(size):
+            mapping.append({
+                "id": len(mapping),
+                "source": f"Dokument_{s:04d}.md",
+                "chunk_id": i,
+                "title": f"Abschnitt {i}",
+                "text": f"Synthetischer Abschnitt {i} aus Dokument {s}.",
+            })
+    return mapping
+
+
+def make_roles(mapping: List[Dict], shares: Dict[str, float]) -> Dict[str, List[str]]:
+    """Rollen mit Freigabe für einen Anteil der Quellen, z. B. {"Azubi": 0.05}."""
+    sources = sorted({m["source"] for m in mapping})
+    return {role: sources[: max(1, int(round(len(sources) * share)))] for role, share in shares.items()}
+
+
+GERMAN_SECTIONS = [
+    ("Auszahlungsdauer",
+     "Nach der Bewilligung erfolgt die Auszahlung an {name} auf das Konto {iban} "
+     "in der Regel innerhalb von {days} Bankarbeitstagen."),
+    ("Voraussetzungen",
+     "Vollständige Unterlagen liegen vor. Der Kreditvertrag für {name}, {street}, ist im System archiviert."),
+    ("Benachrichtigung",
+     "Der Kunde {name} erhält nach Ausführung eine Bestätigung der {bank}."),
+    ("Rückfragen",
+     "Bei Rückfragen wenden Sie sich an das Team Auszahlung der {bank} in {city}."),
+]
+FIRST = ["Anna", "Max", "Lena", "Paul", "Sophie", "Jonas", "Marie", "Felix"]
+LAST = ["Schneider", "Müller", "Weber", "Fischer", "Wagner", "Becker", "Hoffmann", "Koch"]
+CITIES = ["Köln", "Hamburg", "Leipzig", "Bremen", "Dresden", "Mainz"]
+BANKS = ["Stadtsparkasse", "Volksbank", "Raiffeisenbank"]
+
+
+def make_markdown(i: int, n_sections: int = 4, seed: int = 0) -> str:
+    """Erzeugt ein fiktives deutsches Kreditdokument mit PII-Mustern."""
+    rng = np.random.default_rng(seed + i)
+    city = CITIES[rng.integers(len(CITIES))]
+    fields = {
+        "name": f"{FIRST[rng.integers(len(FIRST))]} {LAST[rng.integers(len(LAST))]}",
+        "iban": "DE{:02d} {:04d} {:04d} {:04d} {:04d} {:02d}".format(*rng.integers(0, 10000, 6) % [100, 10000, 10000, 10000, 10000, 100]),
+        "street": f"Hauptstraße {rng.integers(1, 200)}, {rng.integers(10000, 99999)} {city}",
+        "days": int(rng.integers(1, 5)),
+        "bank": f"{BANKS[rng.integers(len(BANKS))]} {city}",
+        "city": city,
+    }
+    lines = [f"# Kreditauszahlung Vorgang {i}", ""]
+    for s in range(n_sections):
+        title, body = GERMAN_SECTIONS[s % len(GERMAN_SECTIONS)]
+        lines += [f"## {title}", body.format(**fields), ""]
+    return "\n".join(lines)
+
+
+class HashEncoder:
+    """Ersatz für SentenceTransformer: deterministische Pseudo-Embeddings aus dem Text-Hash."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, **_kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        out = np.zeros((1 if single else len(texts), self.dim), dtype="float32")
+        for row, text in enumerate([texts] if single else texts):
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            out[row] = np.random.default_rng(seed).standard_normal(self.dim)
+        return out[0] if single else out
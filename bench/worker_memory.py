@@ -0,0 +1,89 @@
+# bench/worker_memory.py
+"""
+Benchmark: Startzeit und Speicher von N Worker-Prozessen mit und ohne RAG_INDEX_MMAP.
+
+Jeder Worker lädt den Index wie der Server (index_factory.read_index) und
+führt einige Suchen aus. Ausgegeben werden Ladezeit sowie RSS, PSS (geteilte
+Seiten anteilig verrechnet) und anonymer Speicher, summiert über alle Worker.
+
+    python -m bench.worker_memory --vectors 200000 --workers 1 4 8
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app import index_factory
+from bench.chunk_store import memory_kb
+from bench.synthetic import make_queries, make_vectors
+
+
+def _build(path: Path, n: int, dim: int, mmap_layout: bool) -> None:
+    os.environ["RAG_INDEX_MMAP"] = "1" if mmap_layout else ""
+    index = index_factory.with_ids(index_factory.build_index(dim, n, "flat"))
+    index_factory.train_and_add(index, make_vectors(n, dim=dim), np.arange(n))
+    faiss.write_index(index, str(path))
+
+
+def _worker(path: str, use_mmap: bool, start, results) -> None:
+    os.environ["RAG_INDEX_MMAP"] = "1" if use_mmap else ""
+    faiss.omp_set_num_threads(1)
+    start.wait()  # alle Worker laden gleichzeitig, wie beim uvicorn-Start
+    t0 = time.perf_counter()
+    index = index_factory.read_index(path)
+    load_s = time.perf_counter() - t0
+    q = make_queries(20, dim=index.d)
+    index.search(q, 10, params=index_factory.search_params(index))
+    results.put({"load_s": load_s, **memory_kb()})
+    start.wait()  # Speicher messen, solange alle Worker leben
+
+
+def run(path: Path, workers: int, use_mmap: bool) -> dict:
+    ctx = mp.get_context("spawn")
+    start, results = ctx.Barrier(workers + 1), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(path), use_mmap, start, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    start.wait()
+    rows = [results.get() for _ in procs]
+    start.wait()
+    for p in procs:
+        p.join()
+    return {
+        "workers": workers,
+        "mmap": use_mmap,
+        "load_s_max": max(r["load_s"] for r in rows),
+        "rss_mb": sum(r.get("Rss", 0) for r in rows) / 1024,
+        "pss_mb": sum(r.get("Pss", 0) for r in rows) / 1024,
+        "anon_mb": sum(r.get("Private_Dirty", 0) for r in rows) / 1024,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--vectors", type=int, default=200000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=".") as tmp:
+        plain, mapped = Path(tmp) / "flat.index", Path(tmp) / "flat_mmap.index"
+        _build(plain, args.vectors, args.dim, mmap_layout=False)
+        _build(mapped, args.vectors, args.dim, mmap_layout=True)
+        os.sync()
+        print(f"Index: {args.vectors} Vektoren, {plain.stat().st_size / 1e6:.0f} MB")
+        print(f"{'workers':>7} {'mmap':>5} {'load s':>7} {'RSS MB':>9} {'PSS MB':>9} {'anonym MB':>10}")
+        for w in args.workers:
+            for use_mmap, path in ((False, plain), (True, mapped)):
+                r = run(path, w, use_mmap)
+                print(f"{r['workers']:>7} {str(r['mmap']):>5} {r['load_s_max']:>7.3f} "
+                      f"{r['rss_mb']:>9.0f} {r['pss_mb']:>9.0f} {r['anon_mb']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()